@@ -288,6 +288,9 @@ public static partial class ArgumentsHandler {
                         foreach (var id in custom.Params.GetValues(@"id") ?? new string[0]) {
                             result = await ProcessSharedById(id, custom.Params.GetValues(@"go") != null);
                         }
+                        foreach (var payload in custom.Params.GetValues(@"z") ?? new string[0]) {
+                            result = await ProcessSharedInline(payload, custom.Params.GetValues(@"go") != null);
+                        }
                         return result;
 
                     default:
@@ -1,5 +1,6 @@
 ﻿using System;
 using System.IO;
+using System.IO.Compression;
 using System.Text;
 using System.Text.RegularExpressions;
 using System.Threading.Tasks;
@@ -20,6 +21,7 @@
 using AcTools.Utils.Helpers;
 using FirstFloor.ModernUI.Helpers;
 using FirstFloor.ModernUI.Windows.Controls;
+using Newtonsoft.Json.Linq;
 using SharpCompress.Common;
 using SharpCompress.Readers;
 using WaitingDialog = FirstFloor.ModernUI.Dialogs.WaitingDialog;
@@ -113,6 +115,41 @@ public static partial class ArgumentsHandler {
             return await ProcessSharedEntry(shared, justGo);
         }
 
+        /// <summary>
+        /// Shared entry passed inline, without loading it by ID: URL-safe base64 of raw-deflated JSON with
+        /// the usual short keys (“n”, “t”, “a”, “e” as entry type name) and data as plain text in “d”. For
+        /// car setups, car and track IDs come in “t” and “k” and are stored as regular metadata.
+        /// </summary>
+        private static async Task<ArgumentHandleResult> ProcessSharedInline(string payload, bool justGo) {
+            var compressed = payload.Replace('-', '+').Replace('_', '/').FromCutBase64();
+            if (compressed == null) return ArgumentHandleResult.Failed;
+
+            JObject json;
+            using (var input = new MemoryStream(compressed))
+            using (var deflate = new DeflateStream(input, CompressionMode.Decompress))
+            using (var reader = new StreamReader(deflate, Encoding.UTF8)) {
+                json = JObject.Parse(reader.ReadToEnd());
+            }
+
+            var entryType = (SharedEntryType)Enum.Parse(typeof(SharedEntryType), json.GetStringValueOnly("e") ?? "");
+            var target = json.GetStringValueOnly("t");
+            var data = json.GetStringValueOnly("d") ?? "";
+            if (entryType == SharedEntryType.CarSetup) {
+                data = SharingHelper.SetMetadata(entryType, data, new SharedMetadata {
+                    [@"car"] = target,
+                    [@"track"] = json.GetStringValueOnly("k")
+                });
+            }
+
+            return await ProcessSharedEntry(new SharedEntry {
+                EntryType = entryType,
+                Name = json.GetStringValueOnly("n"),
+                Target = target,
+                Author = json.GetStringValueOnly("a"),
+                Data = Encoding.UTF8.GetBytes(data)
+            }, justGo);
+        }
+
         private static SharedEntryType GuessEntryType(string data) {
             data = data.TrimStart();
             if (data.StartsWith(@"{")) {
@@ -0,0 +1,78 @@
+import queue
+import threading
+import traceback
+
+
+class BackgroundWorker:
+    """Single worker thread running queued jobs in order, off the caller's thread"""
+
+    def __init__(self, name, log=None):
+        self.name = name
+        self.log = log
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a job, returns immediately"""
+        self._ensure_thread()
+        self._jobs.put((func, args, kwargs))
+
+    def pending(self):
+        """Get the number of jobs waiting to run"""
+        return self._jobs.qsize()
+
+    def stop(self, timeout=2.0):
+        """Let queued jobs finish and stop the thread"""
+        if self._thread is None:
+            return
+        self._jobs.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            func, args, kwargs = job
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                if self.log:
+                    self.log(f"Error in background job: {str(e)}", level="error")
+                    self.log(traceback.format_exc(), level="error")
+
+
+class StatusBoard:
+    """Latest status message posted from any thread, picked up at most once per frame
+
+    Posting only replaces the pending message, so a burst of updates from the
+    worker costs the render thread a single label update.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._message = None
+        self._version = 0
+        self._taken_version = 0
+
+    def post(self, message):
+        with self._lock:
+            self._message = message
+            self._version += 1
+
+    def take(self):
+        """Get the latest message if it changed since the last call, otherwise None"""
+        with self._lock:
+            if self._version == self._taken_version:
+                return None
+            self._taken_version = self._version
+            return self._message
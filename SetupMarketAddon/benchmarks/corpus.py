@@ -0,0 +1,72 @@
+"""Deterministic corpus of synthetic setup files for benchmarks
+
+Sizes range from a handful of values to large CSP-extended setups, close
+enough to real uploads to make size and parsing measurements meaningful.
+"""
+
+import os
+import random
+
+# (name, number of corner/suspension sections, number of CSP extension sections)
+CORPUS_PROFILES = [
+    ("tiny", 4, 0),
+    ("small", 16, 0),
+    ("regular", 40, 2),
+    ("large", 80, 20),
+    ("csp_huge", 120, 400)
+]
+
+CORNERS = ["LF", "RF", "LR", "RR"]
+CORNER_PARAMETERS = ["CAMBER", "PRESSURE", "TOE_OUT", "SPRING_RATE", "DAMP_BUMP", "DAMP_REBOUND",
+                     "DAMP_FAST_BUMP", "DAMP_FAST_REBOUND", "ROD_LENGTH", "BUMP_STOP_RATE", "PACKER_RANGE"]
+
+
+def generate_setup(profile, car_id="ks_test_car", track_id=None, seed=0):
+    """Generate the text of a synthetic setup for one of CORPUS_PROFILES"""
+    name, sections, extensions = next(p for p in CORPUS_PROFILES if p[0] == profile)
+    rnd = random.Random(f"{name}:{seed}")
+
+    lines = []
+    if track_id:
+        lines.append(f";CM_META:track:{track_id}")
+    for key in ["ABS", "TRACTION_CONTROL", "FUEL", "TYRES", "BRAKE_POWER_MULT", "FRONT_BIAS"]:
+        lines += [f"[{key}]", f"VALUE={rnd.randint(0, 100)}", ""]
+
+    parameters = [f"{p}_{c}" for p in CORNER_PARAMETERS for c in CORNERS]
+    for i in range(sections):
+        lines += [f"[{parameters[i % len(parameters)]}{'' if i < len(parameters) else f'_{i}'}]",
+                  f"VALUE={rnd.randint(-50, 200)}", ""]
+
+    for i in range(extensions):
+        # CSP extended setups carry long descriptive blocks with spaced out values
+        lines += [f"[__EXT_SETUP_ITEM_{i}]",
+                  f"NAME = Extended parameter {i}",
+                  f"VALUE = {rnd.uniform(-10, 10):.4f}",
+                  f"LUT = (|0={rnd.randint(0, 9)}|100={rnd.randint(0, 99)}|200={rnd.randint(0, 999)}|)",
+                  "  "]
+
+    lines += ["[CAR]", f"MODEL={car_id}", "", "[__EXT_PATCH]", "VERSION=0.2.7-preview1", ""]
+    return "\n".join(lines)
+
+
+def generate_corpus(copies=3):
+    """Get a list of (setup_id, profile, text) for every profile"""
+    corpus = []
+    setup_id = 1000
+    for profile, _, _ in CORPUS_PROFILES:
+        for seed in range(copies):
+            setup_id += 1
+            corpus.append((str(setup_id), profile,
+                           generate_setup(profile, f"ks_car_{seed}", "spa" if seed % 2 else None, seed)))
+    return corpus
+
+
+def load_corpus(directory):
+    """Load a corpus from a directory of setup_<id>.ini (or any *.ini) files"""
+    corpus = []
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.lower().endswith(".ini"):
+            with open(os.path.join(directory, file_name), "r", encoding="utf-8", errors="replace") as f:
+                setup_id = file_name[6:-4] if file_name.startswith("setup_") else file_name[:-4]
+                corpus.append((setup_id, "file", f.read()))
+    return corpus
@@ -0,0 +1,294 @@
+"""Benchmark the hot paths of main.py and generate_cm_url.py against a local stand-in server
+
+Measures URL parsing, protocol registration, download, parsing, payload encoding, end-to-end
+process_url() and batch generation, reporting throughput and latency
+percentiles. Commands go to a recording launcher instead of Content Manager
+and the setups come from stand_in_server.py, so this runs offline and on Linux.
+
+Usage: python hot_paths.py [--rounds 5] [--latency-ms 0] [--not-found-rate 0] [--failure-rate 0]
+                           [--corpus DIR] [--save-baseline] [--compare] [--baseline PATH] [--tolerance 0.25]
+
+--save-baseline writes the results to the baseline file, --compare checks
+them against it and exits with 1 if a benchmark got slower than the tolerance.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ADDON_DIR)
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+
+import requests
+from corpus import generate_corpus, load_corpus
+from stand_in_server import StandInServer
+from setup_cache import SetupCache, fetch_setup_file
+from setup_parser import parse_setup_chunks, parse_setup_text
+from setup_log import StructuredLogger
+from cm_payload import decode_compact_payload, encode_compact_command, encode_legacy_command
+from launcher import RecordingLauncher
+from registry_backend import MemoryRegistryBackend, get_protocol_values, sync_protocol_registration
+import main as addon
+import generate_cm_url
+
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baselines", "hot_paths.json")
+
+# IDs the stand-in server doesn't know, to keep the 404 path in the measurements
+MISSING_IDS = ["900001", "900002"]
+
+# Command registered for the protocol, main.py quotes the interpreter and its own path the same way
+REGISTRY_COMMAND = '"python.exe" "main.py" "%1"'
+
+# Cheap operations are repeated to get stable numbers
+URL_REPEAT = 200
+CPU_REPEAT = 10
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings, operations, errors, elapsed):
+    """Throughput and latency percentiles (in milliseconds) of a benchmark"""
+    timings = sorted(timings)
+    return {
+        'operations': operations,
+        'errors': errors,
+        'ops_per_sec': round(operations / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 4),
+        'p90_ms': round(percentile(timings, 0.90) * 1000, 4),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 4)
+    }
+
+
+def run_timed(func, items, rounds, before_round=None):
+    """Call func for every item in every round, a falsy result counts as an error"""
+    timings = []
+    errors = 0
+    elapsed = 0.0
+    for _ in range(rounds):
+        if before_round:
+            before_round()
+        round_started = time.perf_counter()
+        for item in items:
+            started = time.perf_counter()
+            result = func(item)
+            timings.append(time.perf_counter() - started)
+            errors += not result
+        elapsed += time.perf_counter() - round_started
+    return summarize(timings, len(timings), errors, elapsed)
+
+
+def check_correctness():
+    """Checks that must hold before measuring anything, returns the failures"""
+    failures = []
+    # A BOM must not hide the first section, whether the setup comes as text or split across chunks
+    bom_text = "\ufeff[CAR]\nMODEL=ks_bmw_m3_e30\n"
+    bom_bytes = bom_text.encode("utf-8")
+    for name, setup in [("BOM text", parse_setup_text(bom_text)),
+                        ("BOM bytes", parse_setup_chunks([bom_bytes[:2], bom_bytes[2:]]))]:
+        if setup.car_id != "ks_bmw_m3_e30":
+            failures.append(f"{name}: car ID is {setup.car_id!r}")
+
+    # Registration writes every value once, then nothing while it's up to date
+    backend = MemoryRegistryBackend()
+    expected = len(get_protocol_values(addon.URL_SCHEME, REGISTRY_COMMAND))
+    written = [sync_protocol_registration(backend, addon.URL_SCHEME, REGISTRY_COMMAND) for _ in range(2)]
+    if written != [expected, 0] or backend.writes != expected:
+        failures.append(f"registration: wrote {written} values ({backend.writes} writes), expected [{expected}, 0]")
+    return failures
+
+
+def check_batch_tracks(corpus, server):
+    """Check that batch URLs of setups with a track carry it in the compact payload, returns the failures"""
+    failures = []
+    generate_cm_url.SETUP_FILES_PATH = server.setup_files_url
+    session = requests.Session()
+    for setup_id, _, text in corpus:
+        track_id = parse_setup_text(text, setup_id).track_id
+        if not track_id:
+            continue
+        entry = generate_cm_url.generate_batch_entry(session, setup_id)
+        if entry['status'] != 'ok':
+            # The stand-in server can be told to fail requests
+            continue
+        payload = decode_compact_payload(entry['url'].split("z=", 1)[1])
+        if payload.get('k') != track_id:
+            failures.append(f"batch setup {setup_id}: track is {payload.get('k')!r}, expected {track_id!r}")
+    return failures
+
+
+def run_benchmarks(corpus, server, rounds, work_dir):
+    results = {}
+    setup_ids = [setup_id for setup_id, _, _ in corpus]
+    request_ids = setup_ids + MISSING_IDS
+    get_url = lambda setup_id: f"{server.setup_files_url}setup_{setup_id}.ini"
+
+    # URL parsing
+    urls = [f"{addon.URL_PROTOCOL}setup/{setup_id}" for setup_id in setup_ids]
+    urls += [f"{addon.URL_PROTOCOL}setup/{setup_id}?install=direct" for setup_id in setup_ids]
+    results['url_parsing'] = run_timed(
+        lambda url: addon.parse_setup_url(url[len(addon.URL_PROTOCOL):]), urls * URL_REPEAT, rounds)
+
+    # Protocol registration on every start, the registry is already up to date
+    backend = MemoryRegistryBackend()
+    sync_protocol_registration(backend, addon.URL_SCHEME, REGISTRY_COMMAND)
+    results['registration'] = run_timed(
+        lambda _: sync_protocol_registration(backend, addon.URL_SCHEME, REGISTRY_COMMAND) == 0,
+        range(URL_REPEAT), rounds)
+
+    # Setup parsing and payload encoding, CPU only
+    results['parsing'] = run_timed(lambda entry: parse_setup_text(entry[2], entry[0]), corpus * CPU_REPEAT, rounds)
+    setups = [parse_setup_text(text, setup_id) for setup_id, _, text in corpus]
+    setup_data = [{'content': s.content, 'car_id': s.car_id, 'track_id': s.track_id, 'setup_id': s.setup_id}
+                  for s in setups]
+    results['encode_compact'] = run_timed(lambda data: encode_compact_command(data)[0], setup_data * CPU_REPEAT, rounds)
+    results['encode_legacy'] = run_timed(lambda data: encode_legacy_command(data)[0], setup_data * CPU_REPEAT, rounds)
+
+    # Downloads through the cache: cold cache, then revalidation of every entry (304)
+    session = requests.Session()
+    caches = {}
+
+    def new_cache(name, fresh_seconds):
+        cache_dir = os.path.join(work_dir, name)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        caches[name] = SetupCache(cache_dir, fresh_seconds=fresh_seconds)
+
+    results['download_cold'] = run_timed(
+        lambda setup_id: fetch_setup_file(caches['cold'], setup_id, get_url(setup_id), session.get)[0],
+        request_ids, rounds, lambda: new_cache('cold', 300))
+    results['download_revalidate'] = run_timed(
+        lambda setup_id: fetch_setup_file(caches['cold'], setup_id, get_url(setup_id), session.get)[0],
+        setup_ids, rounds, lambda: setattr(caches['cold'], 'fresh_seconds', 0))
+
+    # End-to-end process_url() with the addon pointed at the stand-in server
+    addon.SETUP_FILES_PATH = server.setup_files_url
+    addon.SKIP_INSTALLED = False
+    addon.INSTALL_MODE = addon.INSTALL_MODE_CONTENT_MANAGER
+    addon.launcher = RecordingLauncher()
+    addon.http_session = requests.Session()
+    addon.logger = StructuredLogger(os.path.join(work_dir, "setupmarket.log"))
+
+    def use_addon_cache(fresh_seconds):
+        new_cache('addon', fresh_seconds)
+        addon.setup_cache = caches['addon']
+
+    process_urls = [f"{addon.URL_PROTOCOL}setup/{setup_id}" for setup_id in request_ids]
+    results['process_url_cold'] = run_timed(addon.process_url, process_urls, rounds, lambda: use_addon_cache(300))
+    results['process_url_cached'] = run_timed(addon.process_url, process_urls, rounds)
+    addon.logger.close()
+
+    # Batch mode of generate_cm_url.py, one sample per batch
+    generate_cm_url.SETUP_FILES_PATH = server.setup_files_url
+    batch_ids = request_ids * 4
+    timings = []
+    failed = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        failed += generate_cm_url.run_batch(batch_ids, generate_cm_url.DEFAULT_WORKERS, output=io.StringIO(),
+                                            launcher=RecordingLauncher())
+        timings.append(time.perf_counter() - started)
+    results['batch'] = summarize(timings, len(batch_ids) * rounds, failed, sum(timings))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline, returns the names of regressed benchmarks"""
+    regressions = []
+    print(f"\n{'benchmark':<22} {'ops/s':>12} {'baseline':>12} {'p50 ms':>10} {'baseline':>10}  result")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<22} {current['ops_per_sec']:>12.1f} {'-':>12} {current['p50_ms']:>10.4f} {'-':>10}  new")
+            continue
+        slower = (current['ops_per_sec'] < previous['ops_per_sec'] * (1 - tolerance) or
+                  current['p50_ms'] > previous['p50_ms'] * (1 + tolerance))
+        if slower:
+            regressions.append(name)
+        print(f"{name:<22} {current['ops_per_sec']:>12.1f} {previous['ops_per_sec']:>12.1f} "
+              f"{current['p50_ms']:>10.4f} {previous['p50_ms']:>10.4f}  {'REGRESSION' if slower else 'ok'}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Setup Market hot paths offline")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Stand-in server latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="Share of requests answered with 404")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--corpus", help="Directory of setup_<id>.ini files (default: synthetic corpus)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    failures = check_correctness()
+    if failures:
+        print("Correctness checks failed:\n  " + "\n  ".join(failures))
+        return 1
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus()
+    config = {'rounds': args.rounds, 'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+              'not_found_rate': args.not_found_rate, 'failure_rate': args.failure_rate,
+              'corpus': args.corpus or "synthetic", 'setups': len(corpus)}
+
+    work_dir = tempfile.mkdtemp(prefix="setupmarket_bench_")
+    try:
+        with StandInServer(corpus, args.latency_ms, args.jitter_ms, args.not_found_rate, args.failure_rate) as server:
+            failures = check_batch_tracks(corpus, server)
+            results = run_benchmarks(corpus, server, args.rounds, work_dir)
+            requests_served = dict(server.requests)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'benchmark':<22} {'ops':>8} {'errors':>7} {'ops/s':>12} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<22} {r['operations']:>8} {r['errors']:>7} {r['ops_per_sec']:>12.1f} "
+              f"{r['p50_ms']:>10.4f} {r['p90_ms']:>10.4f} {r['p99_ms']:>10.4f}")
+    print(f"\nStand-in server responses: {requests_served}")
+    if failures:
+        print("Correctness checks failed:\n  " + "\n  ".join(failures))
+        return 1
+
+    exit_code = 0
+    if args.compare:
+        try:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read baseline {args.baseline}: {e}")
+            return 1
+        if baseline.get('config') != config:
+            print(f"Warning: baseline was recorded with {baseline.get('config')}")
+        regressions = compare(results, baseline.get('results', {}), args.tolerance)
+        if regressions:
+            print(f"\nSlower than the baseline: {', '.join(regressions)}")
+            exit_code = 1
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({'config': config, 'python': platform.python_version(), 'platform': platform.platform(),
+                       'recorded': time.strftime("%Y-%m-%d %H:%M:%S"), 'results': results}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
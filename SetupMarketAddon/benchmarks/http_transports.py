@@ -0,0 +1,132 @@
+"""Compare the footprint of the HTTP transports: requests against the standard library client
+
+For every transport, in fresh interpreters:
+
+- import time and modules loaded, from -X importtime (ssl is imported first
+  and not counted, both transports need it for https)
+- memory allocated by Python (tracemalloc) after importing and after the
+  requests, and the peak RSS of the process where the platform reports it
+- latency of sequential keep-alive downloads from the stand-in server
+
+Usage: python http_transports.py [--requests 200] [--rounds 5] [--latency-ms 0]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ADDON_DIR)
+
+from corpus import generate_corpus
+from stand_in_server import StandInServer
+from startup import parse_importtime
+
+# How each transport is imported and its session created
+TRANSPORTS = {
+    'requests': ("import requests", "requests.Session()"),
+    'stdlib': ("import setup_http", "setup_http.StdlibSession()"),
+}
+
+IMPORT_DRIVER = """
+import sys, ssl
+sys.path.insert(0, {addon_dir!r})
+{import_line}
+"""
+
+MEMORY_DRIVER = """
+import sys, ssl, json, time, tracemalloc
+sys.path.insert(0, {addon_dir!r})
+modules_before = len(sys.modules)
+tracemalloc.start()
+{import_line}
+session = {session_line}
+after_import = tracemalloc.get_traced_memory()[0]
+latencies = []
+for i in range({count}):
+    url = {urls!r}[i % {url_count}]
+    started = time.perf_counter()
+    response = session.get(url, stream=True, timeout=(5, 10))
+    size = sum(len(chunk) for chunk in response.iter_content(16384))
+    response.close()
+    latencies.append((time.perf_counter() - started) * 1000)
+    assert response.status_code == 200 and size > 0
+current, peak = tracemalloc.get_traced_memory()
+try:
+    import resource
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+except ImportError:
+    rss_mb = None
+print(json.dumps({{'modules': len(sys.modules) - modules_before, 'after_import_kb': after_import / 1024,
+                  'after_requests_kb': current / 1024, 'peak_kb': peak / 1024, 'rss_mb': rss_mb,
+                  'latencies': latencies}}))
+"""
+
+
+def measure_import(name, rounds):
+    """Median import milliseconds of a transport, without ssl and interpreter startup"""
+    import_line, _ = TRANSPORTS[name]
+    driver = IMPORT_DRIVER.format(addon_dir=ADDON_DIR, import_line=import_line)
+    times = []
+    for _ in range(rounds):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", driver], capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"importing {name} failed: {completed.stderr.strip().splitlines()[-1]}")
+        total, modules = parse_importtime(completed.stderr)
+        ssl_us = sum(int(line.split("|")[1]) for line in completed.stderr.splitlines()
+                     if line.startswith("import time:") and line.split("|")[2].rstrip() == " ssl")
+        times.append((total - ssl_us) / 1000)
+    return statistics.median(times)
+
+
+def measure_memory(name, urls, count):
+    """Memory and latencies of a transport downloading count setups"""
+    import_line, session_line = TRANSPORTS[name]
+    driver = MEMORY_DRIVER.format(addon_dir=ADDON_DIR, import_line=import_line, session_line=session_line,
+                                  count=count, urls=urls, url_count=len(urls))
+    completed = subprocess.run([sys.executable, "-c", driver], capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} failed: {completed.stderr.strip()}")
+    return json.loads(completed.stdout)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the HTTP transports' import time, memory and latency")
+    parser.add_argument("--requests", type=int, default=200, help="downloads per transport")
+    parser.add_argument("--rounds", type=int, default=5, help="interpreters started to measure import time")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency added by the stand-in server")
+    args = parser.parse_args()
+
+    corpus = generate_corpus()
+    results = []
+    with StandInServer(corpus, args.latency_ms) as server:
+        urls = [f"{server.setup_files_url}setup_{setup_id}.ini" for setup_id, _, _ in corpus]
+        for name in TRANSPORTS:
+            try:
+                import_ms = measure_import(name, args.rounds)
+                memory = measure_memory(name, urls, args.requests)
+            except RuntimeError as e:
+                print(f"Skipping {name}: {str(e)}")
+                continue
+            results.append((name, import_ms, memory))
+
+    print(f"{'transport':<10} {'import ms':>10} {'modules':>8} {'import KB':>10} {'after KB':>9} {'peak KB':>8} "
+          f"{'max RSS MB':>11} {'p50 ms':>7} {'p90 ms':>7}")
+    for name, import_ms, memory in results:
+        rss = f"{memory['rss_mb']:.1f}" if memory['rss_mb'] is not None else "-"
+        print(f"{name:<10} {import_ms:>10.1f} {memory['modules']:>8} {memory['after_import_kb']:>10.0f} "
+              f"{memory['after_requests_kb']:>9.0f} {memory['peak_kb']:>8.0f} {rss:>11} "
+              f"{percentile(memory['latencies'], 0.5):>7.3f} {percentile(memory['latencies'], 0.9):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
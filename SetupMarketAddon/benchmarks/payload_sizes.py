@@ -0,0 +1,58 @@
+"""Compare acmanager://shared URL sizes of the legacy and compact payload encodings
+
+Usage: python payload_sizes.py [corpus directory]
+
+Without a directory, a synthetic corpus from corpus.py is used.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus import generate_corpus, load_corpus
+from setup_parser import parse_setup_text
+from cm_payload import encode_compact_command, encode_legacy_command, decode_compact_payload
+
+
+def measure(corpus):
+    rows = []
+    for setup_id, profile, text in corpus:
+        setup = parse_setup_text(text, setup_id)
+        setup_data = {'content': setup.content, 'car_id': setup.car_id, 'track_id': setup.track_id, 'setup_id': setup_id}
+
+        started = time.perf_counter()
+        legacy_url, legacy = encode_legacy_command(setup_data)
+        legacy_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        compact_url, compact = encode_compact_command(setup_data)
+        compact_time = time.perf_counter() - started
+
+        # Make sure the compact payload survives a round trip
+        decoded = decode_compact_payload(compact_url.split("?z=", 1)[1])
+        assert decoded['t'] == setup.car_id, f"Car ID mismatch for {setup_id}"
+
+        rows.append((setup_id, profile, legacy['raw_size'], legacy['encoded_size'], compact['encoded_size'],
+                     legacy_time, compact_time))
+    return rows
+
+
+def main():
+    corpus = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else generate_corpus()
+    rows = measure(corpus)
+
+    print(f"{'id':>8} {'profile':>10} {'setup':>9} {'legacy':>9} {'compact':>9} {'ratio':>7} {'legacy ms':>10} {'compact ms':>11}")
+    for setup_id, profile, raw, legacy, compact, legacy_time, compact_time in rows:
+        print(f"{setup_id:>8} {profile:>10} {raw:>9} {legacy:>9} {compact:>9} {compact / legacy:>7.2f} "
+              f"{legacy_time * 1000:>10.3f} {compact_time * 1000:>11.3f}")
+
+    total_raw = sum(r[2] for r in rows)
+    total_legacy = sum(r[3] for r in rows)
+    total_compact = sum(r[4] for r in rows)
+    print(f"\nTotal: {total_raw} bytes of setups, legacy URLs {total_legacy} bytes ({total_legacy / total_raw:.2f}x), "
+          f"compact URLs {total_compact} bytes ({total_compact / total_raw:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
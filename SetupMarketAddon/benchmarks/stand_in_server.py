@@ -0,0 +1,228 @@
+"""Local stand-in for the setup files endpoint of setupmarket.net
+
+Serves a corpus as /wp-content/uploads/setup-files/setup_<id>.ini, plus a
+car_<car_id>.json list of setup IDs per car for car bundles and the
+catalogue endpoint (/wp-json/setupmarket/v1/catalogue?since=&limit=), with
+optional latency, 404s and server errors, so benchmarks never touch the
+real site. ETag/If-None-Match is honoured like on the website.
+
+Usage: python stand_in_server.py [--port 8765] [--latency-ms 20] [--not-found-rate 0.05]
+                                 [--failure-rate 0.05] [corpus directory]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import json
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from corpus import generate_corpus, load_corpus
+
+SETUP_FILES_ROUTE = "/wp-content/uploads/setup-files/"
+SETUP_FILE_PATH = re.compile(r'^' + re.escape(SETUP_FILES_ROUTE) + r'setup_(\w+)\.ini$')
+CAR_LIST_PATH = re.compile(r'^' + re.escape(SETUP_FILES_ROUTE) + r'car_([\w.\-]+)\.json$')
+CAR_MODEL = re.compile(r'^MODEL=(.+)$', re.MULTILINE)
+CM_META_TRACK = re.compile(r'^;CM_META:track:(.+)$', re.MULTILINE)
+CATALOGUE_ROUTE = "/wp-json/setupmarket/v1/catalogue"
+
+# Made-up catalogue details for the corpus
+CATALOGUE_AUTHORS = ["Aris", "Jardier", "Coach Dave", "Hotlap Harry"]
+CATALOGUE_TAGS = ["gt3", "gt4", "hypercar"]
+CATALOGUE_EPOCH = 1750000000
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real site
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        status, body, headers = stand_in.respond(self.path, self.headers.get("If-None-Match"))
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients dropping unread responses is expected, anything else is worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandInServer:
+    """Threaded HTTP server serving a corpus of (setup_id, profile, text) setups"""
+
+    def __init__(self, corpus, latency_ms=0.0, jitter_ms=0.0, not_found_rate=0.0, failure_rate=0.0,
+                 seed=0, host="127.0.0.1", port=0):
+        self.setups = {}
+        cars = {}
+        for setup_id, _, text in corpus:
+            body = text.encode("utf-8")
+            self.setups[str(setup_id)] = (body, f'"{hashlib.sha1(body).hexdigest()[:16]}"')
+            model = CAR_MODEL.search(text)
+            if model:
+                cars.setdefault(model.group(1).strip(), []).append(str(setup_id))
+        self.car_lists = {car_id: json.dumps(setup_ids).encode("utf-8") for car_id, setup_ids in cars.items()}
+        self.catalogue = [self._catalogue_entry(index, setup_id, profile, text)
+                          for index, (setup_id, profile, text) in enumerate(corpus)]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.not_found_rate = not_found_rate
+        self.failure_rate = failure_rate
+        self.last_modified = formatdate(usegmt=True)
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = QuietHTTPServer((host, port), StandInHandler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = None
+
+    @staticmethod
+    def _catalogue_entry(index, setup_id, profile, text):
+        model = CAR_MODEL.search(text)
+        track = CM_META_TRACK.search(text)
+        updated = CATALOGUE_EPOCH + index * 3600
+        return {'id': int(setup_id), 'car': model.group(1).strip() if model else "ks_unknown",
+                'track': track.group(1).strip() if track else None,
+                'author': CATALOGUE_AUTHORS[index % len(CATALOGUE_AUTHORS)],
+                'lap_time': 120000 + (index * 7919) % 15000,
+                'date': time.strftime("%Y-%m-%d", time.gmtime(updated)), 'updated': updated,
+                'tags': [CATALOGUE_TAGS[index % len(CATALOGUE_TAGS)], profile]}
+
+    def publish(self, entry):
+        """Add or change a catalogue entry (or delete it with "deleted": True), as the newest change"""
+        with self._lock:
+            entry = dict(entry, updated=max(e['updated'] for e in self.catalogue) + 1 if self.catalogue else CATALOGUE_EPOCH)
+            self.catalogue = [e for e in self.catalogue if e['id'] != entry['id']] + [entry]
+
+    def get_catalogue_page(self, since, limit):
+        """Get the catalogue entries changed after since, oldest first"""
+        with self._lock:
+            changed = sorted((e for e in self.catalogue if e['updated'] > since), key=lambda e: e['updated'])
+        page = changed[:limit]
+        return {'setups': page, 'cursor': str(page[-1]['updated']) if page else str(since), 'more': len(changed) > limit}
+
+    @property
+    def catalogue_url(self):
+        """URL to use in place of the website's catalogue endpoint"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{CATALOGUE_ROUTE}"
+
+    @property
+    def setup_files_url(self):
+        """Base URL to use in place of SETUP_FILES_PATH"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{SETUP_FILES_ROUTE}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="StandInServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, if_none_match=None):
+        """Get (status, body, headers) for a request path"""
+        path, _, query = path.partition("?")
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            roll = self._random.random()
+
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if path == CATALOGUE_ROUTE and roll >= self.failure_rate:
+            parameters = parse_qs(query)
+            try:
+                since = float(parameters.get("since", ["0"])[0])
+                limit = max(1, int(parameters.get("limit", ["500"])[0]))
+            except ValueError:
+                return 400, b"400", {"Content-Type": "text/plain"}
+            with self._lock:
+                self.requests[200] = self.requests.get(200, 0) + 1
+            return 200, json.dumps(self.get_catalogue_page(since, limit)).encode("utf-8"), {"Content-Type": "application/json"}
+
+        car_match = CAR_LIST_PATH.match(path)
+        if car_match and car_match.group(1) in self.car_lists and roll >= self.failure_rate:
+            with self._lock:
+                self.requests[200] = self.requests.get(200, 0) + 1
+            return 200, self.car_lists[car_match.group(1)], {"Content-Type": "application/json"}
+
+        match = SETUP_FILE_PATH.match(path)
+        setup = self.setups.get(match.group(1)) if match else None
+        if roll < self.failure_rate:
+            status = 500
+        elif setup is None or roll < self.failure_rate + self.not_found_rate:
+            status = 404
+        elif if_none_match == setup[1]:
+            status = 304
+        else:
+            status = 200
+
+        with self._lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+
+        if status == 200:
+            body, etag = setup
+            return status, body, {"Content-Type": "text/plain; charset=utf-8", "ETag": etag,
+                                  "Last-Modified": self.last_modified}
+        if status == 304:
+            return status, b"", {"ETag": setup[1]}
+        return status, f"{status}".encode("utf-8"), {"Content-Type": "text/plain"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a setup corpus like setupmarket.net does")
+    parser.add_argument("corpus", nargs="?", help="Directory of setup_<id>.ini files (default: synthetic corpus)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus()
+    server = StandInServer(corpus, args.latency_ms, args.jitter_ms, args.not_found_rate, args.failure_rate,
+                           port=args.port)
+    print(f"Serving {len(corpus)} setups at {server.setup_files_url}, catalogue at {server.catalogue_url}")
+    with server:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Measure the cold start of the protocol handler with -X importtime and enforce a budget
+
+Every scenario runs in a fresh interpreter, the import cost is what -X importtime
+reports for everything imported after interpreter startup (site and its .pth
+files are excluded), the wall time covers the whole process:
+
+- import: importing main.py
+- forward: "main.py <url>" while a resident instance is running, which
+  should hand the URL over and exit before the rest of main.py is imported
+- cached_hit: process_url() for a setup in a fresh cache, which must not
+  import the HTTP stack (requests, urllib3, ssl)
+
+Usage: python startup.py [--rounds 5] [--import-budget-ms 50] [--forward-budget-ms 15]
+
+Exits with 1 if a scenario goes over its budget or imports the HTTP stack.
+"""
+
+import os
+import sys
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ADDON_DIR)
+
+from corpus import generate_corpus
+from resident import RESIDENT_HOST, RESIDENT_PORT, RESIDENT_MAGIC
+from setup_cache import SetupCache
+
+# Modules that make up the HTTP stack, none of them may be imported for a cached hit
+HTTP_STACK = ("requests", "urllib3", "ssl", "http.client")
+
+# Interpreter startup, not counted against the budget
+STARTUP_MODULES = ("site", "encodings", "zipimport", "_frozen_importlib_external", "codecs", "io", "abc")
+
+CACHED_HIT_DRIVER = """
+import sys
+sys.path.insert(0, {addon_dir!r})
+import main
+from setup_cache import SetupCache
+from setup_log import StructuredLogger
+from launcher import RecordingLauncher
+main.setup_cache = SetupCache({cache_dir!r})
+main.logger = StructuredLogger({log_path!r})
+main.launcher = RecordingLauncher()
+main.setup_pack = None
+main.SKIP_INSTALLED = False
+ok = main.process_url({url!r}) and len(main.launcher.commands) == 1
+main.logger.close()
+sys.exit(0 if ok else 2)
+"""
+
+
+def parse_importtime(stderr):
+    """Get (total import microseconds, imported module names) from -X importtime output"""
+    total = 0
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append(name.strip())
+        # Top-level imports have a single space before the name, nested ones are indented further
+        if not name.startswith("  ") and name.strip() not in STARTUP_MODULES:
+            total += int(cumulative)
+    return total, modules
+
+
+def run_scenario(args, cwd):
+    """Run a fresh interpreter with -X importtime, returns (wall ms, import ms, modules, exit code)"""
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=cwd, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    total, modules = parse_importtime(completed.stderr)
+    return wall_ms, total / 1000, modules, completed.returncode
+
+
+class FakeResident:
+    """Acknowledges forwarded URLs like a running resident instance, without handling them"""
+
+    def __init__(self):
+        self.urls = []
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if not hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+            # Outside Windows this only allows rebinding while the last round's connections are in TIME_WAIT
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((RESIDENT_HOST, RESIDENT_PORT))
+        self._socket.listen(16)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            with conn:
+                line = conn.makefile("r", encoding="utf-8").readline().strip()
+                if line.startswith(RESIDENT_MAGIC + " "):
+                    self.urls.append(line[len(RESIDENT_MAGIC) + 1:])
+                    conn.sendall(b"OK\n")
+
+    def close(self):
+        self._socket.close()
+
+
+def measure(name, args, cwd, rounds, budget_ms, forbidden=()):
+    """Run a scenario several times, returns its result row"""
+    wall, imports, modules, failed = [], [], set(), 0
+    for _ in range(rounds):
+        wall_ms, import_ms, imported, code = run_scenario(args, cwd)
+        wall.append(wall_ms)
+        imports.append(import_ms)
+        modules.update(imported)
+        failed += code != 0
+    leaked = sorted(m for m in modules if m in forbidden)
+    import_ms = statistics.median(imports)
+    ok = not failed and not leaked and (budget_ms is None or import_ms <= budget_ms)
+    return {'name': name, 'wall_ms': statistics.median(wall), 'import_ms': import_ms, 'modules': len(modules),
+            'budget_ms': budget_ms, 'failed': failed, 'leaked': leaked, 'ok': ok}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and budget the protocol handler's cold start")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=50.0,
+                        help="Maximum import time of main.py and of a cached hit")
+    parser.add_argument("--forward-budget-ms", type=float, default=15.0,
+                        help="Maximum import time of handing a URL to the resident instance")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="setupmarket_startup_")
+    results = []
+    try:
+        results.append(measure("import", ["-c", f"import sys; sys.path.insert(0, {ADDON_DIR!r}); import main"],
+                               work_dir, args.rounds, args.import_budget_ms))
+
+        # A setup that was just downloaded, so the cache serves it without asking the server
+        setup_id, _, text = generate_corpus()[0]
+        cache_dir = os.path.join(work_dir, "cache")
+        SetupCache(cache_dir).store(setup_id, text)
+        driver = CACHED_HIT_DRIVER.format(addon_dir=ADDON_DIR, cache_dir=cache_dir,
+                                          log_path=os.path.join(work_dir, "setupmarket.log"),
+                                          url=f"setupmarket://setup/{setup_id}")
+        results.append(measure("cached_hit", ["-c", driver], work_dir, args.rounds, args.import_budget_ms, HTTP_STACK))
+
+        try:
+            resident = FakeResident()
+        except OSError:
+            print(f"Port {RESIDENT_PORT} is in use (is the handler running?), skipping the forward scenario")
+        else:
+            try:
+                results.append(measure("forward", [os.path.join(ADDON_DIR, "main.py"), f"setupmarket://setup/{setup_id}"],
+                                       work_dir, args.rounds, args.forward_budget_ms, HTTP_STACK))
+                if len(resident.urls) != args.rounds:
+                    results[-1].update(ok=False, failed=args.rounds - len(resident.urls))
+            finally:
+                resident.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'scenario':<12} {'wall ms':>9} {'import ms':>10} {'budget ms':>10} {'modules':>8}  result")
+    for r in results:
+        problems = []
+        if r['failed']:
+            problems.append(f"{r['failed']} runs failed")
+        if r['leaked']:
+            problems.append(f"imported {', '.join(r['leaked'])}")
+        if r['budget_ms'] is not None and r['import_ms'] > r['budget_ms']:
+            problems.append("over budget")
+        print(f"{r['name']:<12} {r['wall_ms']:>9.1f} {r['import_ms']:>10.1f} {r['budget_ms']:>10.1f} {r['modules']:>8}  "
+              f"{'; '.join(problems) or 'ok'}")
+
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import json
+import zlib
+import base64
+
+from setup_parser import META_PREFIX
+
+SHARED_AUTHOR = "SetupMarket.net"
+
+# Shared entry type names as Content Manager knows them
+ENTRY_TYPE_CAR_SETUP = "CarSetup"
+
+# Commands end up on Content Manager's command line, which Windows limits to 32767 characters
+MAX_COMMAND_LENGTH = 32000
+
+
+def canonicalize_setup(content):
+    """Minify a setup before encoding: drop blank lines, redundant whitespace and CM_META lines
+
+    Metadata is carried in separate payload fields instead, so CM_META lines
+    (often added more than once along the way) are dropped entirely.
+    """
+    lines = []
+    for line in content.split("\n"):
+        line = line.strip()
+        if not line or line.startswith(META_PREFIX):
+            continue
+        if line[0] not in ";#[" and "=" in line:
+            key, value = line.split("=", 1)
+            line = f"{key.strip()}={value.strip()}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def _to_urlsafe_base64(data):
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _from_urlsafe_base64(encoded):
+    return base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+
+
+def encode_compact_command(setup_data):
+    """Create a compact acmanager://shared?z= command for a setup
+
+    The payload is JSON with the usual shared entry keys, with the minified
+    setup stored as plain text in "d" and the track ID in "k", compressed with
+    raw deflate and encoded as URL-safe base64 without padding. Returns the
+    command and a dict with the raw and encoded sizes.
+    """
+    raw_content = setup_data['content']
+    shared_data = {
+        'n': f"Setup for {setup_data['car_id']}",
+        't': setup_data['car_id'],
+        'a': SHARED_AUTHOR,
+        'i': f"setup_{setup_data['setup_id']}.ini",
+        'e': ENTRY_TYPE_CAR_SETUP,
+        'd': canonicalize_setup(raw_content)
+    }
+    if setup_data.get('track_id'):
+        shared_data['k'] = setup_data['track_id']
+
+    shared_json = json.dumps(shared_data, separators=(",", ":"), ensure_ascii=False)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    compressed = compressor.compress(shared_json.encode("utf-8")) + compressor.flush()
+    cmd = f"acmanager://shared?z={_to_urlsafe_base64(compressed)}"
+    return cmd, {'raw_size': len(raw_content.encode("utf-8")), 'encoded_size': len(cmd)}
+
+
+def combine_shared_commands(commands, max_length=MAX_COMMAND_LENGTH):
+    """Merge acmanager://shared commands into as few as fit the command line
+
+    Content Manager handles every id= and z= value of a shared command in
+    order, so several setups can be handed over in a single launch. Returns
+    (command, indices) tuples, indices being the positions of the merged
+    commands in the input.
+    """
+    combined = []
+    current, indices = None, []
+    for index, cmd in enumerate(commands):
+        query = cmd.split("?", 1)[1]
+        if current is not None and len(current) + 1 + len(query) <= max_length:
+            current += "&" + query
+            indices.append(index)
+        else:
+            if current is not None:
+                combined.append((current, indices))
+            current, indices = cmd, [index]
+    if current is not None:
+        combined.append((current, indices))
+    return combined
+
+
+def decode_compact_payload(payload):
+    """Decode the z= payload of a compact command back into the shared entry dict"""
+    return json.loads(zlib.decompress(_from_urlsafe_base64(payload), -15).decode("utf-8"))
+
+
+def encode_legacy_command(setup_data):
+    """Create an acmanager://shared?id= command in the original double base64 format"""
+    raw_content = setup_data['content']
+
+    # Encode the setup content to base64
+    setup_content_b64 = base64.b64encode(raw_content.encode('utf-8')).decode('utf-8')
+
+    # Create the shared entry data
+    shared_data = {
+        'n': f"Setup for {setup_data['car_id']}",  # name
+        't': setup_data['car_id'],  # target (car)
+        'a': SHARED_AUTHOR,         # author
+        'i': f"setup_{setup_data['setup_id']}.ini",  # id
+        'e': 1,  # entry type (1 = CarSetup)
+        'd': setup_content_b64  # data
+    }
+
+    # Encode the shared data to JSON then to base64
+    shared_json = json.dumps(shared_data)
+    shared_b64 = base64.b64encode(shared_json.encode('utf-8')).decode('utf-8')
+    cmd = f"acmanager://shared?id={shared_b64}"
+    return cmd, {'raw_size': len(raw_content.encode("utf-8")), 'encoded_size': len(cmd)}
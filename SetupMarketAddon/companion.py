@@ -0,0 +1,194 @@
+import json
+import socket
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local HTTP API the website talks to instead of opening setupmarket:// links
+COMPANION_HOST = "127.0.0.1"
+COMPANION_PORT = 47597
+
+# Only pages of the website may use the API, browsers always send the page's origin
+ALLOWED_ORIGINS = ("https://setupmarket.net", "https://www.setupmarket.net")
+
+# Request limits, a request holds a handful of setup IDs (as many as a bundle link)
+MAX_BODY_SIZE = 16 * 1024
+MAX_SETUP_IDS = 50
+
+
+def parse_setup_ids(payload):
+    """Get the setup IDs of a request body ({"ids": [...]} or {"id": ...}) without duplicates, or None"""
+    if not isinstance(payload, dict):
+        return None
+    ids = payload.get("ids", [payload["id"]] if "id" in payload else None)
+    if not isinstance(ids, list) or not 0 < len(ids) <= MAX_SETUP_IDS:
+        return None
+    setup_ids = []
+    for setup_id in ids:
+        # bool is an int too, but never a setup ID
+        if isinstance(setup_id, int) and not isinstance(setup_id, bool) and setup_id > 0:
+            setup_ids.append(str(setup_id))
+        elif isinstance(setup_id, str) and setup_id.isdigit():
+            setup_ids.append(setup_id)
+        else:
+            return None
+    return list(dict.fromkeys(setup_ids))
+
+
+class CompanionHandler(BaseHTTPRequestHandler):
+    """GET /ping, POST /install and POST /prefetch for the website, everything else is refused"""
+
+    server_version = "SetupMarket"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        self.server.companion.log(f"Companion API: {format % args}", level="debug", phase="companion")
+
+    def _check_caller(self):
+        """Get the caller's origin, or answer 403 and return None if it isn't the website
+
+        The Host check stops DNS rebinding: a page on another domain that
+        resolves to 127.0.0.1 still sends its own domain as the host.
+        """
+        companion = self.server.companion
+        origin = self.headers.get("Origin")
+        host = self.headers.get("Host")
+        if host not in (f"{COMPANION_HOST}:{companion.port}", f"localhost:{companion.port}"):
+            self._send_json(403, {'error': "unexpected host"})
+            return None
+        if origin not in companion.allowed_origins:
+            self._send_json(403, {'error': "origin not allowed"})
+            return None
+        return origin
+
+    def _send_json(self, status, body, origin=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        if origin:
+            self.send_header("Access-Control-Allow-Origin", origin)
+            self.send_header("Vary", "Origin")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_OPTIONS(self):
+        # CORS preflight of the JSON POSTs, and of any request in browsers guarding the local network
+        origin = self._check_caller()
+        if origin is None:
+            return
+        headers = {'Access-Control-Allow-Methods': "GET, POST", 'Access-Control-Allow-Headers': "Content-Type",
+                   'Access-Control-Max-Age': "600"}
+        if self.headers.get("Access-Control-Request-Private-Network") == "true":
+            headers['Access-Control-Allow-Private-Network'] = "true"
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", origin)
+        self.send_header("Vary", "Origin")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        origin = self._check_caller()
+        if origin is None:
+            return
+        if self.path != "/ping":
+            self._send_json(404, {'error': "not found"}, origin)
+            return
+        self._send_json(200, {'name': "setupmarket", 'version': self.server.companion.version,
+                              'features': ["install", "prefetch"]}, origin)
+
+    def do_POST(self):
+        origin = self._check_caller()
+        if origin is None:
+            return
+        companion = self.server.companion
+        actions = {'/install': companion.install, '/prefetch': companion.prefetch}
+        if self.path not in actions:
+            self._send_json(404, {'error': "not found"}, origin)
+            return
+
+        # Only JSON, which browsers can't send cross-origin without the preflight
+        if self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            self._send_json(415, {'error': "expected application/json"}, origin)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._send_json(411, {'error': "missing Content-Length"}, origin)
+            return
+        if not 0 < length <= MAX_BODY_SIZE:
+            self.close_connection = True
+            self._send_json(413, {'error': "request too large"}, origin)
+            return
+
+        try:
+            setup_ids = parse_setup_ids(json.loads(self.rfile.read(length).decode("utf-8")))
+        except ValueError:
+            setup_ids = None
+        if setup_ids is None:
+            self._send_json(400, {'error': f"expected {{\"ids\": [...]}} with 1 to {MAX_SETUP_IDS} setup IDs"}, origin)
+            return
+
+        companion.log(f"Companion API {self.path}: {', '.join(setup_ids)}", phase="companion")
+        if not actions[self.path](setup_ids):
+            self._send_json(503, {'error': "could not queue the request"}, origin)
+            return
+        self._send_json(202, {'queued': setup_ids}, origin)
+
+
+class CompanionHTTPServer(ThreadingHTTPServer):
+    """HTTP server that owns its port and skips the reverse DNS lookup of HTTPServer.server_bind"""
+
+    allow_reuse_address = False
+    daemon_threads = True
+
+    def server_bind(self):
+        if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+            # Windows would otherwise let a second process bind the same port
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address[:2]
+
+
+class CompanionServer:
+    """Localhost HTTP API for the website, served on a background thread
+
+    install and prefetch are called with a list of setup IDs from the
+    server's threads and return True once the work is queued; neither may
+    block on downloads. Requests are only accepted from allowed_origins.
+    """
+
+    def __init__(self, install, prefetch, log, version, port=COMPANION_PORT, allowed_origins=ALLOWED_ORIGINS):
+        self.install = install
+        self.prefetch = prefetch
+        self.log = log
+        self.version = version
+        self.port = port
+        self.allowed_origins = allowed_origins
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Start listening, returns False if the port can't be used"""
+        try:
+            self._server = CompanionHTTPServer((COMPANION_HOST, self.port), CompanionHandler)
+        except OSError as e:
+            self.log(f"Companion API could not listen on {COMPANION_HOST}:{self.port}: {str(e)}", level="error",
+                     phase="companion")
+            return False
+        self._server.companion = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="setupmarket-companion", daemon=True)
+        self._thread.start()
+        self.log(f"Companion API listening on {COMPANION_HOST}:{self.port}", phase="companion")
+        return True
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
@@ -0,0 +1,139 @@
+import os
+import time
+from collections import namedtuple
+
+# Outcome of a handoff: whether it succeeded, the backend used, how long it took and the error if any
+LaunchResult = namedtuple("LaunchResult", ["ok", "backend", "seconds", "error"])
+
+LAUNCHER_AUTO = "auto"
+
+# How long to wait for xdg-open to report whether a handler took the URL
+XDG_OPEN_TIMEOUT = 10
+
+# MessageBoxW flags: information icon, in front of the browser that opened the link
+MB_ICONINFORMATION = 0x40
+MB_SETFOREGROUND = 0x10000
+
+
+class ShellLauncher:
+    """Open the command through the Windows shell, which passes it to the registered acmanager:// handler"""
+
+    name = "shell"
+
+    def available(self):
+        return hasattr(os, "startfile")
+
+    def launch(self, command):
+        os.startfile(command)
+
+
+class XdgOpenLauncher:
+    """Open the command with xdg-open, for Content Manager running under Proton or Wine"""
+
+    name = "xdg-open"
+
+    def available(self):
+        import shutil
+        return shutil.which("xdg-open") is not None
+
+    def launch(self, command):
+        import subprocess
+        # xdg-open exits once a handler has the URL, a non-zero code means none took it
+        completed = subprocess.run(["xdg-open", command], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   timeout=XDG_OPEN_TIMEOUT)
+        if completed.returncode != 0:
+            raise OSError(f"xdg-open exited with code {completed.returncode}")
+
+
+class ContentManagerLauncher:
+    """Start Content Manager.exe with the command as its argument, a running instance picks it up"""
+
+    name = "content_manager"
+
+    def __init__(self, exe_path):
+        self.exe_path = exe_path
+
+    def available(self):
+        return bool(self.exe_path) and os.path.isfile(self.exe_path)
+
+    def launch(self, command):
+        import subprocess
+        # Content Manager keeps running if it wasn't open yet, so don't wait for it
+        subprocess.Popen([self.exe_path, command], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         close_fds=True)
+
+
+class RecordingLauncher:
+    """Keep commands in a list instead of launching anything, for benchmarks and headless runs"""
+
+    name = "record"
+
+    def __init__(self):
+        self.commands = []
+
+    def available(self):
+        return True
+
+    def launch(self, command):
+        self.commands.append(command)
+
+
+class UnavailableLauncher:
+    """Stands in when auto finds no way to open URLs here, every launch fails with the reason"""
+
+    name = "none"
+
+    def available(self):
+        return False
+
+    def launch(self, command):
+        raise OSError("no launcher available: no Windows shell, xdg-open or Content Manager.exe found")
+
+
+def get_launcher(name=LAUNCHER_AUTO, cm_exe_path=None):
+    """Get a launcher by name, "auto" picks the first available of shell, xdg-open and Content Manager.exe
+
+    "record" is only used when asked for; if auto finds nothing, every launch fails.
+    """
+    launchers = [ShellLauncher(), XdgOpenLauncher(), ContentManagerLauncher(cm_exe_path)]
+    if name == LAUNCHER_AUTO:
+        for launcher in launchers:
+            if launcher.available():
+                return launcher
+        # Nothing can open URLs here; report that on every link rather than pretending it was opened
+        return UnavailableLauncher()
+
+    for launcher in launchers + [RecordingLauncher()]:
+        if launcher.name == name:
+            return launcher
+    raise ValueError(f"Unknown launcher: {name}")
+
+
+def launch(launcher, command):
+    """Hand a command to a launcher, never raises"""
+    started = time.perf_counter()
+    try:
+        launcher.launch(command)
+        return LaunchResult(True, launcher.name, time.perf_counter() - started, None)
+    except Exception as e:
+        return LaunchResult(False, launcher.name, time.perf_counter() - started, str(e))
+
+
+def show_message(title, text):
+    """Show a message box without waiting for it to be closed, returns False if there's no way to show one
+
+    The box lives on a non-daemon thread, so a handler that's about to exit
+    stays around until the user has seen it.
+    """
+    import threading
+    if hasattr(os, "startfile"):
+        import ctypes
+        target, args = ctypes.windll.user32.MessageBoxW, (None, text, title, MB_ICONINFORMATION | MB_SETFOREGROUND)
+    else:
+        import shutil
+        import subprocess
+        if shutil.which("notify-send") is None:
+            return False
+        target, args = subprocess.run, (["notify-send", title, text],)
+    threading.Thread(target=target, args=args, name="setupmarket-message").start()
+    return True
@@ -1,15 +1,37 @@
 import os
 import sys
-import winreg
-import json
-import requests
-import tempfile
+
+# Keep running after the first click and take URLs from later invocations over a local socket
+RESIDENT_MODE = True
+
+# Fast path for later clicks: hand the URL to the resident instance before importing anything else
+if __name__ == "__main__" and RESIDENT_MODE and len(sys.argv) > 1 and not sys.argv[1].startswith("--"):
+    from resident import forward_to_resident
+    if forward_to_resident(sys.argv[1]):
+        sys.exit(0)
+
+# Heavy modules (the HTTP stack, winreg) are imported where they're first needed, see get_http_session()
 import traceback
-from pathlib import Path
-import ctypes
+import threading
 import re
 import base64
-import subprocess
+from urllib.parse import urlparse, parse_qs
+import configparser
+from setup_cache import SetupCache, DownloadRejected, fetch_setup_file
+from setup_retry import CircuitOpen, NegativeCache, RetryPolicy
+from setup_endpoints import EndpointPool
+from setup_parser import parse_setup_text
+from setup_pack import SetupPack
+from resident import RESIDENT_IDLE_SECONDS, forward_to_resident, open_resident_socket, serve_resident
+from background_worker import BackgroundWorker
+from registry_backend import get_default_backend, sync_protocol_registration
+from setup_log import StructuredLogger, read_log_level
+from cm_payload import encode_compact_command, encode_legacy_command, combine_shared_commands
+from setup_installer import INSTALL_MODE_CONTENT_MANAGER, INSTALL_MODE_DIRECT, DEFAULT_NAME_TEMPLATE, check_name_template, install_setup, get_default_setups_dir
+from setup_index import InstalledSetupsIndex
+from setup_trace import Tracer
+from launcher import LAUNCHER_AUTO, get_launcher, launch, show_message
+from setup_bundle import BUNDLE_WORKERS, parse_bundle_url, parse_car_url, get_car_list_url, parse_car_list, limit_bundle, fetch_bundle
 
 ADDON_NAME = "Setup Market"
 ADDON_VERSION = "1.0.1"
@@ -20,6 +42,89 @@ WEBSITE_URL = "https://setupmarket.net"
 # Setup Market specific paths and details
 SETUP_FILES_PATH = f"{WEBSITE_URL}/wp-content/uploads/setup-files/"
 
+# Expected format: setupmarket://setup/12345
+SETUP_URL_PATTERN = re.compile(r'setup/(\d+)')
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_DEFAULTS_PATH = os.path.join(ADDON_DIR, "settings", "settings_defaults.ini")
+SETTINGS_PATH = os.path.join(ADDON_DIR, "settings", "settings.ini")
+
+# Addon settings, shared with the in-game app
+settings = configparser.ConfigParser()
+settings.read([SETTINGS_DEFAULTS_PATH, SETTINGS_PATH], encoding="utf-8")
+
+def get_setting(section, key, fallback):
+    """Get a setting value, without the description CM keeps after it in the defaults"""
+    return settings.get(section, key, fallback=fallback).split(";")[0].strip()
+
+# Buffered JSON-lines log in the addon's directory, level comes from [LOG] in settings.ini
+logger = StructuredLogger(
+    os.path.join(ADDON_DIR, "setupmarket.log"),
+    level=read_log_level(SETTINGS_DEFAULTS_PATH, SETTINGS_PATH))
+
+# Local cache of downloaded setups, revalidated with ETag/Last-Modified ([CACHE] in settings.ini)
+setup_cache = SetupCache(
+    max_bytes=int(get_setting('CACHE', 'max_size_mb', "64")) * 1024 * 1024,
+    fresh_seconds=int(get_setting('CACHE', 'fresh_seconds', "300")))
+
+# Download limits ([NETWORK] in settings.ini), so a dead server or a page that isn't a setup fails fast
+DOWNLOAD_TIMEOUT = (float(get_setting('NETWORK', 'connect_timeout', "5")), float(get_setting('NETWORK', 'read_timeout', "10")))
+DOWNLOAD_TRANSFER_SECONDS = float(get_setting('NETWORK', 'transfer_seconds', "30"))
+MAX_SETUP_BYTES = int(get_setting('NETWORK', 'max_setup_kb', "1024")) * 1024
+
+# Pack made with "generate_cm_url.py mirror", used before the network ([CACHE] pack, relative to the addon)
+SETUP_PACK_PATH = get_setting('CACHE', 'pack', "")
+setup_pack = SetupPack(os.path.join(ADDON_DIR, SETUP_PACK_PATH)) if SETUP_PACK_PATH else None
+
+# Keep-alive HTTP session, stays warm while running as the resident handler; created on the first
+# request, so links served from the pack or a fresh cache never load the HTTP stack
+HTTP_TRANSPORT = get_setting('NETWORK', 'transport', "auto")
+http_session = None
+# The first request can come from several bundle threads at once, only one of them creates the session
+http_session_lock = threading.Lock()
+
+# Retries with jittered backoff and a circuit breaker per host for server errors and timeouts
+retry_policy = RetryPolicy(attempts=int(get_setting('NETWORK', 'retries', "2")) + 1)
+
+# Equivalent copies of the setup files, e.g. a CDN, the website and a local mirror; requests go to the fastest
+SETUP_ENDPOINTS = [url.strip().rstrip("/") + "/" for url in get_setting('NETWORK', 'endpoints', "").split(",") if url.strip()]
+endpoint_pool = EndpointPool(SETUP_FILES_PATH, SETUP_ENDPOINTS, hedge=get_setting('NETWORK', 'hedge', "False").lower() == "true",
+                             concurrency=BUNDLE_WORKERS)
+
+# Setup IDs that recently got a 404, clicking them again fails right away without a request
+missing_setups = NegativeCache(ttl=float(get_setting('NETWORK', 'not_found_ttl', "600")))
+
+# Registry access for the protocol registration
+protocol_registry = get_default_backend()
+
+# Hand setups to Content Manager as acmanager://shared?z= (deflate) instead of ?id= (double base64)
+COMPACT_SHARED_PAYLOAD = True
+
+# Install straight into the setups folder ("direct") or through Content Manager ("content_manager")
+INSTALL_MODE = get_setting('INSTALL', 'mode', INSTALL_MODE_CONTENT_MANAGER)
+INSTALL_NAME_TEMPLATE = get_setting('INSTALL', 'name_template', DEFAULT_NAME_TEMPLATE)
+try:
+    check_name_template(INSTALL_NAME_TEMPLATE)
+except ValueError as e:
+    logger.log(f"Setting [INSTALL] name_template: {str(e)}, using {DEFAULT_NAME_TEMPLATE!r}", "warning", "settings")
+    INSTALL_NAME_TEMPLATE = DEFAULT_NAME_TEMPLATE
+
+SKIP_INSTALLED = get_setting('INSTALL', 'skip_installed', "True").lower() == "true"
+
+# Index of setups already in the setups folder, lets known setups skip the download entirely
+installed_index = InstalledSetupsIndex(os.path.join(ADDON_DIR, "installed.sqlite"), get_default_setups_dir())
+
+# Opt-in localhost API the website uses instead of setupmarket:// links ([COMPANION] in settings.ini)
+COMPANION_ENABLED = get_setting('COMPANION', 'enabled', "False").lower() == "true"
+COMPANION_PORT = int(get_setting('COMPANION', 'port', "47597"))
+
+# Setups the website asked to prefetch are downloaded into the cache one by one, at most this many waiting
+prefetch_worker = None
+MAX_PENDING_PREFETCHES = 200
+
+# How acmanager:// commands reach Content Manager: auto, shell, xdg-open, content_manager or record
+LAUNCHER = get_setting('GENERAL', 'launcher', LAUNCHER_AUTO)
+
 # Content Manager paths
 def get_cm_dir():
     return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -27,21 +132,60 @@ def get_cm_dir():
 def get_user_dir():
     return os.path.join(os.path.expanduser("~"), "Documents", "Assetto Corsa", "setups")
 
-def log(message):
+def log(message, level="info", phase=None, **fields):
     """Log a message to a log file in the addon's directory"""
-    log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "setupmarket.log")
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(f"{message}\n")
+    logger.log(message, level, phase, **fields)
+
+def log_trace(record):
+    """Write a finished trace to the log as a single record"""
+    log(f"Trace {record['trace']}: {record['total_ms']} ms", phase="trace", **record)
+
+# Opt-in timing of every phase of handling a link ([LOG] trace in settings.ini), free when off
+tracer = Tracer(emit=log_trace, enabled=get_setting('LOG', 'trace', "False").lower() == "true")
+
+def get_http_session():
+    """Get the keep-alive HTTP session, importing the HTTP stack on first use"""
+    global http_session
+    if http_session is None:
+        with http_session_lock:
+            if http_session is None:
+                with tracer.span("import_requests"):
+                    # requests when it's installed, the standard library client otherwise
+                    from setup_http import create_http_session
+                    session, transport = create_http_session(HTTP_TRANSPORT)
+                http_session = session
+                log(f"HTTP transport: {transport}", level="debug", phase="download")
+    return http_session
+
+def http_get(url, **kwargs):
+    """GET a URL with retries and the circuit breaker, setup files come from the fastest of the configured endpoints"""
+    return endpoint_pool.get(get_http_session().get, url, tracer, retry_policy, **kwargs)
+
+def get_cm_exe_path():
+    """Get the Content Manager executable the addon is installed in"""
+    return os.path.join(get_cm_dir(), "Content Manager.exe")
+
+def create_launcher(name):
+    """Get the configured launcher, picking one automatically if the name is unknown"""
+    try:
+        return get_launcher(name, get_cm_exe_path())
+    except ValueError as e:
+        log(f"{str(e)}, picking one automatically", level="warning", phase="launch")
+        return get_launcher(LAUNCHER_AUTO, get_cm_exe_path())
+
+launcher = create_launcher(LAUNCHER)
 
 def register_url_protocol():
     """Register the setupmarket:// URL protocol with Windows"""
     try:
+        import winreg
+        
         # Get the absolute path to the executable
-        cm_path = os.path.join(get_cm_dir(), "Content Manager.exe")
+        cm_path = get_cm_exe_path()
         
         # Get the path to this script
         script_path = os.path.realpath(__file__)
-        log(f"Script path: {script_path}")
+        log(f"Script path: {script_path}", phase="register")
         
         # Open or create the registry key
         key_path = f"SOFTWARE\\Classes\\{URL_SCHEME}"
@@ -55,200 +199,477 @@ def register_url_protocol():
                 cmd_value = f'"{python_exe}" "{script_path}" "%1"'
                 winreg.SetValue(cmd_key, "", winreg.REG_SZ, cmd_value)
         
-        log(f"Registered URL protocol {URL_SCHEME}:// to run this script")
+        log(f"Registered URL protocol {URL_SCHEME}:// to run this script", phase="register")
         return True
     except Exception as e:
-        log(f"Failed to register URL protocol: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Failed to register URL protocol: {str(e)}", level="error", phase="register")
+        log(traceback.format_exc(), level="error", phase="register")
         return False
 
+def parse_setup_url(url_path):
+    """Get the setup ID from the part of a setupmarket:// URL after the scheme, or None"""
+    with tracer.span("parse_url"):
+        match = SETUP_URL_PATTERN.match(url_path)
+        return match.group(1) if match else None
+
+def launch_command(command):
+    """Hand an acmanager:// command to Content Manager, returns True if the handoff succeeded"""
+    with tracer.span("launch", bytes=len(command)) as span:
+        result = launch(launcher, command)
+        span.add(backend=result.backend, ok=result.ok)
+    launch_ms = round(result.seconds * 1000, 3)
+    if result.ok:
+        log(f"Launched through {result.backend} in {launch_ms} ms", phase="launch", backend=result.backend, launch_ms=launch_ms)
+    else:
+        log(f"Launch through {result.backend} failed: {result.error}", level="error", phase="launch",
+            backend=result.backend, launch_ms=launch_ms)
+    return result.ok
+
+def notify(message):
+    """Tell the user about an outcome that opens nothing, the handler has no window of its own"""
+    log(message, phase="notify")
+    if not show_message(ADDON_NAME, message):
+        log("No way to show a message here", level="debug", phase="notify")
+
+def read_from_pack(setup_id):
+    """Get a setup's content from the local pack, or None if there's no pack or it doesn't have the setup"""
+    if setup_pack is None:
+        return None
+    try:
+        with tracer.span("pack_lookup") as span:
+            content = setup_pack.get(setup_id)
+            span.add(hit=content is not None)
+        return content
+    except Exception as e:
+        log(f"Error reading setup pack: {str(e)}", level="error", phase="download")
+        return None
+
+def find_car_in_pack(car_id):
+    """Get the IDs of a car's setups from the local pack's car index, empty if there's no pack"""
+    if setup_pack is None:
+        return []
+    try:
+        with tracer.span("pack_lookup", car=car_id) as span:
+            setup_ids = setup_pack.find_by_car(car_id)
+            span.add(hit=bool(setup_ids))
+        return setup_ids
+    except Exception as e:
+        log(f"Error reading setup pack: {str(e)}", level="error", phase="bundle")
+        return []
+
 def download_setup_file(setup_id):
     """Download a setup file from Setup Market"""
     try:
-        setup_url = f"{SETUP_FILES_PATH}setup_{setup_id}.ini"
-        log(f"Downloading setup from: {setup_url}")
-        
-        # Download the setup file using requests
-        response = requests.get(setup_url)
-        if response.status_code != 200:
-            log(f"Failed to download setup file. Status code: {response.status_code}")
+        # A local pack from the mirror command is used before going to the network
+        pack_content = read_from_pack(setup_id)
+        if pack_content is not None:
+            setup = parse_setup_text(pack_content, setup_id)
+            log(f"Setup {setup_id} served from pack: {setup_pack.path}", phase="download")
+        elif setup_id in missing_setups:
+            # Got a 404 a moment ago, asking again would only repeat it
+            log(f"Setup {setup_id} was not found recently, not requesting it again yet", level="warning", phase="download")
             return None
+        else:
+            setup_url = f"{SETUP_FILES_PATH}setup_{setup_id}.ini"
+            log(f"Downloading setup from: {setup_url}", phase="download")
             
-        setup_content = response.text
+            # Download the setup file, going through the local cache
+            with tracer.span("download") as span:
+                setup, status_code = fetch_setup_file(setup_cache, setup_id, setup_url, http_get, tracer,
+                                                      DOWNLOAD_TIMEOUT, MAX_SETUP_BYTES, DOWNLOAD_TRANSFER_SECONDS)
+                span.add(status=status_code)
+            if setup is None:
+                if status_code == 404:
+                    missing_setups.add(setup_id)
+                log(f"Failed to download setup file. Status code: {status_code}", level="error", phase="download")
+                return None
+            log(f"Setup {setup_id} served from {'cache' if status_code != 200 else 'network'} (status: {status_code})", phase="download")
             
-        # Extract car ID and track ID from the ini file
-        car_id = None
-        track_id = None
-        
-        # Look for metadata
-        metadata = {}
-        for line in setup_content.split('\n'):
-            if line.startswith(';CM_META:'):
-                key_value = line[9:].split(':', 1)
-                if len(key_value) == 2:
-                    metadata[key_value[0]] = key_value[1]
-        
-        # Try to find car ID in metadata or in the content
-        if 'car' in metadata:
-            car_id = metadata['car']
-        else:
-            car_match = re.search(r'\[CAR\]\s+MODEL=(.+)', setup_content)
-            if car_match:
-                car_id = car_match.group(1).strip()
-        
-        # Try to find track ID in metadata
-        if 'track' in metadata:
-            track_id = metadata['track']
+        # Car ID comes from the metadata or [CAR] MODEL=, track ID only from the metadata
+        car_id = setup.car_id
+        track_id = setup.track_id
         
         if not car_id:
-            log("Could not determine car ID from setup file")
+            log("Could not determine car ID from setup file", level="warning", phase="download")
             return None
         
-        # Prepare metadata for Content Manager
-        setup_metadata = {
-            'car': car_id
-        }
-        
-        if track_id:
-            setup_metadata['track'] = track_id
-        
-        # Add metadata to the setup file
-        metadata_content = ""
-        for key, value in setup_metadata.items():
-            encoded_value = base64.b64encode(value.encode('utf-8')).decode('utf-8')
-            metadata_content += f";CM_META:{key}:{encoded_value}\n"
-        
-        # Combine metadata with the setup content
-        final_setup_content = metadata_content + setup_content
+        with tracer.span("metadata") as span:
+            # Prepare metadata for Content Manager
+            setup_metadata = {
+                'car': car_id
+            }
+            
+            if track_id:
+                setup_metadata['track'] = track_id
+            
+            # Add metadata to the setup file
+            metadata_content = ""
+            for key, value in setup_metadata.items():
+                encoded_value = base64.b64encode(value.encode('utf-8')).decode('utf-8')
+                metadata_content += f";CM_META:{key}:{encoded_value}\n"
+            
+            # Combine metadata with the setup content
+            final_setup_content = metadata_content + setup.content
+            span.add(bytes=len(final_setup_content))
         
         return {
             'content': final_setup_content,
             'car_id': car_id,
             'track_id': track_id,
-            'setup_id': setup_id
+            'setup_id': setup_id,
+            'setup': setup
         }
         
+    except (DownloadRejected, CircuitOpen, OSError) as e:
+        # Expected failures (not a setup, too big, timeouts, network down), no traceback needed; HTTP errors are OSErrors
+        log(f"Download of setup {setup_id} aborted: {str(e)}", level="error", phase="download")
+        return None
     except Exception as e:
-        log(f"Error downloading setup file: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error downloading setup file: {str(e)}", level="error", phase="download")
+        log(traceback.format_exc(), level="error", phase="download")
         return None
 
 def create_cm_shared_command(setup_data):
     """Create a command to open Content Manager with the setup"""
     try:
-        # Encode the setup content to base64
-        setup_content_b64 = base64.b64encode(setup_data['content'].encode('utf-8')).decode('utf-8')
-        
-        # Create the shared entry data
-        shared_data = {
-            'n': f"Setup for {setup_data['car_id']}",  # name
-            't': setup_data['car_id'],  # target (car)
-            'a': "SetupMarket.net",     # author
-            'i': f"setup_{setup_data['setup_id']}.ini",  # id
-            'e': 1,  # entry type (1 = CarSetup)
-            'd': setup_content_b64  # data
-        }
-        
-        # Encode the shared data to JSON then to base64
-        shared_json = json.dumps(shared_data)
-        shared_b64 = base64.b64encode(shared_json.encode('utf-8')).decode('utf-8')
-        
-        # Create the command
-        cmd = f"acmanager://shared?id={shared_b64}"
+        # Compact deflate payload, or the original double base64 one for older Content Manager builds
+        with tracer.span("encode") as span:
+            if COMPACT_SHARED_PAYLOAD:
+                cmd, sizes = encode_compact_command(setup_data)
+            else:
+                cmd, sizes = encode_legacy_command(setup_data)
+            span.add(bytes=sizes['encoded_size'])
+        log(f"Encoded shared payload: {sizes['raw_size']} bytes of setup, {sizes['encoded_size']} bytes of URL",
+            phase="encode", **sizes)
         return cmd
         
     except Exception as e:
-        log(f"Error creating CM shared command: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error creating CM shared command: {str(e)}", level="error", phase="encode")
+        log(traceback.format_exc(), level="error", phase="encode")
         return None
 
+def refresh_installed_index():
+    """Bring the installed setups index up to date if it's stale, waiting for a refresh already under way"""
+    try:
+        updated, removed = installed_index.refresh_if_stale()
+        if updated or removed:
+            log(f"Installed setups index refreshed: {updated} updated, {removed} removed", phase="index")
+    except Exception as e:
+        log(f"Error refreshing installed setups index: {str(e)}", level="error", phase="index")
+        log(traceback.format_exc(), level="error", phase="index")
+
+def start_index_refresh():
+    """Refresh a stale installed setups index on its own thread, so the walk overlaps the downloads"""
+    if not SKIP_INSTALLED:
+        return
+    try:
+        if not installed_index.is_stale():
+            return
+    except Exception as e:
+        log(f"Error checking installed setups index: {str(e)}", level="error", phase="index")
+        return
+    threading.Thread(target=refresh_installed_index, name="setupmarket-index", daemon=True).start()
+
+def find_installed_setup(content):
+    """Get the path of an installed setup with exactly this content, or None
+
+    Only content counts: a setup installed earlier under the same ID may have
+    been updated on the site since, so it's downloaded (or revalidated in the
+    cache) before deciding.
+    """
+    if not SKIP_INSTALLED:
+        return None
+    try:
+        with tracer.span("installed_check"):
+            refresh_installed_index()
+            return installed_index.find_by_content(content)
+    except Exception as e:
+        log(f"Error checking installed setups: {str(e)}", level="error", phase="index")
+        log(traceback.format_exc(), level="error", phase="index")
+        return None
+
+def get_install_mode(url_path):
+    """Get the install mode, a ?install=direct|content_manager query overrides the setting"""
+    query = parse_qs(urlparse(url_path).query)
+    install_mode = query.get('install', [INSTALL_MODE])[0]
+    if install_mode not in (INSTALL_MODE_DIRECT, INSTALL_MODE_CONTENT_MANAGER):
+        log(f"Unknown install mode: {install_mode}", level="warning", phase="install")
+        return INSTALL_MODE
+    return install_mode
+
+def install_setup_directly(setup_data):
+    """Write a downloaded setup straight into the setups folder, returns the path or None"""
+    try:
+        with tracer.span("install", bytes=setup_data['setup'].size):
+            path = install_setup(get_user_dir(), setup_data['setup'], setup_data['setup_id'], INSTALL_NAME_TEMPLATE,
+                                 setup_data['car_id'], setup_data['track_id'])
+        log(f"Installed setup to: {path}", phase="install")
+        installed_index.record(path, setup_data['setup_id'], setup_data['car_id'], setup_data['track_id'],
+                               setup_data['setup'].content)
+        return path
+    except Exception as e:
+        log(f"Error installing setup file: {str(e)}", level="error", phase="install")
+        log(traceback.format_exc(), level="error", phase="install")
+        return None
+
+def get_bundle_setup_ids(url_path):
+    """Get the setup IDs of a bundle/<id>,<id> or car/<car_id> URL, or None for other URLs"""
+    setup_ids = parse_bundle_url(url_path)
+    if setup_ids is not None:
+        return setup_ids
+    
+    car_id = parse_car_url(url_path)
+    if car_id is None:
+        return None
+    try:
+        list_url = get_car_list_url(SETUP_FILES_PATH, car_id)
+        log(f"Fetching setup list for {car_id} from: {list_url}", phase="bundle")
+        response = http_get(list_url, timeout=DOWNLOAD_TIMEOUT)
+        if response.status_code != 200:
+            log(f"Failed to fetch setup list for {car_id}. Status code: {response.status_code}", level="error", phase="bundle")
+        else:
+            return parse_car_list(response.text)
+    except Exception as e:
+        log(f"Error fetching setup list for {car_id}: {str(e)}", level="error", phase="bundle")
+        log(traceback.format_exc(), level="error", phase="bundle")
+    
+    # Offline, the car index of a mirrored pack still knows which setups there are
+    setup_ids = find_car_in_pack(car_id)
+    if setup_ids:
+        log(f"Using {len(setup_ids)} setups for {car_id} from pack: {setup_pack.path}", phase="bundle")
+    return setup_ids
+
+def prepare_bundle_item(setup_id):
+    """Download one setup of a bundle, returns its result record"""
+    setup_data = download_setup_file(setup_id)
+    if not setup_data:
+        return {'id': setup_id, 'status': 'download_failed'}
+    if find_installed_setup(setup_data['setup'].content):
+        return {'id': setup_id, 'status': 'already_installed'}
+    return {'id': setup_id, 'status': 'downloaded', 'setup_data': setup_data}
+
+def process_bundle(setup_ids, url_path):
+    """Install several setups in one pass with a single Content Manager launch, returns True if none failed"""
+    if not setup_ids:
+        log("Bundle has no setups", level="warning", phase="bundle")
+        return False
+    log(f"Processing bundle of {len(setup_ids)} setups: {','.join(setup_ids)}", phase="bundle")
+    # Setups past the limit are reported as skipped instead of dropped
+    setup_ids, skipped = limit_bundle(setup_ids)
+    
+    # Download all setups at once, a failing one doesn't stop the others
+    with tracer.span("bundle_download", setups=len(setup_ids)):
+        results = fetch_bundle(setup_ids, prepare_bundle_item)
+    items = [result if isinstance(result, dict) else {'id': setup_id, 'status': 'error', 'error': str(result)}
+             for setup_id, result in zip(setup_ids, results)]
+    items += skipped
+    ready = [item for item in items if item['status'] == 'downloaded']
+    
+    if get_install_mode(url_path) == INSTALL_MODE_DIRECT:
+        for item in ready:
+            item['status'] = 'installed' if install_setup_directly(item['setup_data']) else 'install_failed'
+    else:
+        encoded = []
+        for item in ready:
+            cm_command = create_cm_shared_command(item['setup_data'])
+            if cm_command:
+                encoded.append((item, cm_command))
+            else:
+                item['status'] = 'encode_failed'
+        
+        # As many setups per Content Manager launch as fit on its command line, usually just one launch
+        for cm_command, indices in combine_shared_commands([cm_command for _, cm_command in encoded]):
+            launched = launch_command(cm_command)
+            for index in indices:
+                encoded[index][0]['status'] = 'sent' if launched else 'launch_failed'
+    
+    failed = 0
+    for item in items:
+        ok = item['status'] in ('installed', 'sent', 'already_installed')
+        failed += not ok
+        reason = f" ({item['reason']})" if 'reason' in item else ""
+        log(f"Bundle setup {item['id']}: {item['status']}{reason}", level="info" if ok else "warning", phase="bundle",
+            setup_id=item['id'], status=item['status'])
+    log(f"Bundle done: {len(items) - failed} of {len(items)} setups succeeded", phase="bundle")
+    
+    # Tell the user about setups that were left out, or why nothing was launched or written
+    installed = sum(1 for item in items if item['status'] == 'already_installed')
+    if skipped:
+        notify(f"{len(skipped)} setups of the link were skipped, {skipped[0]['reason']}")
+    elif installed == len(items):
+        notify(f"All {installed} setups are already installed")
+    return failed == 0
+
+@tracer.traced("process_url")
 def process_url(url):
     """Process a setupmarket:// URL"""
     try:
-        log(f"Processing URL: {url}")
+        log(f"Processing URL: {url}", phase="process")
         
         # Parse the URL to extract setup ID
         if url.startswith(URL_PROTOCOL):
             url_path = url[len(URL_PROTOCOL):]
             
+            # One walk of the setups folder per link at most, while the setups download
+            start_index_refresh()
+            
+            # Bundles install several setups at once: setupmarket://bundle/1,2,3 or setupmarket://car/<car_id>
+            bundle_ids = get_bundle_setup_ids(url_path)
+            if bundle_ids is not None:
+                return process_bundle(bundle_ids, url_path)
+            
             # Parse the URL path to extract the setup ID
-            # Expected format: setupmarket://setup/12345
-            match = re.match(r'setup/(\d+)', url_path)
-            if match:
-                setup_id = match.group(1)
-                log(f"Extracted setup ID: {setup_id}")
+            setup_id = parse_setup_url(url_path)
+            if setup_id:
+                log(f"Extracted setup ID: {setup_id}", phase="process")
                 
                 # Option 1: Download the setup file and create a shared command
                 setup_data = download_setup_file(setup_id)
+                if setup_data:
+                    installed_path = find_installed_setup(setup_data['setup'].content)
+                    if installed_path:
+                        log(f"Identical setup is already installed at: {installed_path}", phase="process")
+                        notify(f"Setup {setup_id} is already installed: {os.path.basename(installed_path)}")
+                        return True
+                
+                # Direct mode writes the setup into the setups folder without involving Content Manager
+                if setup_data and get_install_mode(url_path) == INSTALL_MODE_DIRECT:
+                    if install_setup_directly(setup_data):
+                        return True
+                
                 if setup_data:
                     # Create the CM command
                     cm_command = create_cm_shared_command(setup_data)
                     if cm_command:
-                        log(f"Created CM command: {cm_command}")
+                        log(f"Created CM command: {cm_command}", phase="process")
                         
                         # Execute the command by opening the URL
-                        os.startfile(cm_command)
-                        return True
+                        if launch_command(cm_command):
+                            return True
+                
+                # No point in the fallback when the site just said no or none of the endpoints answers
+                if setup_id in missing_setups or endpoint_pool.all_open(retry_policy.breaker):
+                    log(f"Setup {setup_id} is missing or every endpoint is down, skipping the fallback", level="warning", phase="process")
+                    return False
                 
                 # Option 2: If downloading fails, try the direct acmanager://setup/ format
                 # as a fallback
-                log("Using direct acmanager://setup/ format as fallback")
+                log("Using direct acmanager://setup/ format as fallback", phase="process")
                 direct_command = f"acmanager://setup/{setup_id}"
-                log(f"Launching direct command: {direct_command}")
-                os.startfile(direct_command)
-                return True
+                log(f"Launching direct command: {direct_command}", phase="process")
+                return launch_command(direct_command)
             else:
-                log(f"Could not extract setup ID from URL: {url}")
+                log(f"Could not extract setup ID from URL: {url}", level="warning", phase="process")
         else:
-            log(f"URL does not start with expected protocol: {URL_PROTOCOL}")
+            log(f"URL does not start with expected protocol: {URL_PROTOCOL}", level="warning", phase="process")
         
         return False
     except Exception as e:
-        log(f"Error processing URL: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error processing URL: {str(e)}", level="error", phase="process")
+        log(traceback.format_exc(), level="error", phase="process")
+        return False
+
+def install_from_companion(setup_ids):
+    """Queue setups the website asked to install through the companion API, like a clicked link"""
+    if len(setup_ids) == 1:
+        url = f"{URL_PROTOCOL}setup/{setup_ids[0]}"
+    else:
+        url = f"{URL_PROTOCOL}bundle/{','.join(setup_ids)}"
+    # Goes through the resident socket, so it's handled in order with clicked links
+    return forward_to_resident(url)
+
+def prefetch_setup(setup_id):
+    """Download a setup into the cache ahead of the click, unless it's already installed"""
+    if download_setup_file(setup_id):
+        log(f"Prefetched setup {setup_id}", level="debug", phase="prefetch")
+
+def prefetch_from_companion(setup_ids):
+    """Queue setups the website expects to be clicked soon for prefetching"""
+    global prefetch_worker
+    if prefetch_worker is None:
+        prefetch_worker = BackgroundWorker("setupmarket-prefetch", log=log)
+    if prefetch_worker.pending() + len(setup_ids) > MAX_PENDING_PREFETCHES:
+        log(f"Prefetch queue full, dropping {len(setup_ids)} setups", level="warning", phase="prefetch")
         return False
+    for setup_id in setup_ids:
+        prefetch_worker.submit(prefetch_setup, setup_id)
+    return True
 
-def update_protocol_registration():
+def start_companion():
+    """Serve the companion API next to the resident handler, returns the server or None"""
+    # http.server is only needed here, clicks shouldn't pay for importing it
+    from companion import CompanionServer
+    companion = CompanionServer(install_from_companion, prefetch_from_companion, log, ADDON_VERSION, COMPANION_PORT)
+    return companion if companion.start() else None
+
+@tracer.traced("register")
+def update_protocol_registration(backend=None):
     """Create or update the registry entries for the protocol handler"""
     try:
         # Get path to this script
         script_path = os.path.abspath(__file__)
         python_exe = sys.executable
+        cmd_value = f'"{python_exe}" "{script_path}" "%1"'
         
-        # Create registry entries
-        key_path = f"SOFTWARE\\Classes\\{URL_SCHEME}"
-        with winreg.CreateKey(winreg.HKEY_CURRENT_USER, key_path) as key:
-            winreg.SetValue(key, "", winreg.REG_SZ, "URL:Setup Market Protocol")
-            winreg.SetValueEx(key, "URL Protocol", 0, winreg.REG_SZ, "")
-            
-            # Set the command to run this script
-            with winreg.CreateKey(key, "shell\\open\\command") as cmd_key:
-                cmd_value = f'"{python_exe}" "{script_path}" "%1"'
-                winreg.SetValue(cmd_key, "", winreg.REG_SZ, cmd_value)
-        
-        log(f"Updated protocol registration to use this script directly")
+        # Only touch the registry if the current command differs from ours
+        with tracer.span("registry") as span:
+            written = sync_protocol_registration(backend or protocol_registry, URL_SCHEME, cmd_value)
+            span.add(writes=written)
+        if written:
+            log(f"Updated protocol registration to use this script directly ({written} values written)", phase="register")
         return True
     except Exception as e:
-        log(f"Failed to update protocol registration: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Failed to update protocol registration: {str(e)}", level="error", phase="register")
+        log(traceback.format_exc(), level="error", phase="register")
         return False
 
 def main():
     try:
-        log(f"\n--- {ADDON_NAME} Addon v{ADDON_VERSION} ---")
-        log(f"Args: {sys.argv}")
+        log(f"\n--- {ADDON_NAME} Addon v{ADDON_VERSION} ---", phase="startup")
+        log(f"Args: {sys.argv}", phase="startup")
+        
+        # "--serve" starts the resident handler without a link, to keep it (and the companion API) running
+        serve = len(sys.argv) > 1 and sys.argv[1] == "--serve"
+        url = sys.argv[1] if len(sys.argv) > 1 and not serve else None
+        
+        # Handing the URL to a running resident instance was already tried by the fast path at the top
         
         # Register URL protocol on startup
         update_protocol_registration()
         
-        # If a URL was passed, process it
-        if len(sys.argv) > 1:
-            url = sys.argv[1]
+        if not url and not serve:
+            return
+        
+        # Become the resident instance, unless another one has just started
+        server_socket = open_resident_socket() if RESIDENT_MODE or serve else None
+        if server_socket is None:
+            if not url:
+                log("Resident handler is already running", phase="startup")
+                return
+            if RESIDENT_MODE and forward_to_resident(url):
+                log("Forwarded URL to the resident instance", phase="startup")
+                return
             process_url(url)
+            return
+        
+        # The website can only find a handler that is running, so with the API on it doesn't idle out
+        companion = start_companion() if COMPANION_ENABLED else None
+        idle_seconds = None if companion or serve else RESIDENT_IDLE_SECONDS
+        try:
+            serve_resident(server_socket, process_url, log, initial_url=url, idle_seconds=idle_seconds)
+        finally:
+            if companion:
+                companion.stop()
+            if prefetch_worker:
+                prefetch_worker.stop()
+        if tracer.enabled:
+            log(f"Session timings: {tracer.summary('process_url')}", phase="trace")
+        if len(endpoint_pool.endpoints) > 1:
+            log(f"Endpoints: {endpoint_pool.summary()}", phase="download")
             
     except Exception as e:
-        log(f"Error in main function: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error in main function: {str(e)}", level="error", phase="startup")
+        log(traceback.format_exc(), level="error", phase="startup")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -103,6 +103,22 @@ mkdir "temp\Setup Market Addon\content\fonts"
 
 REM Copy files to the temp directory
 copy "setup_market.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_cache.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_log.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_parser.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "cm_payload.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "background_worker.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_installer.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_index.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_trace.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "launcher.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_bundle.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_pack.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_retry.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_endpoints.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_settings.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_catalogue.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
+copy "setup_http.py" "temp\Setup Market Addon\apps\python\setup_market\" /Y
 copy "settings\settings_defaults.ini" "temp\Setup Market Addon\apps\python\setup_market\settings\" /Y
 copy "settings\settings.ini" "temp\Setup Market Addon\apps\python\setup_market\settings\" /Y
 copy "README.txt" "temp\Setup Market Addon\" /Y
@@ -0,0 +1,76 @@
+try:
+    import winreg
+except ImportError:
+    # Not on Windows, only the in-memory backend is usable
+    winreg = None
+
+ROOT_KEY_PATH = "SOFTWARE\\Classes"
+
+
+class WinregBackend:
+    """Registry access through winreg under HKEY_CURRENT_USER"""
+
+    def get_value(self, key_path, name):
+        """Get a string value, or None if the key or value doesn't exist ("" is the default value)"""
+        try:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path) as key:
+                return winreg.QueryValueEx(key, name)[0]
+        except OSError:
+            return None
+
+    def set_value(self, key_path, name, value):
+        """Create the key if needed and set a string value"""
+        with winreg.CreateKey(winreg.HKEY_CURRENT_USER, key_path) as key:
+            winreg.SetValueEx(key, name, 0, winreg.REG_SZ, value)
+
+
+class MemoryRegistryBackend:
+    """In-memory stand-in for the registry, for tests and benchmarks on any platform"""
+
+    def __init__(self):
+        self.values = {}
+        self.reads = 0
+        self.writes = 0
+
+    def get_value(self, key_path, name):
+        self.reads += 1
+        return self.values.get((key_path.lower(), name.lower()))
+
+    def set_value(self, key_path, name, value):
+        self.writes += 1
+        self.values[(key_path.lower(), name.lower())] = value
+
+
+def get_default_backend():
+    """Get the registry backend for the current platform"""
+    return WinregBackend() if winreg is not None else MemoryRegistryBackend()
+
+
+def get_protocol_values(url_scheme, command):
+    """Get the (key path, value name, value) triples registering a URL protocol"""
+    key_path = f"{ROOT_KEY_PATH}\\{url_scheme}"
+    return [
+        (key_path, "", "URL:Setup Market Protocol"),
+        (key_path, "URL Protocol", ""),
+        (f"{key_path}\\shell\\open\\command", "", command)
+    ]
+
+
+def sync_protocol_registration(backend, url_scheme, command):
+    """Register a URL protocol, writing only the values that differ from the desired ones
+
+    The command value is checked first: if it's already up to date, the
+    registration is assumed to be complete and nothing else is read or written.
+    Returns the number of values written.
+    """
+    values = get_protocol_values(url_scheme, command)
+    command_key_path, command_name, _ = values[-1]
+    if backend.get_value(command_key_path, command_name) == command:
+        return 0
+
+    written = 0
+    for key_path, name, value in values:
+        if backend.get_value(key_path, name) != value:
+            backend.set_value(key_path, name, value)
+            written += 1
+    return written
@@ -0,0 +1,108 @@
+import queue
+import socket
+import threading
+import traceback
+
+# Local endpoint of the resident protocol handler
+RESIDENT_HOST = "127.0.0.1"
+RESIDENT_PORT = 47596
+RESIDENT_IDLE_SECONDS = 15 * 60
+RESIDENT_MAGIC = "SETUPMARKET/1"
+
+FORWARD_TIMEOUT = 2.0
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+def forward_to_resident(url, port=RESIDENT_PORT, timeout=FORWARD_TIMEOUT):
+    """Hand a URL over to an already running resident instance
+
+    Returns True only if the resident instance acknowledged the URL, so the
+    caller can fall back to processing it itself otherwise.
+    """
+    try:
+        with socket.create_connection((RESIDENT_HOST, port), timeout=timeout) as sock:
+            sock.sendall(f"{RESIDENT_MAGIC} {url}\n".encode("utf-8"))
+            return sock.makefile("r", encoding="utf-8").readline().strip() == "OK"
+    except OSError:
+        return False
+
+
+def open_resident_socket(port=RESIDENT_PORT):
+    """Try to become the resident instance, returns a listening socket or None if one is running"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+        # Windows would otherwise let a second process bind the same port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+    try:
+        sock.bind((RESIDENT_HOST, port))
+        sock.listen(16)
+        return sock
+    except OSError:
+        sock.close()
+        return None
+
+
+def _read_message(conn):
+    data = b""
+    while not data.endswith(b"\n") and len(data) < MAX_MESSAGE_SIZE:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode("utf-8", errors="replace").strip()
+
+
+def serve_resident(server_socket, handle_url, log, initial_url=None, idle_seconds=RESIDENT_IDLE_SECONDS):
+    """Accept URLs from later invocations until nothing arrives for idle_seconds (None: until stopped)
+
+    Connections are acknowledged right away and the URLs (starting with
+    initial_url, the one this instance was launched with) are processed one by
+    one on a worker thread, so forwarding clients never wait for a download.
+    """
+    urls = queue.Queue()
+    if initial_url:
+        urls.put(initial_url)
+
+    def worker():
+        while True:
+            url = urls.get()
+            if url is None:
+                break
+            try:
+                handle_url(url)
+            except Exception as e:
+                log(f"Error in resident handler: {str(e)}")
+                log(traceback.format_exc())
+
+    worker_thread = threading.Thread(target=worker, name="setupmarket-resident", daemon=True)
+    worker_thread.start()
+    log(f"Resident handler listening on {RESIDENT_HOST}:{server_socket.getsockname()[1]}")
+
+    server_socket.settimeout(idle_seconds)
+    try:
+        while True:
+            try:
+                conn, _ = server_socket.accept()
+            except socket.timeout:
+                log("Resident handler idle, shutting down")
+                break
+
+            with conn:
+                conn.settimeout(FORWARD_TIMEOUT)
+                try:
+                    message = _read_message(conn)
+                    magic, _, url = message.partition(" ")
+                    if magic != RESIDENT_MAGIC or not url:
+                        log(f"Ignoring unexpected message on resident socket: {message[:100]}")
+                        continue
+                    conn.sendall(b"OK\n")
+                except OSError as e:
+                    log(f"Resident connection failed: {str(e)}")
+                    continue
+
+            log(f"Received URL from another instance: {url}")
+            urls.put(url)
+    finally:
+        server_socket.close()
+        urls.put(None)
+        worker_thread.join()
@@ -0,0 +1,95 @@
+import re
+import json
+
+# Setups of a bundle are fetched concurrently, over the same connection pool
+BUNDLE_WORKERS = 6
+MAX_BUNDLE_SIZE = 50
+
+# setupmarket://bundle/123,456,789 and setupmarket://car/<car_id>
+BUNDLE_URL_PATTERN = re.compile(r'bundle/(\d+(?:,\d+)*),?/?(?:[?#]|$)')
+CAR_URL_PATTERN = re.compile(r'car/([\w.\-]+)/?(?:[?#]|$)')
+
+
+def parse_bundle_url(url_path):
+    """Get the setup IDs of a bundle/<id>,<id>,... URL path without duplicates, or None"""
+    match = BUNDLE_URL_PATTERN.match(url_path)
+    if not match:
+        return None
+    return list(dict.fromkeys(match.group(1).split(",")))
+
+
+def parse_car_url(url_path):
+    """Get the car ID of a car/<car_id> URL path, or None"""
+    match = CAR_URL_PATTERN.match(url_path)
+    return match.group(1) if match else None
+
+
+def get_car_list_url(setup_files_path, car_id):
+    """Get the URL of the list of setups published for a car"""
+    return f"{setup_files_path}car_{car_id}.json"
+
+
+def parse_car_catalogue(data):
+    """Get the entries of a car list as dicts with id, track and score, without duplicates
+
+    The list is either a JSON array or an object with a "setups" array, of IDs
+    or of objects with an "id" and optionally a "track" and "downloads" or
+    "rating". Missing fields are None (track) and 0 (score).
+    """
+    items = json.loads(data)
+    if isinstance(items, dict):
+        items = items.get("setups", [])
+    entries = {}
+    for item in items:
+        if not isinstance(item, dict):
+            item = {'id': item}
+        setup_id = str(item.get("id"))
+        if not setup_id.isdigit() or setup_id in entries:
+            continue
+        score = item.get("downloads", item.get("rating", 0))
+        entries[setup_id] = {'id': setup_id, 'track': item.get("track") or None,
+                             'score': score if isinstance(score, (int, float)) else 0}
+    return list(entries.values())
+
+
+def parse_car_list(data):
+    """Get the setup IDs from a car list, either a JSON array or an object with a "setups" array"""
+    return [entry['id'] for entry in parse_car_catalogue(data)]
+
+
+def limit_bundle(setup_ids, limit=MAX_BUNDLE_SIZE):
+    """Split a bundle into the setup IDs to install and result records for the ones past the limit"""
+    skipped = [{'id': setup_id, 'status': 'skipped', 'reason': f"bundles install at most {limit} setups"}
+               for setup_id in setup_ids[limit:]]
+    return setup_ids[:limit], skipped
+
+
+def pick_top_setups(entries, track_id=None, limit=MAX_BUNDLE_SIZE):
+    """Get the IDs of the highest scored catalogue entries for a track
+
+    Tracks are compared without the layout. Entries for another track are
+    left out, entries for the track go before those that don't name one.
+    """
+    track = track_id.split("/")[0] if track_id else None
+    if track is not None:
+        entries = [e for e in entries if e['track'] is None or e['track'].split("/")[0] == track]
+    # sorted() is stable, equal scores keep the list's order
+    ranked = sorted(entries, key=lambda e: (track is not None and e['track'] is None, -e['score']))
+    return [entry['id'] for entry in ranked[:limit]]
+
+
+def fetch_bundle(setup_ids, fetch_one, workers=BUNDLE_WORKERS):
+    """Call fetch_one for every setup ID concurrently, returns the results in the order of setup_ids
+
+    A failing item doesn't stop the others, its exception is returned as its result.
+    """
+    import concurrent.futures
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(setup_ids)))) as executor:
+        futures = {executor.submit(fetch_one, setup_id): setup_id for setup_id in setup_ids}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    return [results[setup_id] for setup_id in setup_ids]
@@ -0,0 +1,260 @@
+import os
+import json
+import atexit
+import time
+import threading
+from setup_parser import CHUNK_SIZE, looks_like_setup, parse_setup_chunks, parse_setup_text
+from setup_trace import NULL_TRACER
+
+# Default cache limits
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_FRESH_SECONDS = 300
+
+# Default download limits: (connect, read) timeouts, time for the whole body and its size
+DEFAULT_TIMEOUT = (5, 10)
+DEFAULT_TRANSFER_SECONDS = 30
+DEFAULT_MAX_SETUP_BYTES = 1024 * 1024
+
+INDEX_FILE_NAME = "index.json"
+BLOBS_DIR_NAME = "blobs"
+
+
+def get_default_cache_dir():
+    """Get the setup cache directory next to the addon"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+
+def _atomic_write(path, data):
+    """Write bytes to a file through a temporary file and a rename"""
+    import tempfile
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class DownloadRejected(Exception):
+    """A response isn't a setup, or is too big or too slow, raised as soon as that's known"""
+    pass
+
+
+def guard_chunks(chunks, max_bytes=DEFAULT_MAX_SETUP_BYTES, deadline=None):
+    """Pass chunks through, stopping on content that isn't a setup, past max_bytes or past a time.monotonic() deadline"""
+    received = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if received == 0 and not looks_like_setup(chunk):
+            raise DownloadRejected("Response is not a setup file")
+        received += len(chunk)
+        if received > max_bytes:
+            raise DownloadRejected(f"Setup is larger than {max_bytes // 1024} KB")
+        if deadline is not None and time.monotonic() > deadline:
+            raise DownloadRejected("Setup took too long to download")
+        yield chunk
+
+
+def read_setup_response(response, setup_id, max_bytes=DEFAULT_MAX_SETUP_BYTES, transfer_seconds=DEFAULT_TRANSFER_SECONDS):
+    """Parse the streamed body of a 200 response, rejecting it as early as possible"""
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise DownloadRejected(f"Setup is larger than {max_bytes // 1024} KB ({int(length) // 1024} KB)")
+    deadline = time.monotonic() + transfer_seconds if transfer_seconds else None
+    return parse_setup_chunks(guard_chunks(response.iter_content(CHUNK_SIZE), max_bytes, deadline), setup_id)
+
+
+class SetupCache:
+    """Content-addressed on-disk cache of setup files keyed by setup ID
+
+    Setup bodies are stored once per content hash under blobs/, the index maps
+    setup IDs to a hash plus the validators (ETag/Last-Modified) the server
+    sent, and the least recently used entries are evicted once the blobs grow
+    past max_bytes. Cache hits only update the index in memory, it's written
+    on the next store or revalidation and on close(). Safe to share between
+    threads.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, fresh_seconds=DEFAULT_FRESH_SECONDS):
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.blobs_dir = os.path.join(self.cache_dir, BLOBS_DIR_NAME)
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILE_NAME)
+        self._index = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        atexit.register(self.close)
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f).get("setups", {})
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data = json.dumps({"setups": self._load_index()}, separators=(",", ":"))
+        _atomic_write(self.index_path, data.encode("utf-8"))
+        self._dirty = False
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blobs_dir, f"{content_hash}.ini")
+
+    def lookup(self, setup_id):
+        """Get the index entry for a setup ID, or None if it isn't cached"""
+        with self._lock:
+            entry = self._load_index().get(str(setup_id))
+            if entry and not os.path.isfile(self._blob_path(entry["hash"])):
+                # Blob was removed behind our back, forget the entry
+                del self._index[str(setup_id)]
+                return None
+            return entry
+
+    def is_fresh(self, entry):
+        """Check if an entry was validated recently enough to skip the network"""
+        return entry is not None and time.time() - entry.get("validated", 0) < self.fresh_seconds
+
+    def conditional_headers(self, entry):
+        """Build If-None-Match/If-Modified-Since headers for an entry"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read(self, setup_id):
+        """Read the cached setup content and mark it as recently used"""
+        with self._lock:
+            entry = self.lookup(setup_id)
+            if not entry:
+                return None
+            with open(self._blob_path(entry["hash"]), "r", encoding="utf-8", newline="") as f:
+                content = f.read()
+            # Persisted with the next write of the index, not on every hit
+            entry["used"] = time.time()
+            self._dirty = True
+            return content
+
+    def mark_validated(self, setup_id):
+        """Record that the server confirmed the cached copy is still current (HTTP 304)"""
+        with self._lock:
+            entry = self.lookup(setup_id)
+            if entry:
+                entry["validated"] = entry["used"] = time.time()
+                self._save_index()
+
+    def store(self, setup_id, content, etag=None, last_modified=None):
+        """Store a freshly downloaded setup and evict old entries if needed"""
+        with self._lock:
+            data = content.encode("utf-8")
+            import hashlib
+            content_hash = hashlib.sha256(data).hexdigest()
+            os.makedirs(self.blobs_dir, exist_ok=True)
+            blob_path = self._blob_path(content_hash)
+            if not os.path.isfile(blob_path):
+                _atomic_write(blob_path, data)
+
+            now = time.time()
+            self._load_index()[str(setup_id)] = {
+                "hash": content_hash,
+                "size": len(data),
+                "etag": etag,
+                "last_modified": last_modified,
+                "validated": now,
+                "used": now
+            }
+            self.evict()
+            self._save_index()
+
+    def close(self):
+        """Write the usage times of cache hits since the last write of the index"""
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                self._save_index()
+            except OSError:
+                pass
+
+    def evict(self):
+        """Drop least recently used entries until the blobs fit into max_bytes"""
+        with self._lock:
+            index = self._load_index()
+
+            # Blobs are shared between IDs with identical content, so count each hash once
+            blob_sizes = {}
+            for entry in index.values():
+                blob_sizes[entry["hash"]] = entry["size"]
+            total_size = sum(blob_sizes.values())
+
+            for setup_id, entry in sorted(index.items(), key=lambda item: item[1].get("used", 0)):
+                if total_size <= self.max_bytes:
+                    break
+                del index[setup_id]
+                if not any(other["hash"] == entry["hash"] for other in index.values()):
+                    total_size -= entry["size"]
+                    try:
+                        os.remove(self._blob_path(entry["hash"]))
+                    except OSError:
+                        pass
+
+
+def fetch_setup_file(cache, setup_id, setup_url, http_get, tracer=NULL_TRACER, timeout=DEFAULT_TIMEOUT,
+                     max_bytes=DEFAULT_MAX_SETUP_BYTES, transfer_seconds=DEFAULT_TRANSFER_SECONDS):
+    """Get a parsed setup through the cache, revalidating it with the server when stale
+
+    The response body is streamed straight into the parser. Returns a
+    (SetupFile, status_code) tuple: status_code is None when the cached copy
+    was fresh enough to skip the network, 304 when the server confirmed it,
+    and the server's status otherwise; the setup is None on failure. A body
+    that isn't a setup, is bigger than max_bytes or takes longer than
+    transfer_seconds raises DownloadRejected and isn't cached.
+    """
+    with tracer.span("cache_lookup") as span:
+        entry = cache.lookup(setup_id)
+        if cache.is_fresh(entry):
+            content = cache.read(setup_id)
+            if content is not None:
+                span.add(hit=True, bytes=len(content))
+                return parse_setup_text(content, setup_id), None
+            # Evicted since the lookup, download it in full
+            entry = None
+
+    # Covers DNS, connect, TLS and the server's response time, up to the headers
+    with tracer.span("request") as span:
+        response = http_get(setup_url, headers=cache.conditional_headers(entry), stream=True, timeout=timeout)
+        span.add(status=response.status_code)
+    try:
+        if response.status_code == 304 and entry:
+            cache.mark_validated(setup_id)
+            content = cache.read(setup_id)
+            if content is not None:
+                return parse_setup_text(content, setup_id), 304
+            # Evicted since the lookup, so the 304 is no use: ask again without validators
+            response.close()
+            with tracer.span("request") as span:
+                response = http_get(setup_url, stream=True, timeout=timeout)
+                span.add(status=response.status_code)
+        if response.status_code != 200:
+            return None, response.status_code
+
+        # Body download, parsed while it streams in
+        with tracer.span("transfer") as span:
+            setup = read_setup_response(response, setup_id, max_bytes, transfer_seconds)
+            span.add(bytes=setup.size)
+    finally:
+        response.close()
+
+    with tracer.span("cache_store"):
+        cache.store(setup_id, setup.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return setup, 200
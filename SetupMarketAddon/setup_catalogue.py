@@ -0,0 +1,273 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+from urllib.parse import quote
+
+# Entries per request to the catalogue endpoint, and a bound on the requests of one sync
+CATALOGUE_PAGE_SIZE = 500
+MAX_SYNC_PAGES = 1000
+
+DEFAULT_SYNC_SECONDS = 60 * 60
+DEFAULT_SEARCH_LIMIT = 50
+
+# Fields a query can filter on: gt3 track:spa author:"John Doe" tag:wet
+QUERY_FIELDS = ("car", "track", "author", "tag")
+QUERY_FIELD = re.compile(r'(\w+):("[^"]*"|\S+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogue (
+    setup_id INTEGER PRIMARY KEY,
+    car TEXT NOT NULL,
+    track TEXT,
+    author TEXT,
+    lap_time_ms INTEGER,
+    date TEXT,
+    updated REAL NOT NULL,
+    tags TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS catalogue_car_track ON catalogue (car, track);
+CREATE INDEX IF NOT EXISTS catalogue_author ON catalogue (author COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Full-text index over the catalogue table, kept in step by triggers; needs SQLite built with FTS5
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS catalogue_fts USING fts5(
+    car, track, author, tags, content='catalogue', content_rowid='setup_id'
+);
+CREATE TRIGGER IF NOT EXISTS catalogue_fts_insert AFTER INSERT ON catalogue BEGIN
+    INSERT INTO catalogue_fts (rowid, car, track, author, tags)
+    VALUES (new.setup_id, new.car, new.track, new.author, new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS catalogue_fts_delete AFTER DELETE ON catalogue BEGIN
+    INSERT INTO catalogue_fts (catalogue_fts, rowid, car, track, author, tags)
+    VALUES ('delete', old.setup_id, old.car, old.track, old.author, old.tags);
+END;
+"""
+
+
+class CatalogueSyncFailed(Exception):
+    """The catalogue endpoint didn't answer with a catalogue page"""
+    pass
+
+
+def parse_query(text):
+    """Split a query into free-text terms and field filters, e.g. 'gt3 track:spa author:"John Doe"'"""
+    filters = {}
+
+    def take_filter(match):
+        field = match.group(1).lower()
+        if field not in QUERY_FIELDS:
+            return match.group(0)
+        filters[field] = match.group(2).strip('"')
+        return " "
+
+    terms = QUERY_FIELD.sub(take_filter, text or "").split()
+    return terms, filters
+
+
+def parse_catalogue_entry(item):
+    """Get a catalogue row from an entry of the endpoint, or None if it isn't usable
+
+    Entries have an "id", "car" and "updated" (Unix time), and optionally a
+    "track", "author", "lap_time" (milliseconds), "date" and "tags".
+    """
+    if not isinstance(item, dict):
+        return None
+    setup_id = str(item.get("id", ""))
+    car = item.get("car")
+    updated = item.get("updated")
+    if not setup_id.isdigit() or not isinstance(car, str) or not car or not isinstance(updated, (int, float)):
+        return None
+    lap_time = item.get("lap_time")
+    tags = item.get("tags") or []
+    return (int(setup_id), car, item.get("track") or None, item.get("author") or None,
+            int(lap_time) if isinstance(lap_time, (int, float)) and lap_time > 0 else None,
+            item.get("date") or None, float(updated),
+            " ".join(str(tag).strip().lower() for tag in tags if str(tag).strip()) if isinstance(tags, list) else "")
+
+
+def format_lap_time(lap_time_ms):
+    """Format a lap time like AC does, 1:58.321"""
+    if lap_time_ms is None:
+        return "-"
+    minutes, milliseconds = divmod(lap_time_ms, 60000)
+    return f"{minutes}:{milliseconds // 1000:02d}.{milliseconds % 1000:03d}"
+
+
+def format_entry(entry):
+    """One line describing a search result"""
+    where = f"{entry['car']} @ {entry['track']}" if entry['track'] else entry['car']
+    by = f" by {entry['author']}" if entry['author'] else ""
+    tags = f" [{', '.join(entry['tags'])}]" if entry['tags'] else ""
+    return f"{entry['setup_id']}: {where}{by}, {format_lap_time(entry['lap_time_ms'])}{tags}"
+
+
+class SetupCatalogue:
+    """Local SQLite copy of the setup catalogue for offline search
+
+    Synced incrementally: every request asks the catalogue endpoint for the
+    entries changed after a cursor, and the cursor is stored in the same
+    transaction as the page, so an interrupted sync continues where it
+    stopped. Searches use the FTS5 index when SQLite has it and fall back to
+    LIKE otherwise.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.has_fts = False
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+            try:
+                self._connection.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # No FTS5 in this SQLite build, searches scan the table instead
+                self.has_fts = False
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _get_state(self, key, default=None):
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def get_cursor(self):
+        """Get the cursor to continue syncing from, "0" before the first sync"""
+        return self._get_state("cursor", "0")
+
+    def count(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM catalogue").fetchone()[0]
+
+    def apply_page(self, items, cursor):
+        """Store a page of catalogue entries and the cursor after it, returns (updated, removed) counts"""
+        rows = []
+        removed = []
+        for item in items:
+            if isinstance(item, dict) and item.get("deleted") and str(item.get("id", "")).isdigit():
+                removed.append(int(item["id"]))
+                continue
+            row = parse_catalogue_entry(item)
+            if row is not None:
+                rows.append(row)
+
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                # Delete and insert rather than INSERT OR REPLACE, which skips the FTS delete trigger
+                connection.executemany("DELETE FROM catalogue WHERE setup_id = ?",
+                                       [(setup_id,) for setup_id in removed] + [(row[0],) for row in rows])
+                connection.executemany("INSERT INTO catalogue VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                connection.execute("INSERT OR REPLACE INTO state VALUES ('cursor', ?)", (str(cursor),))
+        return len(rows), len(removed)
+
+    def sync(self, http_get, url, page_size=CATALOGUE_PAGE_SIZE, **kwargs):
+        """Fetch the entries changed since the last sync from the catalogue endpoint
+
+        The endpoint answers GET url?since=<cursor>&limit=<n> with
+        {"setups": [...], "cursor": "...", "more": true/false}; without a
+        "cursor" the highest "updated" of the page is used. Returns
+        (updated, removed) counts, raises CatalogueSyncFailed or the error of
+        http_get.
+        """
+        updated = removed = 0
+        cursor = self.get_cursor()
+        separator = "&" if "?" in url else "?"
+        for _ in range(MAX_SYNC_PAGES):
+            response = http_get(f"{url}{separator}since={quote(cursor)}&limit={page_size}", **kwargs)
+            if response.status_code != 200:
+                raise CatalogueSyncFailed(f"catalogue endpoint answered HTTP {response.status_code}")
+            try:
+                page = json.loads(response.text)
+                items = page["setups"]
+            except (ValueError, KeyError, TypeError):
+                raise CatalogueSyncFailed("catalogue endpoint didn't answer with a catalogue page") from None
+            if not isinstance(items, list):
+                raise CatalogueSyncFailed("catalogue endpoint didn't answer with a catalogue page")
+
+            stamps = [item["updated"] for item in items if isinstance(item, dict) and isinstance(item.get("updated"), (int, float))]
+            next_cursor = str(page.get("cursor") or (max(stamps) if stamps else cursor))
+            page_updated, page_removed = self.apply_page(items, next_cursor)
+            updated += page_updated
+            removed += page_removed
+
+            # A cursor that doesn't move would ask for the same page forever
+            if not page.get("more") or not items or next_cursor == cursor:
+                break
+            cursor = next_cursor
+
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO state VALUES ('synced', ?)", (str(time.time()),))
+        return updated, removed
+
+    def sync_if_stale(self, http_get, url, max_age=DEFAULT_SYNC_SECONDS, **kwargs):
+        """Sync if the last sync is older than max_age seconds, returns (updated, removed) counts"""
+        synced = float(self._get_state("synced", "0"))
+        if time.time() - synced <= max_age:
+            return 0, 0
+        return self.sync(http_get, url, **kwargs)
+
+    def search(self, query="", limit=DEFAULT_SEARCH_LIMIT, **filters):
+        """Find setups for a query and filters (car, track, author, tag), fastest lap first
+
+        Free-text terms match the start of words in the car, track, author and
+        tags, so "gt3" finds ks_ferrari_488_gt3. The track filter matches all
+        layouts of a track; all filters ignore case.
+        """
+        terms, query_filters = parse_query(query)
+        query_filters.update({field: value for field, value in filters.items() if value})
+
+        conditions = []
+        parameters = []
+        with self._lock:
+            connection = self._connect()
+            if terms and self.has_fts:
+                # Every term quoted, so user input can't use FTS syntax, and as a prefix
+                match = " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+                conditions.append("setup_id IN (SELECT rowid FROM catalogue_fts WHERE catalogue_fts MATCH ?)")
+                parameters.append(match)
+            else:
+                for term in terms:
+                    conditions.append("(car LIKE ? OR track LIKE ? OR author LIKE ? OR tags LIKE ?)")
+                    parameters.extend([f"%{term}%"] * 4)
+
+            if query_filters.get("car"):
+                conditions.append("car = ? COLLATE NOCASE")
+                parameters.append(query_filters["car"])
+            if query_filters.get("track"):
+                track = query_filters["track"].split("/")[0]
+                pattern = track.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%"
+                conditions.append("(track = ? COLLATE NOCASE OR track LIKE ? ESCAPE '\\')")
+                parameters.extend([track, pattern])
+            if query_filters.get("author"):
+                conditions.append("author = ? COLLATE NOCASE")
+                parameters.append(query_filters["author"])
+            if query_filters.get("tag"):
+                conditions.append("(' ' || tags || ' ') LIKE ?")
+                parameters.append(f"% {query_filters['tag'].lower()} %")
+
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = connection.execute(
+                f"SELECT setup_id, car, track, author, lap_time_ms, date, tags FROM catalogue {where} "
+                f"ORDER BY lap_time_ms IS NULL, lap_time_ms, date DESC LIMIT ?", parameters + [limit]).fetchall()
+
+        return [{'setup_id': str(row[0]), 'car': row[1], 'track': row[2], 'author': row[3], 'lap_time_ms': row[4],
+                 'date': row[5], 'tags': row[6].split()} for row in rows]
@@ -0,0 +1,203 @@
+import time
+import threading
+from collections import deque
+from urllib.parse import urlparse
+from setup_trace import NULL_TRACER
+from setup_retry import is_retryable_status
+
+# Weight of a new latency sample in the moving average
+DEFAULT_ALPHA = 0.3
+
+# Latency counted for a failed request, so a failing endpoint drops behind the working ones (seconds)
+FAILURE_PENALTY = 10.0
+
+# Recent latencies kept per endpoint for the hedging delay, and how many are needed before using them
+LATENCY_SAMPLES = 50
+MIN_HEDGE_SAMPLES = 5
+
+# Hedging delay until an endpoint has enough samples (seconds)
+DEFAULT_HEDGE_DELAY = 1.0
+
+# Every this many requests the runner-up is used instead, so its estimate doesn't go stale
+EXPLORE_EVERY = 20
+
+
+class Endpoint:
+    """Base URL of a copy of the setup files with its latency estimate"""
+
+    __slots__ = ("base_url", "ewma", "samples", "requests", "failures")
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.ewma = None
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.failures = 0
+
+    def p90(self):
+        """90th percentile of the recent latencies, or None with too few samples"""
+        if len(self.samples) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+
+class EndpointPool:
+    """Equivalent endpoints for the setup files, fastest first
+
+    URLs below primary_url are sent to the endpoint with the lowest moving
+    average of its time to response headers; endpoints without measurements
+    go first so each gets measured. A network error, a server error or a 404
+    from an endpoint other than primary_url (a mirror that hasn't caught up)
+    moves on to the next endpoint right away. With a retry policy, only a
+    round in which every endpoint failed is retried, after its backoff, so a
+    dead endpoint costs a single attempt. With hedging, a second request goes to the runner-up
+    when the first hasn't answered within the p90 latency of its endpoint,
+    and whichever answers first is used. Other URLs are fetched unchanged.
+    concurrency is how many threads may request at once (a bundle's workers),
+    hedging keeps room for a request and its hedge from each of them.
+    """
+
+    def __init__(self, primary_url, base_urls=None, hedge=False, alpha=DEFAULT_ALPHA, hedge_delay=DEFAULT_HEDGE_DELAY,
+                 concurrency=1):
+        self.primary_url = primary_url
+        self.endpoints = [Endpoint(base_url) for base_url in (base_urls or [primary_url])]
+        self.hedge = hedge and len(self.endpoints) > 1
+        self.alpha = alpha
+        self.hedge_delay = hedge_delay
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._count = 0
+        self._executor = None
+
+    def ranked(self):
+        """Get the endpoints in the order they should be tried"""
+        with self._lock:
+            self._count += 1
+            ranked = sorted(self.endpoints, key=lambda e: -1.0 if e.ewma is None else e.ewma)
+            if len(ranked) > 1 and self._count % EXPLORE_EVERY == 0:
+                ranked[0], ranked[1] = ranked[1], ranked[0]
+            return ranked
+
+    def record(self, endpoint, seconds, ok):
+        """Update an endpoint's estimate with a request's latency, or the failure penalty"""
+        with self._lock:
+            endpoint.requests += 1
+            if ok:
+                endpoint.samples.append(seconds)
+            else:
+                endpoint.failures += 1
+                seconds = max(seconds, FAILURE_PENALTY)
+            endpoint.ewma = seconds if endpoint.ewma is None else endpoint.ewma + self.alpha * (seconds - endpoint.ewma)
+
+    def all_open(self, breaker):
+        """Check if a circuit breaker is skipping the host of every endpoint"""
+        return all(breaker.is_open(urlparse(e.base_url).netloc) for e in self.endpoints)
+
+    def summary(self):
+        """Get a short description of every endpoint's estimate, for the log"""
+        with self._lock:
+            return ", ".join(f"{e.base_url} {'-' if e.ewma is None else f'{e.ewma * 1000:.0f} ms'} ({e.requests} requests, "
+                             f"{e.failures} failed)" for e in self.endpoints)
+
+    def _request(self, http_get, endpoint, path, kwargs):
+        """Get a path from one endpoint, returns the response or raises; server errors count as failures"""
+        started = time.perf_counter()
+        try:
+            response = http_get(endpoint.base_url + path, **kwargs)
+        except Exception:
+            self.record(endpoint, time.perf_counter() - started, False)
+            raise
+        self.record(endpoint, time.perf_counter() - started, response.status_code < 500)
+        return response
+
+    def _hedged(self, http_get, first, second, path, kwargs):
+        """Race a request to first against one to second that starts after first's p90, returns (response, endpoint)"""
+        import concurrent.futures
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # A hedged request and its backup for every thread that can request at once
+                    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=2 * self.concurrency,
+                                                                           thread_name_prefix="hedge")
+        delay = first.p90() or self.hedge_delay
+        futures = {self._executor.submit(self._request, http_get, first, path, kwargs): first}
+        done, _ = concurrent.futures.wait(futures, timeout=delay)
+        if not done:
+            futures[self._executor.submit(self._request, http_get, second, path, kwargs)] = second
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                response = future.result()
+                if response.status_code >= 500 and pending:
+                    response.close()
+                    continue
+                # The slower request is dropped once it's done
+                for other in pending:
+                    other.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                return response, futures[future]
+        raise error
+
+    def _try_endpoints(self, http_get, ranked, path, tracer, kwargs):
+        """Try every endpoint at most once, returns the first usable response or raises the last error"""
+        with tracer.span("endpoint") as span:
+            error = None
+            kept = None
+            for position, endpoint in enumerate(ranked):
+                try:
+                    if self.hedge and position + 1 < len(ranked):
+                        response, endpoint = self._hedged(http_get, endpoint, ranked[position + 1], path, kwargs)
+                    else:
+                        response = self._request(http_get, endpoint, path, kwargs)
+                except Exception as e:
+                    error = e
+                    continue
+                span.add(endpoint=endpoint.base_url, tried=position + 1)
+                # A mirror can lag behind the website, only the website's 404 is final
+                try_next = response.status_code >= 500 or (response.status_code == 404 and endpoint.base_url != self.primary_url)
+                if kept is not None:
+                    kept.close()
+                if not try_next:
+                    return response
+                # Returned if no other endpoint does better
+                kept = response
+            if kept is not None:
+                return kept
+            raise error
+
+    def get(self, http_get, url, tracer=NULL_TRACER, retry_policy=None, **kwargs):
+        """Get a URL through http_get, from the fastest endpoint if it's below primary_url
+
+        http_get makes a single request. With a retry_policy, every request
+        goes through its circuit breaker and failed rounds are retried.
+        """
+        if not url.startswith(self.primary_url):
+            if retry_policy is not None:
+                return retry_policy.get(http_get, url, tracer, **kwargs)
+            return http_get(url, **kwargs)
+        path = url[len(self.primary_url):]
+        if retry_policy is None:
+            return self._try_endpoints(http_get, self.ranked(), path, tracer, kwargs)
+
+        def attempt_get(endpoint_url, **endpoint_kwargs):
+            return retry_policy.attempt(http_get, endpoint_url, **endpoint_kwargs)
+
+        for attempt in range(retry_policy.attempts):
+            last_attempt = attempt == retry_policy.attempts - 1
+            try:
+                response = self._try_endpoints(attempt_get, self.ranked(), path, tracer, kwargs)
+            except retry_policy.retry_exceptions:
+                if last_attempt:
+                    raise
+                response = None
+            else:
+                if not is_retryable_status(response.status_code) or last_attempt:
+                    return response
+                response.close()
+            retry_policy.wait(attempt, response, tracer)
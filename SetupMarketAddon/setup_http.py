@@ -0,0 +1,254 @@
+import zlib
+import threading
+import http.client
+from urllib.parse import urlsplit, urljoin
+
+# Transports: requests' Session, or the standard library client below that needs no extra packages
+TRANSPORT_AUTO = "auto"
+TRANSPORT_STDLIB = "stdlib"
+TRANSPORT_REQUESTS = "requests"
+
+# Idle keep-alive connections kept per host, and redirects followed per request
+MAX_IDLE_CONNECTIONS = 4
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+DEFAULT_TIMEOUT = 30
+CHUNK_SIZE = 16 * 1024
+
+# Unread bodies up to this size (404 pages, redirects) are read on close() so the connection can be reused
+DRAIN_LIMIT = 64 * 1024
+USER_AGENT = "SetupMarket/1.0"
+
+
+class HTTPTransportError(OSError):
+    """A request failed in the HTTP layer (bad status line, too many redirects, broken gzip)
+
+    An OSError like network errors and requests' exceptions, so callers can
+    catch and retry all of them the same way.
+    """
+    pass
+
+
+def split_timeout(timeout):
+    """Get (connect, read) seconds from a requests-style timeout: a number, a pair or None"""
+    if isinstance(timeout, (tuple, list)):
+        return timeout[0], timeout[1]
+    return timeout, timeout
+
+
+class Response:
+    """Response of StdlibSession.get with the parts of requests' Response the addon uses
+
+    The body is read lazily; once it has been read to the end the connection
+    goes back to the session for the next request, close() before that drops it.
+    """
+
+    def __init__(self, session, key, connection, response, url):
+        self.url = url
+        self.status_code = response.status
+        self.reason = response.reason
+        # http.client's headers look names up regardless of case, like requests'
+        self.headers = response.msg
+        self._session = session
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self._content = None
+        gzipped = (self.headers.get("Content-Encoding") or "").lower() == "gzip"
+        self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        """Yield the body in chunks as it arrives, decompressed"""
+        if self._content is not None:
+            yield self._content
+            return
+        try:
+            while True:
+                chunk = self._response.read(chunk_size)
+                if not chunk:
+                    break
+                if self._decoder is None:
+                    yield chunk
+                    continue
+                # Decompressed in chunk_size pieces, so a gzip bomb can't balloon a single chunk
+                data = self._decoder.decompress(chunk, chunk_size)
+                while data:
+                    yield data
+                    tail = self._decoder.unconsumed_tail
+                    data = self._decoder.decompress(tail, chunk_size) if tail else b""
+            if self._decoder is not None:
+                tail = self._decoder.flush()
+                if tail:
+                    yield tail
+        except (http.client.HTTPException, zlib.error) as e:
+            self.close()
+            raise HTTPTransportError(f"reading {self.url} failed: {str(e)}") from e
+        except BaseException:
+            # Includes the consumer giving up on the generator half way
+            self.close()
+            raise
+        self._release()
+
+    @property
+    def content(self):
+        """The whole body, read on first use"""
+        if self._content is None:
+            self._content = b"".join(self.iter_content())
+        return self._content
+
+    @property
+    def text(self):
+        content_type = self.headers.get("Content-Type") or ""
+        charset = "utf-8"
+        for parameter in content_type.split(";")[1:]:
+            name, _, value = parameter.strip().partition("=")
+            if name.lower() == "charset" and value:
+                charset = value.strip('"')
+        try:
+            return self.content.decode(charset, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+    def _release(self):
+        """Hand the connection back once the body has been read"""
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        if self._response.will_close:
+            connection.close()
+        else:
+            self._session._put_connection(self._key, connection)
+
+    def close(self):
+        """Give up on the rest of the body; small bodies are read so the connection is kept, otherwise it's dropped"""
+        if self._connection is None:
+            return
+        remaining = self._response.length
+        if not self._response.will_close and remaining is not None and remaining <= DRAIN_LIMIT:
+            try:
+                self._response.read()
+            except (OSError, http.client.HTTPException):
+                pass
+            else:
+                self._release()
+                return
+        connection, self._connection = self._connection, None
+        connection.close()
+
+
+class StdlibSession:
+    """Small keep-alive HTTP client on http.client, usable where requests isn't available
+
+    Covers what the addon needs from requests.Session.get: connection reuse per
+    host, (connect, read) timeouts, extra headers, streamed bodies, redirects
+    and optional gzip. Safe to use from several threads.
+    """
+
+    def __init__(self, gzip=True, max_idle=MAX_IDLE_CONNECTIONS, user_agent=USER_AGENT):
+        self.gzip = gzip
+        self.max_idle = max_idle
+        self.user_agent = user_agent
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = None
+
+    def _get_ssl_context(self):
+        if self._ssl_context is None:
+            # ssl is only imported for the first https request
+            import ssl
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _new_connection(self, key, connect_timeout):
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=connect_timeout, context=self._get_ssl_context())
+        return http.client.HTTPConnection(host, port, timeout=connect_timeout)
+
+    def _take_connection(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def _put_connection(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _send(self, connection, target, headers, read_timeout):
+        try:
+            connection.request("GET", target, headers=headers)
+            if connection.sock is not None:
+                # The connect timeout applied to connecting, from now on the read timeout applies
+                connection.sock.settimeout(read_timeout)
+            return connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+
+    def _request(self, url, headers, timeout):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise HTTPTransportError(f"unsupported URL: {url}")
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        connect_timeout, read_timeout = split_timeout(timeout)
+
+        try:
+            connection = self._take_connection(key)
+            if connection is not None:
+                try:
+                    return key, connection, self._send(connection, target, headers, read_timeout)
+                except (http.client.RemoteDisconnected, ConnectionError, http.client.CannotSendRequest):
+                    # The server closed the idle connection in the meantime, a new one will do
+                    pass
+
+            connection = self._new_connection(key, connect_timeout)
+            return key, connection, self._send(connection, target, headers, read_timeout)
+        except http.client.HTTPException as e:
+            raise HTTPTransportError(f"request to {url} failed: {str(e)}") from e
+
+    def get(self, url, headers=None, timeout=DEFAULT_TIMEOUT, stream=False, allow_redirects=True):
+        """GET a URL, returns a Response; the body is read right away unless stream is set"""
+        request_headers = {'User-Agent': self.user_agent, 'Accept-Encoding': "gzip" if self.gzip else "identity"}
+        request_headers.update(headers or {})
+
+        for _ in range(MAX_REDIRECTS + 1):
+            key, connection, raw = self._request(url, request_headers, timeout)
+            response = Response(self, key, connection, raw, url)
+            location = response.headers.get("Location")
+            if not stream or (allow_redirects and response.status_code in REDIRECT_STATUSES and location):
+                # Reading the body to the end frees the connection for the next request
+                response.content
+            if not allow_redirects or response.status_code not in REDIRECT_STATUSES or not location:
+                return response
+            # Only GETs are made, so every redirect is followed with a GET
+            url = urljoin(url, location)
+        raise HTTPTransportError(f"more than {MAX_REDIRECTS} redirects for {url}")
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+def create_http_session(transport=TRANSPORT_AUTO, auto=TRANSPORT_REQUESTS):
+    """Get a session for the transport, auto picks the given one; requests falls back to stdlib if it's missing
+
+    Returns (session, name of the transport used).
+    """
+    if transport not in (TRANSPORT_STDLIB, TRANSPORT_REQUESTS):
+        transport = auto
+    if transport == TRANSPORT_REQUESTS:
+        try:
+            import requests
+            return requests.Session(), TRANSPORT_REQUESTS
+        except ImportError:
+            pass
+    return StdlibSession(), TRANSPORT_STDLIB
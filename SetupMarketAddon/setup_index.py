@@ -0,0 +1,180 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+
+from setup_installer import GENERIC_DIRECTORY
+
+DEFAULT_REFRESH_SECONDS = 10 * 60
+WALK_WORKERS = 8
+
+# File names that carry a Setup Market ID: setup_<id>.ini from the website, setupmarket_<id>.ini from direct installs
+SETUP_ID_FILE_NAME = re.compile(r'^setup(?:market)?_(\d+)(?:\D.*)?\.ini$', re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS setups (
+    path TEXT PRIMARY KEY,
+    setup_id TEXT,
+    car TEXT NOT NULL,
+    track TEXT,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS setups_setup_id ON setups (setup_id);
+CREATE INDEX IF NOT EXISTS setups_hash ON setups (hash);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def get_content_hash(content):
+    """Hash of a setup that ignores whitespace, comments and CM metadata lines"""
+    lines = []
+    for line in content.split("\n"):
+        line = line.strip()
+        if not line or line[0] in ";#":
+            continue
+        if "=" in line and line[0] != "[":
+            key, value = line.split("=", 1)
+            line = f"{key.strip()}={value.strip()}"
+        lines.append(line)
+    import hashlib
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def _scan_car_directory(car_path):
+    """List (path, size, mtime) of every setup below a car directory"""
+    found = []
+    stack = [car_path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(".ini"):
+                        stat = entry.stat()
+                        found.append((entry.path, stat.st_size, stat.st_mtime))
+        except OSError:
+            pass
+    return found
+
+
+def _read_setup_record(setups_dir, path, size, mtime):
+    """Build an index row for a setup file, or None if it can't be read"""
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            content_hash = get_content_hash(f.read())
+    except OSError:
+        return None
+
+    parts = os.path.relpath(path, setups_dir).split(os.sep)
+    car = parts[0]
+    track = parts[1] if len(parts) > 2 and parts[1] != GENERIC_DIRECTORY else None
+    match = SETUP_ID_FILE_NAME.match(parts[-1])
+    return (path, match.group(1) if match else None, car, track, size, mtime, content_hash)
+
+
+class InstalledSetupsIndex:
+    """SQLite index of setups installed under the AC setups directory
+
+    Built by a parallel walk over car directories and refreshed incrementally:
+    only files with a changed size or mtime are read and hashed again.
+    """
+
+    def __init__(self, db_path, setups_dir, refresh_seconds=DEFAULT_REFRESH_SECONDS):
+        self.db_path = db_path
+        self.setups_dir = setups_dir
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        # Held for a whole refresh, so concurrent callers wait for one walk instead of starting their own
+        self._refresh_lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def refresh(self):
+        """Bring the index up to date with the setups directory, returns (updated, removed) counts"""
+        if not os.path.isdir(self.setups_dir):
+            return 0, 0
+
+        with os.scandir(self.setups_dir) as entries:
+            car_paths = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=WALK_WORKERS) as executor:
+            on_disk = {}
+            for found in executor.map(_scan_car_directory, car_paths):
+                for path, size, mtime in found:
+                    on_disk[path] = (size, mtime)
+
+            with self._lock:
+                connection = self._connect()
+                known = {row[0]: (row[1], row[2]) for row in connection.execute("SELECT path, size, mtime FROM setups")}
+
+            changed = [(path, size, mtime) for path, (size, mtime) in on_disk.items() if known.get(path) != (size, mtime)]
+            removed = [path for path in known if path not in on_disk]
+            records = [r for r in executor.map(lambda item: _read_setup_record(self.setups_dir, *item), changed) if r]
+
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("DELETE FROM setups WHERE path = ?", ((path,) for path in removed))
+                connection.executemany("INSERT OR REPLACE INTO setups VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+                connection.execute("INSERT OR REPLACE INTO state VALUES ('refreshed', ?)", (str(time.time()),))
+        return len(records), len(removed)
+
+    def is_stale(self):
+        """Check whether the index wasn't refreshed within refresh_seconds"""
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM state WHERE key = 'refreshed'").fetchone()
+        return row is None or time.time() - float(row[0]) > self.refresh_seconds
+
+    def refresh_if_stale(self):
+        """Refresh the index if it's stale; callers arriving during a refresh wait for it instead of walking again"""
+        if not self.is_stale():
+            return 0, 0
+        with self._refresh_lock:
+            if not self.is_stale():
+                return 0, 0
+            return self.refresh()
+
+    def record(self, path, setup_id, car, track, content):
+        """Add a freshly installed setup without waiting for the next refresh"""
+        stat = os.stat(path)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO setups VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (path, str(setup_id), car, track, stat.st_size, stat.st_mtime, get_content_hash(content)))
+
+    def _find(self, column, value):
+        with self._lock:
+            rows = self._connect().execute(f"SELECT path FROM setups WHERE {column} = ?", (value,)).fetchall()
+        # Rows can be stale until the next refresh, so make sure the file is still there
+        for (path,) in rows:
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def find_by_setup_id(self, setup_id):
+        """Get the path of an installed setup with this Setup Market ID, or None"""
+        return self._find("setup_id", str(setup_id))
+
+    def find_by_content(self, content):
+        """Get the path of an installed setup with the same normalized content, or None"""
+        return self._find("hash", get_content_hash(content))
@@ -0,0 +1,78 @@
+import os
+import re
+
+from setup_parser import META_PREFIX
+
+GENERIC_DIRECTORY = "generic"
+DEFAULT_NAME_TEMPLATE = "setupmarket_{setup_id}"
+
+INSTALL_MODE_CONTENT_MANAGER = "content_manager"
+INSTALL_MODE_DIRECT = "direct"
+
+
+def get_default_setups_dir():
+    """Get the user's Assetto Corsa setups directory"""
+    return os.path.join(os.path.expanduser("~"), "Documents", "Assetto Corsa", "setups")
+
+
+def sanitize_path_part(value):
+    """Make an ID safe to use as a single path component"""
+    value = re.sub(r'[^\w.\-]+', "_", value.strip()).strip(". ")
+    return value or "_"
+
+
+def check_name_template(name_template):
+    """Get the file name template back if it can be filled in, otherwise raise ValueError saying why"""
+    try:
+        name_template.format(setup_id="1", car="car", track="track")
+    except KeyError as e:
+        raise ValueError(f"unknown placeholder {{{e.args[0]}}} in name template {name_template!r}, "
+                         f"use {{setup_id}}, {{car}} or {{track}}") from None
+    except IndexError:
+        raise ValueError(f"placeholders in name template {name_template!r} need a name: "
+                         f"{{setup_id}}, {{car}} or {{track}}") from None
+    except (ValueError, AttributeError, TypeError) as e:
+        raise ValueError(f"invalid name template {name_template!r}: {str(e)}") from None
+    return name_template
+
+
+def get_install_path(setups_dir, car_id, track_id, setup_id, name_template=DEFAULT_NAME_TEMPLATE):
+    """Get the destination of a setup: setups/<car>/<track|generic>/<name>.ini"""
+    # Setups are stored per track, without the layout
+    track_dir = sanitize_path_part(track_id.split("/")[0]) if track_id else GENERIC_DIRECTORY
+    check_name_template(name_template)
+    name = name_template.format(setup_id=setup_id, car=car_id, track=track_id or GENERIC_DIRECTORY)
+    return os.path.join(setups_dir, sanitize_path_part(car_id), track_dir, sanitize_path_part(name) + ".ini")
+
+
+def write_file_atomic(path, content):
+    """Write text through a temporary file in the same directory and a rename"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    import tempfile
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".setupmarket_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def install_setup(setups_dir, setup, setup_id, name_template=DEFAULT_NAME_TEMPLATE, car_id=None, track_id=None):
+    """Write a parsed setup straight into the setups directory, returns the installed path
+
+    CM_META lines are left out, AC doesn't need them and the car and track are
+    already encoded in the destination path.
+    """
+    car_id = car_id or setup.car_id
+    track_id = track_id or setup.track_id
+    if not car_id:
+        raise ValueError("Could not determine car ID from setup file")
+
+    content = "".join(line for line in setup.content.splitlines(True) if not line.startswith(META_PREFIX))
+    path = get_install_path(setups_dir, car_id, track_id, setup_id, name_template)
+    write_file_atomic(path, content)
+    return path
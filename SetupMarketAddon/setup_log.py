@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import configparser
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Default logger limits
+DEFAULT_LEVEL = "info"
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+FLUSH_INTERVAL = 0.5
+MAX_BATCH_SIZE = 256
+
+
+def read_log_level(*settings_paths):
+    """Read the log level from the [LOG] section of the given settings files, later files win"""
+    config = configparser.ConfigParser()
+    config.read(settings_paths, encoding="utf-8")
+    # Defaults carry CM's "value; Label; range" descriptions after the value
+    level = config.get("LOG", "level", fallback=DEFAULT_LEVEL).split(";")[0].strip().lower()
+    return level if level in LEVELS else DEFAULT_LEVEL
+
+
+class StructuredLogger:
+    """Queue-backed logger writing JSON lines from a background thread
+
+    Callers only build a record and put it into a queue; the writer thread
+    appends records in batches and rotates the file once it grows past
+    max_bytes, keeping backup_count old files as name.1, name.2 and so on.
+    flush() and close() wake the writer instead of waiting out its batching.
+    """
+
+    def __init__(self, path, level=DEFAULT_LEVEL, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        self.path = path
+        self.level = LEVELS.get(level, LEVELS[DEFAULT_LEVEL])
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Set while a flush() or close() is waiting, so the writer skips its batching pause
+        self._wake = threading.Event()
+        self._wake_lock = threading.Lock()
+        self._waiting = 0
+        atexit.register(self.close)
+
+    def is_enabled(self, level):
+        """Check if records of a level would be written"""
+        return LEVELS.get(level, 0) >= self.level
+
+    def log(self, message, level="info", phase=None, **fields):
+        """Queue a record, never blocks on file I/O"""
+        if not self.is_enabled(level):
+            return
+        now = time.time()
+        record = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}",
+            "level": level,
+            "msg": str(message)
+        }
+        if phase:
+            record["phase"] = phase
+        record.update(fields)
+        self._ensure_thread()
+        self._queue.put(record)
+
+    def flush(self, timeout=2.0):
+        """Wait until everything queued so far is written"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._put_urgent(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Write pending records and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._put_urgent(None)
+        self._thread.join(2.0)
+        self._thread = None
+
+    def _put_urgent(self, item):
+        with self._wake_lock:
+            self._waiting += 1
+            self._wake.set()
+        self._queue.put(item)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="setupmarket-log", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        running = True
+        while running:
+            items = [self._queue.get()]
+            # Give other records a moment to pile up, then drain the queue in one go
+            if isinstance(items[0], dict):
+                self._wake.wait(FLUSH_INTERVAL)
+            while len(items) < MAX_BATCH_SIZE:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            events = []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    events.append(item)
+                else:
+                    lines.append(json.dumps(item, ensure_ascii=False) + "\n")
+
+            if lines:
+                try:
+                    self._write("".join(lines))
+                except OSError:
+                    # Logging must never take the caller down
+                    pass
+            for event in events:
+                event.set()
+            urgent = len(events) + (not running)
+            if urgent:
+                with self._wake_lock:
+                    self._waiting -= urgent
+                    if self._waiting <= 0:
+                        self._waiting = 0
+                        self._wake.clear()
+
+    def _write(self, data):
+        if self.max_bytes and os.path.isfile(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.isfile(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
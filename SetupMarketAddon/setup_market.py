@@ -8,15 +8,33 @@ import os
 import sys
 import winreg
 import json
-import configparser
-import requests
 import tempfile
 import traceback
 import base64
+from urllib.parse import urlparse, parse_qs
 import re
 import ac
 import acsys
 
+# Make the bundled helper modules importable from the app directory
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from setup_cache import SetupCache, DownloadRejected, fetch_setup_file
+from setup_retry import CircuitOpen, NegativeCache, RetryPolicy
+from setup_endpoints import EndpointPool
+from setup_parser import parse_setup_text
+from setup_pack import SetupPack
+from setup_log import StructuredLogger, LEVELS
+from setup_settings import AppSettings
+from cm_payload import encode_compact_command, encode_legacy_command, combine_shared_commands
+from setup_installer import INSTALL_MODE_CONTENT_MANAGER, INSTALL_MODE_DIRECT, install_setup, get_default_setups_dir
+from setup_index import InstalledSetupsIndex
+from background_worker import BackgroundWorker, StatusBoard
+from setup_trace import Tracer
+from launcher import LAUNCHER_AUTO, get_launcher, launch
+from setup_http import TRANSPORT_STDLIB, create_http_session
+from setup_catalogue import SetupCatalogue, CatalogueSyncFailed, parse_query, format_entry
+from setup_bundle import BUNDLE_WORKERS, parse_bundle_url, parse_car_url, get_car_list_url, parse_car_list, limit_bundle, parse_car_catalogue, pick_top_setups, fetch_bundle
+
 # Constants
 ADDON_NAME = "Setup Market"
 ADDON_VERSION = "1.0.0"
@@ -24,31 +42,101 @@ URL_SCHEME = "setupmarket"
 URL_PROTOCOL = f"{URL_SCHEME}://"
 WEBSITE_URL = "https://setupmarket.net"
 SETUP_FILES_PATH = f"{WEBSITE_URL}/wp-content/uploads/setup-files/"
+CATALOGUE_URL = f"{WEBSITE_URL}/wp-json/setupmarket/v1/catalogue"
+
+# Hand setups to Content Manager as acmanager://shared?z= (deflate) instead of ?id= (double base64)
+COMPACT_SHARED_PAYLOAD = True
 
-# Setup app labels
+# Setup app window and labels
+WINDOW_HEIGHT = 160
 app_window = 0
 info_label = 0
 status_label = 0
+trace_label = 0
+session_label = 0
+install_button = 0
+search_input = 0
 
 # Settings paths
 settings_default_ini_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "settings", "settings_defaults.ini")
 settings_ini_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "settings", "settings.ini")
 log_file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "setup_market.log")
+cache_dir_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "cache")
+
+# Typed settings, parsed once and reloaded from acUpdate() when the files change
+settings = AppSettings(settings_default_ini_path, settings_ini_path)
+
+# Index of setups already in the setups folder, lets known setups skip the download entirely
+installed_index = InstalledSetupsIndex(os.path.join(os.path.dirname(os.path.realpath(__file__)), "installed.sqlite"), get_default_setups_dir())
 
-# Load settings
-config = configparser.ConfigParser()
-if not os.path.isfile(settings_ini_path):
-    with open(settings_ini_path, "w", encoding="utf-8") as ini:
-        ini.write("")
+# Buffered JSON-lines log, written from a background thread instead of AC's frame thread
+logger = StructuredLogger(log_file_path, level=settings.log_level)
 
-# Load settings
-config.read(settings_default_ini_path)
-config.read(settings_ini_path)
+# Local cache of downloaded setups, revalidated with ETag/Last-Modified
+setup_cache = SetupCache(
+    cache_dir_path,
+    max_bytes=settings.cache_max_size_mb * 1024 * 1024,
+    fresh_seconds=settings.cache_fresh_seconds)
 
-def log(message):
+def create_setup_pack(pack_path):
+    """Open the pack made with "generate_cm_url.py mirror" ([CACHE] pack, relative to the app), None without one"""
+    return SetupPack(os.path.join(os.path.dirname(os.path.realpath(__file__)), pack_path)) if pack_path else None
+
+# Used before the network
+setup_pack = create_setup_pack(settings.pack)
+
+def log(message, level="info", phase=None, **fields):
     """Log a message to a log file in the addon's directory"""
-    with open(log_file_path, "a", encoding="utf-8") as f:
-        f.write(f"{message}\n")
+    logger.log(message, level, phase, **fields)
+
+def log_trace(record):
+    """Write a finished trace to the log as a single record"""
+    log(f"Trace {record['trace']}: {record['total_ms']} ms", phase="trace", **record)
+
+# Opt-in timing of every phase of handling a link ([LOG] trace in settings.ini), free when off
+tracer = Tracer(emit=log_trace, enabled=settings.trace)
+
+def http_get(url, **kwargs):
+    """GET a URL with retries and the circuit breaker, setup files come from the fastest of the configured endpoints"""
+    return endpoint_pool.get(http_session.get, url, tracer, retry_policy, **kwargs)
+
+# Keep-alive HTTP session, also shared by the concurrent downloads of bundles; in the game's
+# interpreter "auto" means the standard library client, requests costs import time and memory there
+http_session, http_transport = create_http_session(settings.transport, TRANSPORT_STDLIB)
+
+# Retries with jittered backoff and a circuit breaker per host for server errors and timeouts
+retry_policy = RetryPolicy(attempts=settings.retries + 1)
+
+def create_endpoint_pool(endpoints, hedge):
+    """Pool of equivalent copies of the setup files, e.g. a CDN, the website and a local mirror"""
+    return EndpointPool(SETUP_FILES_PATH, [url.rstrip("/") + "/" for url in endpoints], hedge=hedge,
+                        concurrency=BUNDLE_WORKERS)
+
+# Requests go to the fastest endpoint
+endpoint_pool = create_endpoint_pool(settings.endpoints, settings.hedge)
+
+# Setup IDs that recently got a 404, clicking them again fails right away without a request
+missing_setups = NegativeCache(ttl=settings.not_found_ttl)
+
+# Downloads, parsing and encoding run on this worker, never inside acMain/acUpdate
+download_worker = BackgroundWorker("setupmarket-download", log=log)
+status_board = StatusBoard()
+trace_board = StatusBoard()
+
+# Top setups for the loaded car and track, downloaded into the cache when the session starts
+# ([CACHE] prefetch in settings.ini); on their own worker so a clicked link never waits for them
+PREFETCH_WORKERS = 3
+prefetch_worker = BackgroundWorker("setupmarket-prefetch", log=log)
+# Posts are (message, setup IDs to offer or None to keep the current ones); session_setups is only
+# assigned on the frame thread, from what acUpdate takes off the board
+session_board = StatusBoard()
+session_car = None
+session_track = None
+session_setups = []
+
+# Local copy of the setup catalogue for searching from the app, synced in the background ([CATALOGUE])
+SEARCH_LIMIT = 10
+catalogue = SetupCatalogue(os.path.join(os.path.dirname(os.path.realpath(__file__)), "catalogue.sqlite"))
 
 def get_cm_dir():
     """Get the Content Manager directory"""
@@ -75,20 +163,45 @@ def get_cm_exe_path():
     # Return the default path even if it doesn't exist
     return cm_path
 
+def create_launcher(name):
+    """Get the configured launcher, picking one automatically if the name is unknown"""
+    try:
+        return get_launcher(name, get_cm_exe_path())
+    except ValueError as e:
+        log(f"{str(e)}, picking one automatically", level="warning", phase="launch")
+        return get_launcher(LAUNCHER_AUTO, get_cm_exe_path())
+
+# How acmanager:// commands reach Content Manager: auto, shell, xdg-open, content_manager or record
+launcher = create_launcher(settings.launcher)
+
+def launch_command(command):
+    """Hand an acmanager:// command to Content Manager, returns True if the handoff succeeded"""
+    with tracer.span("launch", bytes=len(command)) as span:
+        result = launch(launcher, command)
+        span.add(backend=result.backend, ok=result.ok)
+    launch_ms = round(result.seconds * 1000, 3)
+    if result.ok:
+        log(f"Launched through {result.backend} in {launch_ms} ms", phase="launch", backend=result.backend, launch_ms=launch_ms)
+    else:
+        log(f"Launch through {result.backend} failed: {result.error}", level="error", phase="launch",
+            backend=result.backend, launch_ms=launch_ms)
+    return result.ok
+
 def get_user_dir():
     """Get the user's Assetto Corsa setups directory"""
     return os.path.join(os.path.expanduser("~"), "Documents", "Assetto Corsa", "setups")
 
+@tracer.traced("register")
 def register_url_protocol():
     """Register the setupmarket:// URL protocol with Windows"""
     try:
         # Get the absolute path to the executable
         cm_path = get_cm_exe_path()
         
-        log(f"Using Content Manager path: {cm_path}")
+        log(f"Using Content Manager path: {cm_path}", phase="register")
         
         if not os.path.exists(cm_path):
-            log(f"Content Manager executable not found at: {cm_path}")
+            log(f"Content Manager executable not found at: {cm_path}", level="warning", phase="register")
             update_status("Content Manager not found!")
             return False
         
@@ -104,11 +217,11 @@ def register_url_protocol():
                     cmd_value = f'"{cm_path}" "%1"'
                     winreg.SetValue(cmd_key, "", winreg.REG_SZ, cmd_value)
             
-            log(f"Registered URL protocol {URL_SCHEME}://")
+            log(f"Registered URL protocol {URL_SCHEME}://", phase="register")
             update_status("URL Protocol registered successfully")
             return True
         except PermissionError:
-            log("Permission error when registering URL protocol - attempting backup method")
+            log("Permission error when registering URL protocol - attempting backup method", level="warning", phase="register")
             
             # Try a more direct registry update approach as backup
             try:
@@ -116,181 +229,512 @@ def register_url_protocol():
                 os.system(f'reg add "HKCU\\SOFTWARE\\Classes\\{URL_SCHEME}" /f /v "URL Protocol" /t REG_SZ /d ""')
                 os.system(f'reg add "HKCU\\SOFTWARE\\Classes\\{URL_SCHEME}\\shell\\open\\command" /f /ve /t REG_SZ /d "\\"{cm_path}\\" \\"%1\\"" ')
                 
-                log(f"Registered URL protocol {URL_SCHEME}:// using backup method")
+                log(f"Registered URL protocol {URL_SCHEME}:// using backup method", phase="register")
                 update_status("URL Protocol registered successfully (backup method)")
                 return True
             except Exception as backup_error:
-                log(f"Backup method also failed: {str(backup_error)}")
+                log(f"Backup method also failed: {str(backup_error)}", level="error", phase="register")
                 update_status("Protocol registration failed completely")
                 return False
     except Exception as e:
-        log(f"Failed to register URL protocol: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Failed to register URL protocol: {str(e)}", level="error", phase="register")
+        log(traceback.format_exc(), level="error", phase="register")
         update_status("Failed to register URL protocol")
         return False
 
+def read_from_pack(setup_id):
+    """Get a setup's content from the local pack, or None if there's no pack or it doesn't have the setup"""
+    if setup_pack is None:
+        return None
+    try:
+        with tracer.span("pack_lookup") as span:
+            content = setup_pack.get(setup_id)
+            span.add(hit=content is not None)
+        return content
+    except Exception as e:
+        log(f"Error reading setup pack: {str(e)}", level="error", phase="download")
+        return None
+
+def find_car_in_pack(car_id, track_id=None):
+    """Get the IDs of a car's setups (for a track) from the local pack's car index, empty if there's no pack"""
+    if setup_pack is None:
+        return []
+    try:
+        with tracer.span("pack_lookup", car=car_id) as span:
+            setup_ids = setup_pack.find_by_car(car_id, track_id)
+            span.add(hit=bool(setup_ids))
+        return setup_ids
+    except Exception as e:
+        log(f"Error reading setup pack: {str(e)}", level="error", phase="bundle")
+        return []
+
 def download_setup_file(setup_id):
     """Download a setup file from Setup Market"""
     try:
-        setup_url = f"{SETUP_FILES_PATH}setup_{setup_id}.ini"
-        log(f"Downloading setup from: {setup_url}")
-        update_status(f"Downloading setup ID: {setup_id}...")
-        
-        # Download the setup file using requests
-        response = requests.get(setup_url)
-        if response.status_code != 200:
-            log(f"Failed to download setup file. Status code: {response.status_code}")
-            update_status(f"Download failed: HTTP {response.status_code}")
+        # A local pack from the mirror command is used before going to the network
+        pack_content = read_from_pack(setup_id)
+        if pack_content is not None:
+            setup = parse_setup_text(pack_content, setup_id)
+            log(f"Setup {setup_id} served from pack: {setup_pack.path}", phase="download")
+        elif setup_id in missing_setups:
+            # Got a 404 a moment ago, asking again would only repeat it
+            log(f"Setup {setup_id} was not found recently, not requesting it again yet", level="warning", phase="download")
+            update_status(f"Setup {setup_id} not found")
             return None
+        else:
+            setup_url = f"{SETUP_FILES_PATH}setup_{setup_id}.ini"
+            log(f"Downloading setup from: {setup_url}", phase="download")
+            update_status(f"Downloading setup ID: {setup_id}...")
             
-        setup_content = response.text
+            # Download the setup file, going through the local cache
+            with tracer.span("download") as span:
+                setup, status_code = fetch_setup_file(setup_cache, setup_id, setup_url, http_get, tracer,
+                                                      (settings.connect_timeout, settings.read_timeout),
+                                                      settings.max_setup_kb * 1024, settings.transfer_seconds)
+                span.add(status=status_code)
+            if setup is None:
+                if status_code == 404:
+                    missing_setups.add(setup_id)
+                log(f"Failed to download setup file. Status code: {status_code}", level="error", phase="download")
+                update_status(f"Download failed: HTTP {status_code}")
+                return None
+            log(f"Setup {setup_id} served from {'cache' if status_code != 200 else 'network'} (status: {status_code})", phase="download")
             
-        # Extract car ID and track ID from the ini file
-        car_id = None
-        track_id = None
-        
-        # Look for metadata
-        metadata = {}
-        for line in setup_content.split('\n'):
-            if line.startswith(';CM_META:'):
-                key_value = line[9:].split(':', 1)
-                if len(key_value) == 2:
-                    metadata[key_value[0]] = key_value[1]
-        
-        # Try to find car ID in metadata or in the content
-        if 'car' in metadata:
-            car_id = metadata['car']
-        else:
-            car_match = re.search(r'\[CAR\]\s+MODEL=(.+)', setup_content)
-            if car_match:
-                car_id = car_match.group(1).strip()
-        
-        # Try to find track ID in metadata
-        if 'track' in metadata:
-            track_id = metadata['track']
+        # Car ID comes from the metadata or [CAR] MODEL=, track ID only from the metadata
+        car_id = setup.car_id
+        track_id = setup.track_id
         
         if not car_id:
-            log("Could not determine car ID from setup file")
+            log("Could not determine car ID from setup file", level="warning", phase="download")
             update_status("Error: Could not determine car ID")
             return None
         
-        # Prepare metadata for Content Manager
-        setup_metadata = {
-            'car': car_id
-        }
-        
-        if track_id:
-            setup_metadata['track'] = track_id
-        
-        # Add metadata to the setup file
-        metadata_content = ""
-        for key, value in setup_metadata.items():
-            encoded_value = base64.b64encode(value.encode('utf-8')).decode('utf-8')
-            metadata_content += f";CM_META:{key}:{encoded_value}\n"
-        
-        # Combine metadata with the setup content
-        final_setup_content = metadata_content + setup_content
+        with tracer.span("metadata") as span:
+            # Prepare metadata for Content Manager
+            setup_metadata = {
+                'car': car_id
+            }
+            
+            if track_id:
+                setup_metadata['track'] = track_id
+            
+            # Add metadata to the setup file
+            metadata_content = ""
+            for key, value in setup_metadata.items():
+                encoded_value = base64.b64encode(value.encode('utf-8')).decode('utf-8')
+                metadata_content += f";CM_META:{key}:{encoded_value}\n"
+            
+            # Combine metadata with the setup content
+            final_setup_content = metadata_content + setup.content
+            span.add(bytes=len(final_setup_content))
         
         update_status(f"Setup downloaded for {car_id}")
         return {
             'content': final_setup_content,
             'car_id': car_id,
             'track_id': track_id,
-            'setup_id': setup_id
+            'setup_id': setup_id,
+            'setup': setup
         }
         
+    except (DownloadRejected, CircuitOpen, OSError) as e:
+        # Expected failures (not a setup, too big, timeouts, network down), no traceback needed; HTTP errors are OSErrors
+        log(f"Download of setup {setup_id} aborted: {str(e)}", level="error", phase="download")
+        update_status(f"Download failed: {str(e)[:60]}")
+        return None
     except Exception as e:
-        log(f"Error downloading setup file: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error downloading setup file: {str(e)}", level="error", phase="download")
+        log(traceback.format_exc(), level="error", phase="download")
         update_status("Error downloading setup file")
         return None
 
 def create_cm_shared_command(setup_data):
     """Create a command to open Content Manager with the setup"""
     try:
-        # Encode the setup content to base64
-        setup_content_b64 = base64.b64encode(setup_data['content'].encode('utf-8')).decode('utf-8')
-        
-        # Create the shared entry data
-        shared_data = {
-            'n': f"Setup for {setup_data['car_id']}",  # name
-            't': setup_data['car_id'],  # target (car)
-            'a': "SetupMarket.net",     # author
-            'i': f"setup_{setup_data['setup_id']}.ini",  # id
-            'e': 1,  # entry type (1 = CarSetup)
-            'd': setup_content_b64  # data
-        }
-        
-        # Encode the shared data to JSON then to base64
-        shared_json = json.dumps(shared_data)
-        shared_b64 = base64.b64encode(shared_json.encode('utf-8')).decode('utf-8')
-        
-        # Create the command
-        cmd = f"acmanager://shared?id={shared_b64}"
+        # Compact deflate payload, or the original double base64 one for older Content Manager builds
+        with tracer.span("encode") as span:
+            if COMPACT_SHARED_PAYLOAD:
+                cmd, sizes = encode_compact_command(setup_data)
+            else:
+                cmd, sizes = encode_legacy_command(setup_data)
+            span.add(bytes=sizes['encoded_size'])
+        log(f"Encoded shared payload: {sizes['raw_size']} bytes of setup, {sizes['encoded_size']} bytes of URL",
+            phase="encode", **sizes)
         return cmd
         
     except Exception as e:
-        log(f"Error creating CM shared command: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error creating CM shared command: {str(e)}", level="error", phase="encode")
+        log(traceback.format_exc(), level="error", phase="encode")
         update_status("Error creating CM command")
         return None
 
+def refresh_installed_index():
+    """Bring the installed setups index up to date if it's stale, waiting for a refresh already under way"""
+    try:
+        updated, removed = installed_index.refresh_if_stale()
+        if updated or removed:
+            log(f"Installed setups index refreshed: {updated} updated, {removed} removed", phase="index")
+    except Exception as e:
+        log(f"Error refreshing installed setups index: {str(e)}", level="error", phase="index")
+        log(traceback.format_exc(), level="error", phase="index")
+
+def start_index_refresh():
+    """Refresh a stale installed setups index on its own thread, so the walk overlaps the downloads"""
+    if not settings.skip_installed:
+        return
+    try:
+        if not installed_index.is_stale():
+            return
+    except Exception as e:
+        log(f"Error checking installed setups index: {str(e)}", level="error", phase="index")
+        return
+    import threading
+    threading.Thread(target=refresh_installed_index, name="setupmarket-index", daemon=True).start()
+
+def find_installed_setup(content):
+    """Get the path of an installed setup with exactly this content, or None
+
+    Only content counts: a setup installed earlier under the same ID may have
+    been updated on the site since, so it's downloaded (or revalidated in the
+    cache) before deciding.
+    """
+    if not settings.skip_installed:
+        return None
+    try:
+        with tracer.span("installed_check"):
+            refresh_installed_index()
+            return installed_index.find_by_content(content)
+    except Exception as e:
+        log(f"Error checking installed setups: {str(e)}", level="error", phase="index")
+        log(traceback.format_exc(), level="error", phase="index")
+        return None
+
+def get_install_mode(url_path):
+    """Get the install mode, a ?install=direct|content_manager query overrides the setting"""
+    query = parse_qs(urlparse(url_path).query)
+    install_mode = query.get('install', [settings.install_mode])[0]
+    if install_mode not in (INSTALL_MODE_DIRECT, INSTALL_MODE_CONTENT_MANAGER):
+        log(f"Unknown install mode: {install_mode}", level="warning", phase="install")
+        return settings.install_mode
+    return install_mode
+
+def install_setup_directly(setup_data):
+    """Write a downloaded setup straight into the setups folder, returns the path or None"""
+    try:
+        with tracer.span("install", bytes=setup_data['setup'].size):
+            path = install_setup(get_user_dir(), setup_data['setup'], setup_data['setup_id'], settings.name_template,
+                                 setup_data['car_id'], setup_data['track_id'])
+        log(f"Installed setup to: {path}", phase="install")
+        installed_index.record(path, setup_data['setup_id'], setup_data['car_id'], setup_data['track_id'],
+                               setup_data['setup'].content)
+        update_status(f"Setup installed for {setup_data['car_id']}")
+        return path
+    except Exception as e:
+        log(f"Error installing setup file: {str(e)}", level="error", phase="install")
+        log(traceback.format_exc(), level="error", phase="install")
+        update_status("Error installing setup file")
+        return None
+
+def get_bundle_setup_ids(url_path):
+    """Get the setup IDs of a bundle/<id>,<id> or car/<car_id> URL, or None for other URLs"""
+    setup_ids = parse_bundle_url(url_path)
+    if setup_ids is not None:
+        return setup_ids
+    
+    car_id = parse_car_url(url_path)
+    if car_id is None:
+        return None
+    try:
+        list_url = get_car_list_url(SETUP_FILES_PATH, car_id)
+        log(f"Fetching setup list for {car_id} from: {list_url}", phase="bundle")
+        update_status(f"Looking up setups for {car_id}...")
+        response = http_get(list_url, timeout=(settings.connect_timeout, settings.read_timeout))
+        if response.status_code != 200:
+            log(f"Failed to fetch setup list for {car_id}. Status code: {response.status_code}", level="error", phase="bundle")
+        else:
+            return parse_car_list(response.text)
+    except Exception as e:
+        log(f"Error fetching setup list for {car_id}: {str(e)}", level="error", phase="bundle")
+        log(traceback.format_exc(), level="error", phase="bundle")
+    
+    # Offline, the car index of a mirrored pack still knows which setups there are
+    setup_ids = find_car_in_pack(car_id)
+    if setup_ids:
+        log(f"Using {len(setup_ids)} setups for {car_id} from pack: {setup_pack.path}", phase="bundle")
+    return setup_ids
+
+def prepare_bundle_item(setup_id):
+    """Download one setup of a bundle, returns its result record"""
+    setup_data = download_setup_file(setup_id)
+    if not setup_data:
+        return {'id': setup_id, 'status': 'download_failed'}
+    if find_installed_setup(setup_data['setup'].content):
+        return {'id': setup_id, 'status': 'already_installed'}
+    return {'id': setup_id, 'status': 'downloaded', 'setup_data': setup_data}
+
+def process_bundle(setup_ids, url_path):
+    """Install several setups in one pass with a single Content Manager launch, returns True if none failed"""
+    if not setup_ids:
+        log("Bundle has no setups", level="warning", phase="bundle")
+        update_status("No setups found for this link")
+        return False
+    log(f"Processing bundle of {len(setup_ids)} setups: {','.join(setup_ids)}", phase="bundle")
+    # Setups past the limit are reported as skipped instead of dropped
+    setup_ids, skipped = limit_bundle(setup_ids)
+    update_status(f"Downloading {len(setup_ids)} setups...")
+    
+    # Download all setups at once, a failing one doesn't stop the others
+    with tracer.span("bundle_download", setups=len(setup_ids)):
+        results = fetch_bundle(setup_ids, prepare_bundle_item)
+    items = [result if isinstance(result, dict) else {'id': setup_id, 'status': 'error', 'error': str(result)}
+             for setup_id, result in zip(setup_ids, results)]
+    items += skipped
+    ready = [item for item in items if item['status'] == 'downloaded']
+    
+    if get_install_mode(url_path) == INSTALL_MODE_DIRECT:
+        for item in ready:
+            item['status'] = 'installed' if install_setup_directly(item['setup_data']) else 'install_failed'
+    else:
+        encoded = []
+        for item in ready:
+            cm_command = create_cm_shared_command(item['setup_data'])
+            if cm_command:
+                encoded.append((item, cm_command))
+            else:
+                item['status'] = 'encode_failed'
+        
+        # As many setups per Content Manager launch as fit on its command line, usually just one launch
+        for cm_command, indices in combine_shared_commands([cm_command for _, cm_command in encoded]):
+            launched = launch_command(cm_command)
+            for index in indices:
+                encoded[index][0]['status'] = 'sent' if launched else 'launch_failed'
+    
+    failed = 0
+    for item in items:
+        ok = item['status'] in ('installed', 'sent', 'already_installed')
+        failed += not ok
+        reason = f" ({item['reason']})" if 'reason' in item else ""
+        log(f"Bundle setup {item['id']}: {item['status']}{reason}", level="info" if ok else "warning", phase="bundle",
+            setup_id=item['id'], status=item['status'])
+    log(f"Bundle done: {len(items) - failed} of {len(items)} setups succeeded", phase="bundle")
+    if skipped:
+        update_status(f"{len(items) - failed} of {len(items)} setups done, {len(skipped)} skipped: {skipped[0]['reason']}")
+    elif failed:
+        update_status(f"{len(items) - failed} of {len(items)} setups done, {failed} failed (see log)")
+    else:
+        update_status(f"All {len(items)} setups done")
+    return failed == 0
+
+@tracer.traced("process_url")
 def process_url(url):
     """Process a setupmarket:// URL"""
     try:
-        log(f"Processing URL: {url}")
+        log(f"Processing URL: {url}", phase="process")
         update_status(f"Processing URL: {url}")
         
         # Parse the URL to extract setup ID
         if url.startswith(URL_PROTOCOL):
             url_path = url[len(URL_PROTOCOL):]
             
+            # One walk of the setups folder per link at most, while the setups download
+            start_index_refresh()
+            
+            # Bundles install several setups at once: setupmarket://bundle/1,2,3 or setupmarket://car/<car_id>
+            bundle_ids = get_bundle_setup_ids(url_path)
+            if bundle_ids is not None:
+                return process_bundle(bundle_ids, url_path)
+            
             # Parse the URL path to extract the setup ID
             # Expected format: setupmarket://setup/12345
-            match = re.match(r'setup/(\d+)', url_path)
+            with tracer.span("parse_url"):
+                match = re.match(r'setup/(\d+)', url_path)
             if match:
                 setup_id = match.group(1)
-                log(f"Extracted setup ID: {setup_id}")
+                log(f"Extracted setup ID: {setup_id}", phase="process")
                 update_status(f"Found setup ID: {setup_id}")
                 
                 # Download the setup file
                 setup_data = download_setup_file(setup_id)
+                if setup_data:
+                    installed_path = find_installed_setup(setup_data['setup'].content)
+                    if installed_path:
+                        log(f"Identical setup is already installed at: {installed_path}", phase="process")
+                        update_status(f"Setup already installed: {os.path.basename(installed_path)}")
+                        return True
+                
+                # Direct mode writes the setup into the setups folder without involving Content Manager
+                if setup_data and get_install_mode(url_path) == INSTALL_MODE_DIRECT:
+                    if install_setup_directly(setup_data):
+                        return True
+                
                 if setup_data:
                     # Create the CM command
                     cm_command = create_cm_shared_command(setup_data)
                     if cm_command:
-                        log(f"Created CM command: {cm_command}")
+                        log(f"Created CM command: {cm_command}", phase="process")
                         update_status("Opening setup in Content Manager...")
                         
                         # Execute the command by opening the URL
-                        os.startfile(cm_command)
-                        update_status("Setup loaded successfully!")
-                        return True
+                        if launch_command(cm_command):
+                            update_status("Setup loaded successfully!")
+                            return True
+                        update_status("Could not open Content Manager")
             else:
-                log(f"Could not extract setup ID from URL: {url}")
+                log(f"Could not extract setup ID from URL: {url}", level="warning", phase="process")
                 update_status("Invalid setup URL format")
         else:
-            log(f"URL does not start with expected protocol: {URL_PROTOCOL}")
+            log(f"URL does not start with expected protocol: {URL_PROTOCOL}", level="warning", phase="process")
             update_status(f"Invalid URL protocol: {url}")
         
         return False
     except Exception as e:
-        log(f"Error processing URL: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error processing URL: {str(e)}", level="error", phase="process")
+        log(traceback.format_exc(), level="error", phase="process")
         update_status("Error processing URL")
         return False
 
 def update_status(message):
-    """Update the status label in the app"""
-    global status_label
-    if status_label:
-        ac.setText(status_label, message)
+    """Post a status for the app, shown on the next frame (safe from any thread)"""
+    status_board.post(message)
+
+def process_queued_url(url):
+    """Process a URL on the worker, then post the session timings if tracing is on"""
+    process_url(url)
+    if tracer.enabled:
+        trace_board.post(f"Timings: {tracer.summary('process_url')}")
+
+def queue_url(url):
+    """Process a setupmarket:// URL on the background worker"""
+    download_worker.submit(process_queued_url, url)
+
+def register_in_background():
+    """Register URL protocol on the background worker"""
+    register_url_protocol()
+    update_status("Ready to download setups from setupmarket.net")
+
+def get_session_track():
+    """Get the loaded track as track/layout, like the track IDs of setups"""
+    track_id = ac.getTrackName(0)
+    layout = ac.getTrackConfiguration(0)
+    return f"{track_id}/{layout}" if layout else track_id
+
+def get_session_setup_ids(car_id, track_id):
+    """Get the IDs of the top setups for a car and track from its car list, or from the pack when offline"""
+    try:
+        list_url = get_car_list_url(SETUP_FILES_PATH, car_id)
+        log(f"Fetching setup list for {car_id} from: {list_url}", phase="prefetch")
+        response = http_get(list_url, timeout=(settings.connect_timeout, settings.read_timeout))
+        if response.status_code == 200:
+            return pick_top_setups(parse_car_catalogue(response.text), track_id, settings.prefetch_count)
+        log(f"Failed to fetch setup list for {car_id}. Status code: {response.status_code}", level="warning", phase="prefetch")
+    except Exception as e:
+        log(f"Error fetching setup list for {car_id}: {str(e)}", level="error", phase="prefetch")
+    return find_car_in_pack(car_id, track_id)[:settings.prefetch_count]
+
+def prefetch_setup(setup_id):
+    """Download one setup into the cache, returns 'installed', 'ready' or 'failed'"""
+    setup_data = download_setup_file(setup_id)
+    if not setup_data:
+        return 'failed'
+    if find_installed_setup(setup_data['setup'].content):
+        return 'installed'
+    return 'ready'
+
+@tracer.traced("prefetch")
+def prefetch_session_setups(car_id, track_id):
+    """Download the top setups for the loaded car and track, then offer them in the app window"""
+    session_board.post((f"Looking for setups for {car_id}...", None))
+    setup_ids = get_session_setup_ids(car_id, track_id)
+    if not setup_ids:
+        session_board.post((f"No setups for {car_id} on {track_id} yet", []))
+        return
+    
+    start_index_refresh()
+    results = fetch_bundle(setup_ids, prefetch_setup, workers=PREFETCH_WORKERS)
+    ready = [setup_id for setup_id, result in zip(setup_ids, results) if result == 'ready']
+    installed = sum(1 for result in results if result == 'installed')
+    log(f"Prefetched setups for {car_id} on {track_id}: {len(ready)} ready, {installed} already installed, "
+        f"{len(setup_ids) - len(ready) - installed} failed", phase="prefetch")
+    
+    if ready:
+        session_board.post((f"{len(ready)} setups for this car and track ready to install"
+                            + (f", {installed} already installed" if installed else ""), ready))
+    elif installed:
+        session_board.post((f"All {installed} top setups for this car and track are installed", []))
+    else:
+        session_board.post(("Could not download setups for this car and track", []))
+
+def sync_catalogue():
+    """Fetch catalogue changes since the last sync, if it's older than [CATALOGUE] sync_minutes"""
+    try:
+        with tracer.span("catalogue_sync") as span:
+            updated, removed = catalogue.sync_if_stale(http_get, CATALOGUE_URL, settings.catalogue_sync_minutes * 60,
+                                                       timeout=(settings.connect_timeout, settings.read_timeout))
+            span.add(updated=updated, removed=removed)
+        if updated or removed:
+            log(f"Synced catalogue: {updated} updated, {removed} removed", phase="catalogue")
+    except (CatalogueSyncFailed, CircuitOpen, OSError) as e:
+        log(f"Catalogue sync failed: {str(e)}", level="warning", phase="catalogue")
+    except Exception as e:
+        log(f"Error syncing catalogue: {str(e)}", level="error", phase="catalogue")
+        log(traceback.format_exc(), level="error", phase="catalogue")
+
+def search_catalogue(query):
+    """Search the local catalogue and offer the results for installing; an empty query lists the session's car
+
+    Runs on the prefetch worker: opening the database and waiting for a sync
+    in progress must not hold up a frame.
+    """
+    terms, filters = parse_query(query)
+    try:
+        if terms or filters:
+            results = catalogue.search(" ".join(terms), SEARCH_LIMIT, **filters)
+        else:
+            # Setups for this track first, then any for this car
+            results = (catalogue.search("", SEARCH_LIMIT, car=session_car, track=session_track)
+                       or catalogue.search("", SEARCH_LIMIT, car=session_car))
+    except Exception as e:
+        log(f"Error searching catalogue: {str(e)}", level="error", phase="catalogue")
+        session_board.post(("Search failed", []))
+        return
+    log(f"Catalogue search {query!r}: {len(results)} setups", level="debug", phase="catalogue")
+    setup_ids = [entry['setup_id'] for entry in results]
+    if results:
+        session_board.post((f"{len(results)} found, best {format_entry(results[0])}", setup_ids))
+    elif catalogue.count() == 0:
+        session_board.post(("Catalogue not synced yet", []))
+    else:
+        session_board.post(("No setups found", []))
+
+def on_search(*args):
+    """Search for the text in the search box in the background, called by AC when enter is pressed"""
+    session_board.post(("Searching...", None))
+    prefetch_worker.submit(search_catalogue, ac.getText(search_input))
+
+def start_prefetch():
+    """Prefetch setups for the session's car and track in the background, if enabled"""
+    if settings.prefetch and session_car:
+        prefetch_worker.submit(prefetch_session_setups, session_car, session_track)
+
+def on_install_clicked(*args):
+    """Install the prefetched setups of the session, called by AC when the button is clicked"""
+    setup_ids = session_setups
+    if not setup_ids:
+        return
+    if len(setup_ids) == 1:
+        queue_url(f"{URL_PROTOCOL}setup/{setup_ids[0]}")
+    else:
+        queue_url(f"{URL_PROTOCOL}bundle/{','.join(setup_ids)}")
 
 def acMain(ac_version):
     """Initialize the app"""
-    global app_window, info_label, status_label
+    global app_window, info_label, status_label, trace_label, session_label, install_button, search_input
+    global session_car, session_track
     
-    log(f"\n--- {ADDON_NAME} Addon v{ADDON_VERSION} ---")
+    log(f"\n--- {ADDON_NAME} Addon v{ADDON_VERSION} ---", phase="startup")
+    log(f"HTTP transport: {http_transport}", phase="startup")
+    for problem in settings.problems:
+        log(f"Setting {problem}", level="warning", phase="settings")
     
     # Create the app window
     app_window = ac.newApp(ADDON_NAME)
@@ -298,10 +742,8 @@ def acMain(ac_version):
     ac.setIconPosition(app_window, -10000, -10000)
     
     # Set window size and appearance
-    width = int(config.get('INTERFACE', 'backgroundwidth', fallback="500"))
-    height = 100
-    ac.setSize(app_window, width, height)
-    ac.setBackgroundOpacity(app_window, float(config.get('INTERFACE', 'backgroundopacity', fallback="0.5")))
+    ac.setSize(app_window, settings.background_width, WINDOW_HEIGHT)
+    ac.setBackgroundOpacity(app_window, settings.background_opacity)
     ac.drawBackground(app_window, 1)
     ac.drawBorder(app_window, 0)
     
@@ -314,17 +756,108 @@ def acMain(ac_version):
     ac.setPosition(status_label, 10, 40)
     ac.setFontSize(status_label, 14)
     
-    # Register URL protocol
-    register_url_protocol()
-    update_status("Ready to download setups from setupmarket.net")
+    # Session timings below the status, empty unless tracing is enabled
+    trace_label = ac.addLabel(app_window, "Timings: no links yet" if tracer.enabled else "")
+    ac.setPosition(trace_label, 10, 65)
+    ac.setFontSize(trace_label, 12)
+    
+    # Prefetched setups for the loaded car and track, with a button to install them
+    session_label = ac.addLabel(app_window, "")
+    ac.setPosition(session_label, 10, 95)
+    ac.setFontSize(session_label, 14)
+    install_button = ac.addButton(app_window, "Install")
+    ac.setPosition(install_button, settings.background_width - 90, 92)
+    ac.setSize(install_button, 80, 24)
+    ac.setVisible(install_button, 0)
+    ac.addOnClickedListener(install_button, on_install_clicked)
+    
+    # Search of the local catalogue: words, track:, author:, car: and tag:, empty for this car and track
+    search_input = ac.addTextInput(app_window, "Search setups")
+    ac.setPosition(search_input, 10, 125)
+    ac.setSize(search_input, settings.background_width - 20, 24)
+    ac.addOnValidateListener(search_input, on_search)
+    
+    # Register URL protocol, registry access stays off the render thread
+    download_worker.submit(register_in_background)
+    
+    # The car and track are known once the session has loaded, which it has when acMain runs
+    session_car = ac.getCarName(0)
+    session_track = get_session_track()
+    log(f"Session: {session_car} on {session_track}", phase="prefetch")
+    start_prefetch()
+    if settings.catalogue_sync:
+        prefetch_worker.submit(sync_catalogue)
     
     return "Setup Market Addon"
 
+def apply_settings(changed):
+    """Apply changed settings to the running app, called on AC's frame thread"""
+    global setup_pack, endpoint_pool, launcher, http_session, http_transport
+    log(f"Settings changed: {', '.join(changed)}", phase="settings")
+    for problem in settings.problems:
+        log(f"Setting {problem}", level="warning", phase="settings")
+    
+    # Window appearance
+    if app_window and ('background_width' in changed or 'background_opacity' in changed):
+        ac.setSize(app_window, settings.background_width, WINDOW_HEIGHT)
+        ac.setBackgroundOpacity(app_window, settings.background_opacity)
+        ac.setPosition(install_button, settings.background_width - 90, 92)
+        ac.setSize(search_input, settings.background_width - 20, 24)
+    
+    # Everything else only swaps objects or attributes the worker reads on its next job
+    logger.level = LEVELS[settings.log_level]
+    setup_cache.max_bytes = settings.cache_max_size_mb * 1024 * 1024
+    setup_cache.fresh_seconds = settings.cache_fresh_seconds
+    retry_policy.attempts = settings.retries + 1
+    missing_setups.ttl = settings.not_found_ttl
+    if 'trace' in changed:
+        tracer.enabled = settings.trace
+        if trace_label:
+            ac.setText(trace_label, "Timings: no links yet" if tracer.enabled else "")
+    if 'pack' in changed:
+        setup_pack = create_setup_pack(settings.pack)
+    if 'endpoints' in changed or 'hedge' in changed:
+        endpoint_pool = create_endpoint_pool(settings.endpoints, settings.hedge)
+    if 'launcher' in changed:
+        launcher = create_launcher(settings.launcher)
+    if 'transport' in changed:
+        # Requests already under way finish on the old session
+        http_session, http_transport = create_http_session(settings.transport, TRANSPORT_STDLIB)
+        log(f"HTTP transport: {http_transport}", phase="settings")
+    if ('prefetch' in changed or 'prefetch_count' in changed) and not session_setups:
+        start_prefetch()
+
 def acUpdate(deltaT):
     """Update function called by AC"""
-    # This function currently has no update logic
-    pass
+    global session_setups
+    # Pick up edits to settings.ini (e.g. from CM's app settings) without restarting the game
+    changed = settings.poll(deltaT)
+    if changed:
+        apply_settings(changed)
+    
+    # Apply the latest status posted by the worker, at most one label update per frame
+    message = status_board.take()
+    if message is not None and status_label:
+        ac.setText(status_label, message)
+    
+    timings = trace_board.take()
+    if timings is not None and trace_label:
+        ac.setText(trace_label, timings)
+    
+    session_post = session_board.take()
+    if session_post is not None:
+        session_message, setup_ids = session_post
+        if setup_ids is not None:
+            session_setups = setup_ids
+        if session_label:
+            ac.setText(session_label, session_message)
+            ac.setVisible(install_button, 1 if session_setups else 0)
 
 def acShutdown():
     """Cleanup when app is closed"""
-    log("Shutting down Setup Market Addon") 
\ No newline at end of file
+    log("Shutting down Setup Market Addon", phase="shutdown")
+    prefetch_worker.stop()
+    download_worker.stop()
+    catalogue.close()
+    setup_cache.close()
+    logger.close() 
\ No newline at end of file
@@ -0,0 +1,375 @@
+import os
+import json
+import mmap
+import struct
+import threading
+
+# Header at the start of the file, rewritten in place to commit new indexes
+PACK_MAGIC = b"SMPACK\x00\x02"
+# magic, ID index offset and entries, car index offset and entries, strings offset and length, meta offset and length
+HEADER = struct.Struct("<8sQIQIQIQI8x")
+
+# First version: no car index and a shorter header, upgraded by compacting it
+PACK_MAGIC_V1 = b"SMPACK\x00\x01"
+HEADER_V1 = struct.Struct("<8sQIQI")
+
+# Sorted by setup ID: setup ID, record offset, record length
+INDEX_ENTRY = struct.Struct("<QQI")
+
+# Sorted by car, track and setup ID: car and track as (offset, length) into the strings block, setup ID
+CAR_ENTRY = struct.Struct("<IHIHQ")
+
+# Compact automatically once unreferenced bytes make up this much of the file
+COMPACT_GARBAGE_RATIO = 0.5
+
+
+class PackError(Exception):
+    pass
+
+
+def _parse_header(data):
+    """Get (version, ID index offset, entries, car index offset, entries, strings offset, length, meta offset, length)"""
+    magic = bytes(data[:8])
+    if magic == PACK_MAGIC and len(data) >= HEADER.size:
+        return (2,) + HEADER.unpack_from(data)[1:]
+    if magic == PACK_MAGIC_V1 and len(data) >= HEADER_V1.size:
+        _, index_offset, index_count, meta_offset, meta_length = HEADER_V1.unpack_from(data)
+        return 1, index_offset, index_count, 0, 0, 0, 0, meta_offset, meta_length
+    raise PackError("Not a setup pack")
+
+
+def _is_cut_short(head):
+    """Check if the start of a file is too short for a pack header, as left by an interrupted first write"""
+    return len(head) < HEADER_V1.size or (head[:8] == PACK_MAGIC and len(head) < HEADER.size)
+
+
+class SetupPack:
+    """Read-only view of a setup pack, memory-mapped
+
+    Setups are UTF-8 records. Lookups by ID are a binary search over the
+    sorted ID index and lookups by car (and track) one over the car index, both
+    straight from the map, and a setup is decoded directly from its slice of
+    the map. The pack is mapped again when the file changes, so a running
+    handler picks up what the mirror command added. A missing or empty file, or
+    one cut short in the header, is a pack without setups.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._map = None
+        self._header = None
+        self._stat = None
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._stat = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load(self):
+        """Map the file again if it changed, returns False if there's no pack: missing, empty or cut short in the header"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None and self._map is not None and self._stat == (stat.st_size, stat.st_mtime):
+            return True
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._header = None
+        self._stat = None
+        if stat is None:
+            return False
+
+        with open(self.path, "rb") as f:
+            # mmap can't map an empty file, and one cut short in the header (an interrupted first mirror run) has no setups
+            head = f.read(HEADER.size)
+            if _is_cut_short(head):
+                return False
+            header = _parse_header(head)
+            _, index_offset, index_count, car_offset, car_count, strings_offset, strings_length, meta_offset, meta_length = header
+            end = max(index_offset + index_count * INDEX_ENTRY.size, car_offset + car_count * CAR_ENTRY.size,
+                      strings_offset + strings_length, meta_offset + meta_length)
+            if end > stat.st_size:
+                raise PackError(f"Setup pack is truncated ({stat.st_size} of at least {end} bytes)")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._header = header
+        self._stat = (stat.st_size, stat.st_mtime)
+        return True
+
+    def _find(self, setup_id):
+        """Binary search over the ID index, returns (offset, length) or None"""
+        _, index_offset, index_count = self._header[:3]
+        low, high = 0, index_count
+        while low < high:
+            middle = (low + high) // 2
+            entry_id, offset, length = INDEX_ENTRY.unpack_from(self._map, index_offset + middle * INDEX_ENTRY.size)
+            if entry_id < setup_id:
+                low = middle + 1
+            elif entry_id > setup_id:
+                high = middle
+            else:
+                return offset, length
+        return None
+
+    def _car_entry(self, position):
+        """Get (car, track, setup ID) of a car index entry, car and track as bytes"""
+        car_index_offset, strings_offset = self._header[3], self._header[5]
+        car_offset, car_length, track_offset, track_length, setup_id = CAR_ENTRY.unpack_from(
+            self._map, car_index_offset + position * CAR_ENTRY.size)
+        car = self._map[strings_offset + car_offset:strings_offset + car_offset + car_length]
+        track = self._map[strings_offset + track_offset:strings_offset + track_offset + track_length]
+        return car, track, setup_id
+
+    def __len__(self):
+        with self._lock:
+            return self._header[2] if self._load() else 0
+
+    def get(self, setup_id):
+        """Get the content of a setup, or None if the pack doesn't have it"""
+        if not str(setup_id).isdigit():
+            return None
+        with self._lock:
+            found = self._find(int(setup_id)) if self._load() else None
+            if found is None:
+                return None
+            offset, length = found
+            view = memoryview(self._map)
+            try:
+                return str(view[offset:offset + length], "utf-8")
+            finally:
+                view.release()
+
+    def __contains__(self, setup_id):
+        if not str(setup_id).isdigit():
+            return False
+        with self._lock:
+            return self._load() and self._find(int(setup_id)) is not None
+
+    def ids(self):
+        """Get all setup IDs in the pack, in ascending order"""
+        with self._lock:
+            if not self._load():
+                return []
+            index_offset, index_count = self._header[1:3]
+            return [str(INDEX_ENTRY.unpack_from(self._map, index_offset + i * INDEX_ENTRY.size)[0])
+                    for i in range(index_count)]
+
+    def find_by_car(self, car_id, track_id=None):
+        """Get the IDs of the setups for a car, optionally only those for a track (without layout)"""
+        car = car_id.encode("utf-8")
+        track = track_id.split("/")[0].encode("utf-8") if track_id else None
+        with self._lock:
+            if not self._load():
+                return []
+            target = (car, track) if track is not None else (car,)
+            low, high = 0, self._header[4]
+            while low < high:
+                middle = (low + high) // 2
+                if self._car_entry(middle)[:len(target)] < target:
+                    low = middle + 1
+                else:
+                    high = middle
+
+            setup_ids = []
+            for position in range(low, self._header[4]):
+                entry = self._car_entry(position)
+                if entry[:len(target)] != target:
+                    break
+                setup_ids.append(str(entry[2]))
+            return setup_ids
+
+
+class PackWriter:
+    """Appends setups to a pack, creating it if needed
+
+    Records are appended right away, commit() appends new indexes and a
+    metadata block and then points the header at them. A crash before the
+    header is rewritten leaves the previous commit intact, at the cost of some
+    unreferenced bytes at the end of the file, which compact() reclaims along
+    with replaced records and old indexes.
+
+    The metadata block holds a dict per setup ID (validators, car, track,
+    last check) and a free-form "state" dict, e.g. for resuming a mirror run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.meta = {}
+        self.state = {}
+        self._file = None
+        self._dirty = False
+        # Size of the committed indexes and metadata, which are live data too
+        self._tail_length = 0
+        self._open()
+
+    def _open(self):
+        head = b""
+        if os.path.isfile(self.path):
+            with open(self.path, "rb") as f:
+                head = f.read(HEADER.size)
+        # Only an empty file or a pack header cut short is (re)created, anything else must parse
+        if not head or (_is_cut_short(head) and PACK_MAGIC.startswith(head[:8])):
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(HEADER.pack(PACK_MAGIC, HEADER.size, 0, HEADER.size, 0, HEADER.size, 0, HEADER.size, 0))
+        self._file = open(self.path, "r+b")
+        header = _parse_header(self._file.read(HEADER.size))
+        version, index_offset, index_count, meta_offset, meta_length = header[0], header[1], header[2], header[7], header[8]
+
+        self._file.seek(index_offset)
+        index = self._file.read(index_count * INDEX_ENTRY.size)
+        for i in range(index_count):
+            entry_id, offset, length = INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size)
+            self.entries[entry_id] = (offset, length)
+
+        if meta_length:
+            self._file.seek(meta_offset)
+            data = json.loads(self._file.read(meta_length).decode("utf-8"))
+            self.meta = data.get("setups", {})
+            self.state = data.get("state", {})
+        self._tail_length = meta_offset + meta_length - index_offset
+
+        if version < 2:
+            self.compact()
+
+    def get_meta(self, setup_id):
+        """Get the metadata dict of a setup ID, empty if it isn't known"""
+        return self.meta.get(str(setup_id), {})
+
+    def set_meta(self, setup_id, **fields):
+        """Update the metadata of a setup ID, also for IDs without a record (e.g. missing ones)"""
+        self.meta.setdefault(str(setup_id), {}).update(fields)
+        self._dirty = True
+
+    def add(self, setup_id, content, **fields):
+        """Append a setup, replacing any earlier version of it, returns False if it was unchanged
+
+        Pass car and track to have the setup in the car index.
+        """
+        data = content.encode("utf-8")
+        import hashlib
+        content_hash = hashlib.sha256(data).hexdigest()
+        if int(setup_id) in self.entries and self.get_meta(setup_id).get("hash") == content_hash:
+            self.set_meta(setup_id, **fields)
+            return False
+
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(data)
+        self.entries[int(setup_id)] = (offset, len(data))
+        self.set_meta(setup_id, hash=content_hash, **fields)
+        return True
+
+    def set_state(self, **fields):
+        self.state.update(fields)
+        self._dirty = True
+
+    def _build_tail(self, base_offset, entries):
+        """Get (ID index, strings, car index, meta) blocks for entries, to be written at base_offset"""
+        index = b"".join(INDEX_ENTRY.pack(entry_id, *entries[entry_id]) for entry_id in sorted(entries))
+
+        # Tracks are stored without the layout, like in the setups folder
+        strings = bytearray()
+        string_offsets = {}
+        rows = []
+        for entry_id in entries:
+            meta = self.get_meta(entry_id)
+            if not meta.get("car"):
+                continue
+            car = meta["car"].encode("utf-8")
+            track = (meta.get("track") or "").split("/")[0].encode("utf-8")
+            rows.append((car, track, entry_id))
+            for value in (car, track):
+                if value not in string_offsets:
+                    string_offsets[value] = len(strings)
+                    strings += value
+        rows.sort()
+        car_index = b"".join(CAR_ENTRY.pack(string_offsets[car], len(car), string_offsets[track], len(track), entry_id)
+                             for car, track, entry_id in rows)
+
+        meta = json.dumps({"setups": self.meta, "state": self.state}, separators=(",", ":")).encode("utf-8")
+        strings_offset = base_offset + len(index)
+        car_index_offset = strings_offset + len(strings)
+        meta_offset = car_index_offset + len(car_index)
+        header = HEADER.pack(PACK_MAGIC, base_offset, len(entries), car_index_offset, len(rows),
+                             strings_offset, len(strings), meta_offset, len(meta))
+        return header, index + bytes(strings) + car_index + meta
+
+    def commit(self):
+        """Make everything added so far visible to readers"""
+        if not self._dirty:
+            return
+        self._file.seek(0, os.SEEK_END)
+        header, tail = self._build_tail(self._file.tell(), self.entries)
+        self._file.write(tail)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._tail_length = len(tail)
+
+        # Only now switch readers over to the new indexes
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._dirty = False
+
+    def garbage_ratio(self):
+        """Get the share of the file not used by current records, indexes or metadata"""
+        size = os.fstat(self._file.fileno()).st_size
+        live = HEADER.size + self._tail_length + sum(length for _, length in self.entries.values())
+        return max(0.0, 1 - live / size) if size > HEADER.size else 0.0
+
+    def compact(self):
+        """Rewrite the pack with only the current records, ordered by ID, and swap it in"""
+        temp_path = self.path + ".compact"
+        entries = {}
+        with open(temp_path, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            for entry_id in sorted(self.entries):
+                offset, length = self.entries[entry_id]
+                self._file.seek(offset)
+                entries[entry_id] = (f.tell(), length)
+                f.write(self._file.read(length))
+            header, tail = self._build_tail(f.tell(), entries)
+            f.write(tail)
+            f.seek(0)
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._file.close()
+        try:
+            os.replace(temp_path, self.path)
+        except OSError:
+            # Usually a reader holding the pack open on Windows, keep using the old file
+            os.remove(temp_path)
+            self._file = open(self.path, "r+b")
+            raise
+        self._file = open(self.path, "r+b")
+        self.entries = entries
+        self._tail_length = len(tail)
+        self._dirty = False
+
+    def close(self):
+        if self._file is not None:
+            self.commit()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,146 @@
+import io
+import re
+import codecs
+
+META_PREFIX = ";CM_META:"
+CHUNK_SIZE = 16 * 1024
+
+# How much of a download is looked at to tell a setup from an HTML page or a binary file
+SNIFF_BYTES = 512
+CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class SetupFile:
+    """Parsed setup file: original content, CM_META metadata and INI sections"""
+
+    __slots__ = ("setup_id", "content", "meta", "sections")
+
+    def __init__(self, setup_id=None, content="", meta=None, sections=None):
+        self.setup_id = setup_id
+        self.content = content
+        self.meta = meta if meta is not None else {}
+        self.sections = sections if sections is not None else {}
+
+    @property
+    def car_id(self):
+        """Car ID from the metadata, or from [CAR] MODEL= in the setup itself"""
+        car_id = self.meta.get("car") or self.get("CAR", "MODEL")
+        return car_id.strip() if car_id else None
+
+    @property
+    def track_id(self):
+        """Track ID from the metadata, if the setup has one"""
+        return self.meta.get("track")
+
+    @property
+    def size(self):
+        return len(self.content)
+
+    def get(self, section, key="VALUE", default=None):
+        """Get a raw string value"""
+        return self.sections.get(section, {}).get(key, default)
+
+    def get_float(self, section, key="VALUE", default=None):
+        """Get a numeric value, or default if it's missing or not a number"""
+        try:
+            return float(self.get(section, key))
+        except (TypeError, ValueError):
+            return default
+
+    def get_int(self, section, key="VALUE", default=None):
+        """Get an integer value, or default if it's missing or not a number"""
+        value = self.get_float(section, key)
+        return int(value) if value is not None else default
+
+
+class SetupParser:
+    """Incremental setup parser: feed it text as it arrives, then call close()"""
+
+    def __init__(self, setup_id=None):
+        self.setup = SetupFile(setup_id)
+        self._content = io.StringIO()
+        self._pending = ""
+        self._section = None
+        self._started = False
+
+    def feed(self, text):
+        self._content.write(text)
+        if not self._started and text:
+            # Notepad saves with a BOM, it would hide the first section
+            self._started = True
+            text = text.lstrip("\ufeff")
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def close(self):
+        if self._pending:
+            self._parse_line(self._pending)
+            self._pending = ""
+        self.setup.content = self._content.getvalue()
+        self._content.close()
+        return self.setup
+
+    def _parse_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+
+        if line.startswith(META_PREFIX):
+            key_value = line[len(META_PREFIX):].split(":", 1)
+            if len(key_value) == 2:
+                self.setup.meta[key_value[0]] = key_value[1]
+            return
+
+        if line[0] in ";#":
+            return
+
+        if line[0] == "[":
+            end = line.find("]")
+            if end == -1:
+                return
+            self._section = line[1:end].strip()
+            self.setup.sections.setdefault(self._section, {})
+            # Some exports keep the first value on the section line: "[CAR] MODEL=..."
+            line = line[end + 1:].strip()
+            if not line:
+                return
+
+        if self._section is not None and "=" in line:
+            key, value = line.split("=", 1)
+            self.setup.sections[self._section][key.strip()] = value.split(";", 1)[0].strip()
+
+
+def looks_like_setup(data):
+    """Check if the start of a file can be a setup INI, an empty start can't be told yet and passes"""
+    if isinstance(data, bytes):
+        data = data[:SNIFF_BYTES].decode("utf-8", errors="replace")
+    head = data[:SNIFF_BYTES].lstrip("\ufeff \t\r\n")
+    if not head:
+        return True
+    # HTML error pages and captive portals start with a tag, binary files have control characters
+    if head.startswith("<") or CONTROL_CHARACTERS.search(head):
+        return False
+    first_line = head.splitlines()[0].strip()
+    return first_line.startswith(("[", ";", "#")) or "=" in first_line
+
+
+def parse_setup_chunks(chunks, setup_id=None, encoding="utf-8"):
+    """Parse a setup from an iterable of byte or text chunks in a single pass"""
+    parser = SetupParser(setup_id)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            parser.feed(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        parser.feed(tail)
+    return parser.close()
+
+
+def parse_setup_text(text, setup_id=None):
+    """Parse a setup that's already in memory"""
+    return parse_setup_chunks((text,), setup_id)
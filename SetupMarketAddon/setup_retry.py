@@ -0,0 +1,175 @@
+import time
+import random
+import threading
+from urllib.parse import urlparse
+from setup_trace import NULL_TRACER
+
+# Default retry limits: attempts per request and the backoff between them (seconds)
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 8.0
+
+# Default circuit breaker: failures in a row that open it, and how long it stays open (seconds)
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_OPEN_SECONDS = 30
+
+# How long a 404 is remembered (seconds)
+DEFAULT_NOT_FOUND_TTL = 600
+
+
+class CircuitOpen(Exception):
+    """A host failed too often recently, requests to it are skipped for now"""
+    pass
+
+
+class NegativeCache:
+    """Setup IDs the server recently answered with 404, forgotten after ttl seconds"""
+
+    def __init__(self, ttl=DEFAULT_NOT_FOUND_TTL, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def add(self, setup_id):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._expires) >= self.max_entries:
+                # Drop expired entries, and the oldest ones if that isn't enough
+                self._expires = {key: expires for key, expires in self._expires.items() if expires > now}
+                while len(self._expires) >= self.max_entries:
+                    del self._expires[min(self._expires, key=self._expires.get)]
+            self._expires[str(setup_id)] = now + self.ttl
+
+    def __contains__(self, setup_id):
+        with self._lock:
+            expires = self._expires.get(str(setup_id))
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._expires[str(setup_id)]
+                return False
+            return True
+
+
+class CircuitBreaker:
+    """Per-host circuit breaker
+
+    After failure_threshold failed requests in a row a host is skipped for
+    open_seconds. After that a single request is let through: if it succeeds
+    the host is back to normal, if it fails it's skipped for another round.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, open_seconds=DEFAULT_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host):
+        return self._hosts.setdefault(host, {'failures': 0, 'open_until': 0.0, 'probing': False})
+
+    def is_open(self, host):
+        """Check if requests to a host are currently skipped"""
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state['open_until'] > time.monotonic()
+
+    def allow(self, host):
+        """Check if a request to a host may go out, claiming the probe when the open period is over"""
+        with self._lock:
+            state = self._state(host)
+            if state['failures'] < self.failure_threshold:
+                return True
+            if state['open_until'] > time.monotonic() or state['probing']:
+                return False
+            state['probing'] = True
+            return True
+
+    def record_success(self, host):
+        with self._lock:
+            self._hosts[host] = {'failures': 0, 'open_until': 0.0, 'probing': False}
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._state(host)
+            state['failures'] += 1
+            state['probing'] = False
+            if state['failures'] >= self.failure_threshold:
+                state['open_until'] = time.monotonic() + self.open_seconds
+
+
+def is_retryable_status(status_code):
+    """Server errors, timeouts and rate limiting are worth another try, other statuses are final"""
+    return status_code >= 500 or status_code in (408, 429)
+
+
+class RetryPolicy:
+    """Retries of server errors and network failures with jittered exponential backoff
+
+    Wraps an HTTP get function (like requests.Session.get). A request is
+    retried up to attempts - 1 times, waiting a random time up to
+    base_delay * 2 ** attempt (at most max_delay, or the server's Retry-After)
+    in between, and every outcome feeds the per-host circuit breaker. Only
+    getting the response is retried, not reading its body.
+    """
+
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 breaker=None, retry_exceptions=(OSError,), sleep=time.sleep):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        # requests' exceptions are OSErrors, this covers timeouts and connection errors
+        self.retry_exceptions = retry_exceptions
+        self.sleep = sleep
+
+    def get_delay(self, attempt, response=None):
+        """Backoff before retry number attempt + 1, full jitter"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(self.max_delay, float(retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def attempt(self, http_get, url, **kwargs):
+        """Make a single request through http_get, feeding the outcome to the circuit breaker
+
+        Raises CircuitOpen if the host is being skipped, and the error of
+        http_get if the request failed.
+        """
+        host = urlparse(url).netloc
+        if not self.breaker.allow(host):
+            raise CircuitOpen(f"{host} failed repeatedly, not trying again for now")
+        try:
+            response = http_get(url, **kwargs)
+        except self.retry_exceptions:
+            self.breaker.record_failure(host)
+            raise
+        if is_retryable_status(response.status_code):
+            self.breaker.record_failure(host)
+        else:
+            self.breaker.record_success(host)
+        return response
+
+    def wait(self, attempt, response=None, tracer=NULL_TRACER):
+        """Sleep the backoff before retry number attempt + 1"""
+        with tracer.span("retry_wait", attempt=attempt + 1) as span:
+            delay = self.get_delay(attempt, response)
+            span.add(delay_ms=round(delay * 1000, 1))
+            self.sleep(delay)
+
+    def get(self, http_get, url, tracer=NULL_TRACER, **kwargs):
+        """Get a URL through http_get, raises CircuitOpen if the host is being skipped"""
+        for attempt in range(self.attempts):
+            last_attempt = attempt == self.attempts - 1
+            try:
+                response = self.attempt(http_get, url, **kwargs)
+            except self.retry_exceptions:
+                if last_attempt:
+                    raise
+                response = None
+            else:
+                if not is_retryable_status(response.status_code) or last_attempt:
+                    return response
+                response.close()
+            self.wait(attempt, response, tracer)
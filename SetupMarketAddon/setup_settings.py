@@ -0,0 +1,152 @@
+import os
+import threading
+import configparser
+from collections import namedtuple
+
+from setup_installer import DEFAULT_NAME_TEMPLATE, check_name_template
+
+# How often the settings files are checked for changes (seconds of game time)
+DEFAULT_CHECK_INTERVAL = 2.0
+
+# One setting: attribute name, INI section and key, type, default, allowed range or values
+Setting = namedtuple("Setting", ["name", "section", "key", "type", "default", "minimum", "maximum", "choices"])
+Setting.__new__.__defaults__ = (None, None, None)
+
+
+def parse_bool(text):
+    value = text.strip().lower()
+    if value in ("true", "1", "yes", "on"):
+        return True
+    if value in ("false", "0", "no", "off"):
+        return False
+    raise ValueError(f"not a boolean: {text}")
+
+
+def parse_list(text):
+    """Comma-separated values, without empty ones"""
+    return [value.strip() for value in text.split(",") if value.strip()]
+
+
+# Everything in settings_defaults.ini, with the ranges documented there
+SETTINGS = [
+    Setting("background_opacity", "INTERFACE", "backgroundopacity", float, 0.5, 0.0, 1.0),
+    Setting("background_width", "INTERFACE", "backgroundwidth", int, 500, 200, 1000),
+    Setting("auto_register_protocol", "GENERAL", "auto_register_protocol", parse_bool, True),
+    Setting("launcher", "GENERAL", "launcher", str, "auto",
+            choices=("auto", "shell", "xdg-open", "content_manager", "record")),
+    Setting("cache_max_size_mb", "CACHE", "max_size_mb", int, 64, 1, 1024),
+    Setting("cache_fresh_seconds", "CACHE", "fresh_seconds", int, 300, 0, 86400),
+    Setting("pack", "CACHE", "pack", str, ""),
+    Setting("prefetch", "CACHE", "prefetch", parse_bool, True),
+    Setting("prefetch_count", "CACHE", "prefetch_count", int, 5, 1, 50),
+    Setting("log_level", "LOG", "level", str, "info", choices=("debug", "info", "warning", "error")),
+    Setting("trace", "LOG", "trace", parse_bool, False),
+    Setting("install_mode", "INSTALL", "mode", str, "content_manager", choices=("content_manager", "direct")),
+    Setting("name_template", "INSTALL", "name_template", check_name_template, DEFAULT_NAME_TEMPLATE),
+    Setting("skip_installed", "INSTALL", "skip_installed", parse_bool, True),
+    Setting("connect_timeout", "NETWORK", "connect_timeout", float, 5.0, 0.1, 120.0),
+    Setting("read_timeout", "NETWORK", "read_timeout", float, 10.0, 0.1, 300.0),
+    Setting("transfer_seconds", "NETWORK", "transfer_seconds", float, 30.0, 0.0, 3600.0),
+    Setting("max_setup_kb", "NETWORK", "max_setup_kb", int, 1024, 1, 65536),
+    Setting("retries", "NETWORK", "retries", int, 2, 0, 10),
+    Setting("not_found_ttl", "NETWORK", "not_found_ttl", float, 600.0, 0.0, 86400.0),
+    Setting("endpoints", "NETWORK", "endpoints", parse_list, []),
+    Setting("hedge", "NETWORK", "hedge", parse_bool, False),
+    Setting("transport", "NETWORK", "transport", str, "auto", choices=("auto", "stdlib", "requests")),
+    Setting("companion_enabled", "COMPANION", "enabled", parse_bool, False),
+    Setting("companion_port", "COMPANION", "port", int, 47597, 1024, 65535),
+    Setting("catalogue_sync", "CATALOGUE", "sync", parse_bool, True),
+    Setting("catalogue_sync_minutes", "CATALOGUE", "sync_minutes", int, 60, 0, 10080),
+]
+
+
+class AppSettings:
+    """Typed settings of the in-game app, parsed once and reloaded when the files change
+
+    Values are read from the defaults and then from settings.ini, without the
+    "; Label; description" CM keeps after them, and are available as
+    attributes (settings.background_width). Values that don't parse fall back
+    to the default and values out of range are clamped, both are listed in
+    problems. Nothing is ever written to disk. poll() is cheap enough for
+    acUpdate(): it only stats the files every check_interval seconds.
+    """
+
+    def __init__(self, defaults_path, path, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.defaults_path = defaults_path
+        self.path = path
+        self.check_interval = check_interval
+        self.problems = []
+        self._values = {}
+        self._mtimes = None
+        self._elapsed = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["_values"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def _get_mtimes(self):
+        mtimes = []
+        for path in (self.defaults_path, self.path):
+            try:
+                mtimes.append(os.stat(path).st_mtime)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _parse(self, config, setting, problems):
+        text = config.get(setting.section, setting.key, fallback=None)
+        if text is None:
+            return setting.default
+        text = text.split(";")[0].strip()
+        try:
+            value = setting.type(text)
+        except ValueError:
+            problems.append(f"[{setting.section}] {setting.key}: invalid value {text!r}, using {setting.default!r}")
+            return setting.default
+
+        if setting.choices is not None and value not in setting.choices:
+            problems.append(f"[{setting.section}] {setting.key}: {value!r} is not one of {', '.join(setting.choices)}, "
+                            f"using {setting.default!r}")
+            return setting.default
+        if setting.minimum is not None and value < setting.minimum:
+            problems.append(f"[{setting.section}] {setting.key}: {value} is below {setting.minimum}, using {setting.minimum}")
+            return setting.minimum
+        if setting.maximum is not None and value > setting.maximum:
+            problems.append(f"[{setting.section}] {setting.key}: {value} is above {setting.maximum}, using {setting.maximum}")
+            return setting.maximum
+        return value
+
+    def load(self):
+        """Read the settings files, returns the names of the settings that changed"""
+        with self._lock:
+            mtimes = self._get_mtimes()
+            config = configparser.ConfigParser()
+            # A missing settings.ini just means the defaults apply
+            config.read([self.defaults_path, self.path], encoding="utf-8")
+
+            problems = []
+            values = {setting.name: self._parse(config, setting, problems) for setting in SETTINGS}
+            changed = [name for name, value in values.items() if self._values.get(name) != value]
+
+            # Swapped in whole, so other threads never see half of a reload
+            self._values = values
+            self.problems = problems
+            self._mtimes = mtimes
+            return changed
+
+    def poll(self, delta_t):
+        """Reload if a settings file changed, checked at most every check_interval seconds
+
+        Returns the names of the settings that changed, an empty list otherwise.
+        """
+        self._elapsed += delta_t
+        if self._elapsed < self.check_interval:
+            return []
+        self._elapsed = 0.0
+        if self._get_mtimes() == self._mtimes:
+            return []
+        return self.load()
@@ -0,0 +1,146 @@
+import time
+import functools
+import threading
+
+
+class _NullSpan:
+    """Span handed out while tracing is off, does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add(self, **fields):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Trace:
+    __slots__ = ("name", "started", "spans", "depth")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+
+
+class Span:
+    """Timed phase of a trace, extra fields like byte counts can be added while it runs"""
+
+    __slots__ = ("trace", "name", "fields", "started", "depth")
+
+    def __init__(self, trace, name, fields):
+        self.trace = trace
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        ended = time.perf_counter()
+        self.trace.depth -= 1
+        record = {
+            'span': self.name,
+            'depth': self.depth,
+            'start_ms': round((self.started - self.trace.started) * 1000, 3),
+            'duration_ms': round((ended - self.started) * 1000, 3)
+        }
+        record.update(self.fields)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.trace.spans.append(record)
+        return False
+
+    def add(self, **fields):
+        self.fields.update(fields)
+
+
+class Tracer:
+    """Opt-in timing spans around the phases of handling a link
+
+    A trace covers one call of a function wrapped with traced(), spans opened
+    on the same thread while it runs are collected into it and the whole trace
+    is passed to emit as one record when the call returns. While disabled,
+    traced functions are called directly and span() returns a shared no-op span.
+    """
+
+    def __init__(self, emit=None, enabled=False):
+        self.emit = emit
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._session = {}
+
+    def span(self, name, **fields):
+        """Get a context manager timing a phase of the current trace"""
+        if not self.enabled:
+            return NULL_SPAN
+        trace = getattr(self._local, "trace", None)
+        if trace is None:
+            return NULL_SPAN
+        return Span(trace, name, fields)
+
+    def traced(self, name):
+        """Decorator starting a trace for each outermost call of a function"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or getattr(self._local, "trace", None) is not None:
+                    return func(*args, **kwargs)
+                trace = _Trace(name)
+                self._local.trace = trace
+                result = None
+                try:
+                    result = func(*args, **kwargs)
+                    return result
+                finally:
+                    self._local.trace = None
+                    self._finish(trace, result)
+            return wrapper
+        return decorator
+
+    def _finish(self, trace, result):
+        total_ms = round((time.perf_counter() - trace.started) * 1000, 3)
+        record = {'trace': trace.name, 'total_ms': total_ms, 'ok': bool(result), 'spans': trace.spans}
+
+        with self._lock:
+            stats = self._session.setdefault(trace.name, {'count': 0, 'total_ms': 0.0})
+            stats['count'] += 1
+            stats['total_ms'] += total_ms
+            stats['last'] = record
+
+        if self.emit:
+            self.emit(record)
+
+    def summary(self, name):
+        """Get a one-line summary of this session's traces of a name, or None"""
+        with self._lock:
+            stats = self._session.get(name)
+            if not stats:
+                return None
+            count, average, last = stats['count'], stats['total_ms'] / stats['count'], stats['last']
+
+        # Top-level phases only, nested spans are in the log
+        phases = [f"{s['span']} {s['duration_ms']:.0f}" for s in last['spans'] if s['depth'] == 0]
+        received = sum(s.get('bytes', 0) for s in last['spans'] if s['span'] == "transfer")
+        text = f"{count}x, last {last['total_ms']:.0f} ms"
+        if phases:
+            text += f" ({', '.join(phases)})"
+        if received:
+            text += f", {received / 1024:.1f} KB"
+        return f"{text}, avg {average:.0f} ms"
+
+
+# Disabled tracer for code paths that are called without one
+NULL_TRACER = Tracer()
@@ -1,95 +1,473 @@
 import sys
-import base64
 import json
-import re
 import os
+import time
+import hashlib
+import argparse
+import threading
+import concurrent.futures
 import requests
 
+# Share the setup parser with the addon
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "SetupMarketAddon"))
+from setup_cache import read_setup_response
+from cm_payload import encode_compact_command, encode_legacy_command
+from setup_installer import DEFAULT_NAME_TEMPLATE, check_name_template, get_default_setups_dir, install_setup
+from launcher import LAUNCHER_AUTO, get_launcher, launch
+from setup_pack import PackWriter, COMPACT_GARBAGE_RATIO
+from setup_catalogue import SetupCatalogue, CatalogueSyncFailed, DEFAULT_SEARCH_LIMIT, format_entry
+
+SETUP_FILES_PATH = "https://setupmarket.net/wp-content/uploads/setup-files/"
+CATALOGUE_URL = "https://setupmarket.net/wp-json/setupmarket/v1/catalogue"
+DEFAULT_CATALOGUE_DB = "catalogue.sqlite"
+
+# Batch mode defaults
+DEFAULT_WORKERS = 8
+REQUEST_TIMEOUT = (5, 30)
+
+# Mirror defaults: requests per second over all workers, and how often progress is committed to the pack
+DEFAULT_MIRROR_RATE = 10.0
+MIRROR_COMMIT_EVERY = 200
+
+def get_setup_url(setup_id):
+    """Get the download URL of a setup file"""
+    return f"{SETUP_FILES_PATH}setup_{setup_id}.ini"
+
 def download_setup(setup_id):
     """Download a setup file from Setup Market"""
-    setup_url = f"https://setupmarket.net/wp-content/uploads/setup-files/setup_{setup_id}.ini"
+    setup_url = get_setup_url(setup_id)
     print(f"Downloading setup from: {setup_url}")
-    
+
     try:
-        response = requests.get(setup_url)
-        if response.status_code != 200:
-            print(f"Failed to download setup file. Status code: {response.status_code}")
-            return None
-            
-        setup_content = response.text
-        
+        with requests.get(setup_url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Failed to download setup file. Status code: {response.status_code}")
+                return None
+
+            setup = read_setup_response(response, setup_id)
+
         # Extract car ID from the ini file
-        car_id = None
-        car_match = re.search(r'\[CAR\]\s+MODEL=(.+)', setup_content)
-        if car_match:
-            car_id = car_match.group(1).strip()
-        
+        car_id = setup.car_id
+
         if not car_id:
             print("Could not determine car ID from setup file")
             return None
-            
+
         print(f"Found car ID: {car_id}")
-        
+
         return {
-            'content': setup_content,
+            'content': setup.content,
             'car_id': car_id,
+            'track_id': setup.track_id,
             'setup_id': setup_id
         }
     except Exception as e:
         print(f"Error downloading setup: {e}")
         return None
 
-def create_cm_url(setup_data):
+def create_cm_url(setup_data, compact=True):
     """Create a CM URL from setup data"""
     try:
-        # Encode the setup content to base64
-        setup_content_b64 = base64.b64encode(setup_data['content'].encode('utf-8')).decode('utf-8')
-
-        # Create the shared entry data
-        shared_data = {
-            'n': f"Setup for {setup_data['car_id']}",  # name
-            't': setup_data['car_id'],                 # target (car)
-            'a': "SetupMarket.net",                    # author
-            'i': f"setup_{setup_data['setup_id']}.ini", # id
-            'e': 1,                                    # entry type (1 = CarSetup)
-            'd': setup_content_b64                     # data
-        }
-
-        # Encode the shared data to JSON then to base64
-        shared_json = json.dumps(shared_data)
-        shared_b64 = base64.b64encode(shared_json.encode('utf-8')).decode('utf-8')
-
-        # Create the acmanager URL
-        cm_url = f"acmanager://shared?id={shared_b64}"
+        if compact:
+            cm_url, _ = encode_compact_command(setup_data)
+        else:
+            cm_url, _ = encode_legacy_command(setup_data)
         return cm_url
     except Exception as e:
         print(f"Error creating CM URL: {e}")
         return None
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python generate_cm_url.py <setup_id>")
-        return
-        
-    setup_id = sys.argv[1]
+def create_session(workers):
+    """Create a requests session with a connection pool sized for the workers"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def generate_batch_entry(session, setup_id, compact=True, install_dir=None, name_template=DEFAULT_NAME_TEMPLATE,
+                         launcher=None):
+    """Download a single setup and build its batch result record, never raising
+
+    With install_dir set, the setup is written straight into that setups
+    directory instead of being turned into a Content Manager URL. With a
+    launcher, every generated URL is also handed to it.
+    """
+    entry = {'id': setup_id}
+    try:
+        with session.get(get_setup_url(setup_id), timeout=REQUEST_TIMEOUT, stream=True) as response:
+            if response.status_code != 200:
+                entry.update(status='http_error', http_status=response.status_code)
+                return entry
+
+            setup = read_setup_response(response, setup_id)
+
+        car_id = setup.car_id
+        if not car_id:
+            entry.update(status='no_car_id')
+            return entry
+
+        if install_dir:
+            path = install_setup(install_dir, setup, setup_id, name_template)
+            entry.update(status='ok', car_id=car_id, path=path)
+            return entry
+
+        cm_url = create_cm_url({'content': setup.content, 'car_id': car_id, 'track_id': setup.track_id,
+                                'setup_id': setup_id}, compact)
+        if not cm_url:
+            entry.update(status='encode_error')
+            return entry
+
+        entry.update(status='ok', car_id=car_id, url=cm_url)
+        if launcher:
+            result = launch(launcher, cm_url)
+            entry.update(launched=result.ok, launch_ms=round(result.seconds * 1000, 3))
+            if not result.ok:
+                entry.update(status='launch_error', error=result.error)
+    except Exception as e:
+        entry.update(status='error', error=str(e))
+    return entry
+
+def read_setup_ids(args_ids, file_path):
+    """Collect setup IDs from arguments and an optional file ("-" for stdin)"""
+    tokens = list(args_ids)
+    if file_path:
+        source = sys.stdin if file_path == "-" else open(file_path, "r", encoding="utf-8")
+        try:
+            for line in source:
+                # Allow comments and comma or whitespace separated IDs
+                tokens.extend(line.split('#', 1)[0].replace(',', ' ').split())
+        finally:
+            if source is not sys.stdin:
+                source.close()
+    return tokens
+
+def run_batch(setup_ids, workers, compact=True, install_dir=None, name_template=DEFAULT_NAME_TEMPLATE, output=sys.stdout,
+              launcher=None):
+    """Fetch setups concurrently and stream one JSON line per ID as results arrive"""
+    session = create_session(workers)
+    output_lock = threading.Lock()
+    failed = 0
+
+    def emit(entry):
+        with output_lock:
+            output.write(json.dumps(entry) + "\n")
+            output.flush()
+
+    # Keep the number of queued futures bounded so huge ID lists don't pile up in memory
+    pending = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for setup_id in setup_ids:
+            if not setup_id.isdigit():
+                emit({'id': setup_id, 'status': 'invalid_id'})
+                failed += 1
+                continue
+            pending.add(executor.submit(generate_batch_entry, session, setup_id, compact, install_dir, name_template,
+                                         launcher))
+            if len(pending) >= workers * 2:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    entry = future.result()
+                    failed += entry['status'] != 'ok'
+                    emit(entry)
+
+        for future in concurrent.futures.as_completed(pending):
+            entry = future.result()
+            failed += entry['status'] != 'ok'
+            emit(entry)
+
+    session.close()
+    return failed
+
+def run_single(setup_id, compact=True, launcher=None):
+    """Generate a URL for one setup and offer to open it"""
     print(f"Processing setup ID: {setup_id}")
-    
+
     setup_data = download_setup(setup_id)
     if setup_data:
-        cm_url = create_cm_url(setup_data)
+        cm_url = create_cm_url(setup_data, compact)
         if cm_url:
             print("\nGenerated Content Manager URL:")
             print(cm_url)
-            
+
             # Write to a file for easier copying
             with open("cm_url.txt", "w") as f:
                 f.write(cm_url)
             print("\nURL also saved to cm_url.txt")
-            
+
             choice = input("\nDo you want to open this URL in Content Manager? (y/n): ")
             if choice.lower() == 'y':
-                os.startfile(cm_url)
-                print("URL opened in Content Manager")
+                result = launch(launcher or get_launcher(), cm_url)
+                if result.ok:
+                    print(f"URL opened in Content Manager ({result.backend}, {result.seconds * 1000:.1f} ms)")
+                else:
+                    print(f"Could not open the URL with {result.backend}: {result.error}")
+
+class RateLimiter:
+    """Spaces out wait() calls from any number of threads to at most rate per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def parse_id_range(text):
+    """Expand "1000-2000" into the list of IDs it covers, both ends included"""
+    start, _, end = text.partition("-")
+    if not start.isdigit() or not end.isdigit() or int(end) < int(start):
+        raise argparse.ArgumentTypeError(f"invalid ID range: {text}")
+    return [str(setup_id) for setup_id in range(int(start), int(end) + 1)]
+
+def fetch_for_mirror(session, limiter, setup_id, meta):
+    """Download a setup unless the pack's copy is still current, never raising"""
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    limiter.wait()
+    try:
+        with session.get(get_setup_url(setup_id), headers=headers, timeout=REQUEST_TIMEOUT, stream=True) as response:
+            if response.status_code != 200:
+                return {'id': setup_id, 'status': response.status_code}
+            setup = read_setup_response(response, setup_id)
+            return {'id': setup_id, 'status': 200, 'setup': setup,
+                    'etag': response.headers.get("ETag"), 'last_modified': response.headers.get("Last-Modified")}
+    except Exception as e:
+        return {'id': setup_id, 'status': 'error', 'error': str(e)}
+
+def apply_mirror_result(writer, result, counts):
+    """Store a fetch result in the pack and count it"""
+    setup_id = result['id']
+    now = time.time()
+    if result['status'] == 200:
+        setup = result['setup']
+        is_new = int(setup_id) not in writer.entries
+        changed = writer.add(setup_id, setup.content, etag=result['etag'], last_modified=result['last_modified'],
+                             car=setup.car_id, track=setup.track_id, checked=now, missing=False)
+        counts['added' if is_new else 'updated' if changed else 'unchanged'] += 1
+    elif result['status'] == 304:
+        writer.set_meta(setup_id, checked=now)
+        counts['unchanged'] += 1
+    elif result['status'] == 404:
+        writer.set_meta(setup_id, checked=now, missing=True)
+        counts['missing'] += 1
+    else:
+        # Not marked as checked, so a resumed run tries it again
+        counts['failed'] += 1
+        print(f"Failed to mirror setup {setup_id}: {result.get('error') or result['status']}", file=sys.stderr)
+
+def compact_pack(writer, force=False):
+    """Compact a pack when forced or when it's mostly replaced records and old indexes, returns True if it was"""
+    if not force and writer.garbage_ratio() < COMPACT_GARBAGE_RATIO:
+        return False
+    writer.commit()
+    try:
+        writer.compact()
+        return True
+    except OSError as e:
+        # On Windows the addon may have the pack open, compaction is retried on the next run
+        print(f"Could not compact {writer.path}: {e}", file=sys.stderr)
+        return False
+
+def run_mirror(pack_path, setup_ids, workers, rate, compact=False):
+    """Sync setups into a pack, resuming an interrupted run over the same IDs; returns the counts"""
+    writer = PackWriter(pack_path)
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'missing': 0, 'failed': 0, 'resumed_past': 0}
+
+    # An unfinished run over the same IDs continues where it stopped
+    run_key = hashlib.sha1(",".join(setup_ids).encode("utf-8")).hexdigest()
+    run = writer.state.get('mirror_run')
+    if run and run.get('key') == run_key and not run.get('done'):
+        todo = [setup_id for setup_id in setup_ids if writer.get_meta(setup_id).get('checked', 0) < run['started']]
+        counts['resumed_past'] = len(setup_ids) - len(todo)
+        run_started = run['started']
+    else:
+        todo = setup_ids
+        run_started = time.time()
+        writer.set_state(mirror_run={'key': run_key, 'started': run_started, 'done': False})
+
+    session = create_session(workers)
+    limiter = RateLimiter(rate)
+    processed = 0
+
+    def collect(futures):
+        nonlocal processed
+        for future in futures:
+            apply_mirror_result(writer, future.result(), counts)
+            processed += 1
+            if processed % MIRROR_COMMIT_EVERY == 0:
+                writer.commit()
+                print(f"Mirrored {processed}/{len(todo)} setups", file=sys.stderr)
+
+    try:
+        pending = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for setup_id in todo:
+                pending.add(executor.submit(fetch_for_mirror, session, limiter, setup_id, writer.get_meta(setup_id)))
+                if len(pending) >= workers * 2:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    collect(done)
+            collect(concurrent.futures.as_completed(pending))
+        writer.set_state(mirror_run={'key': run_key, 'started': run_started, 'done': counts['failed'] == 0})
+        counts['compacted'] = compact_pack(writer, compact)
+    finally:
+        # Whatever was fetched so far is kept, also when interrupted
+        writer.close()
+        session.close()
+    return counts
+
+def mirror_main(argv):
+    parser = argparse.ArgumentParser(prog="generate_cm_url.py mirror",
+                                     description="Sync setups into a local pack for offline use by the addon")
+    parser.add_argument("pack", help="pack file to create or update")
+    parser.add_argument("setup_ids", nargs="*", help="setup IDs to mirror")
+    parser.add_argument("--range", metavar="FIRST-LAST", type=parse_id_range, action="append", default=[],
+                        help="mirror a range of setup IDs, can be given more than once")
+    parser.add_argument("--file", metavar="PATH", help="read setup IDs from a file, or from stdin with \"-\"")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of concurrent downloads (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--rate", type=float, default=DEFAULT_MIRROR_RATE,
+                        help=f"maximum requests per second, 0 for no limit (default: {DEFAULT_MIRROR_RATE:g})")
+    parser.add_argument("--compact", action="store_true",
+                        help="rewrite the pack without replaced setups afterwards (done anyway once half of it is unused)")
+    args = parser.parse_args(argv)
+
+    setup_ids = [setup_id for setup_id in read_setup_ids(args.setup_ids, args.file) if setup_id.isdigit()]
+    for id_range in args.range:
+        setup_ids.extend(id_range)
+    setup_ids = list(dict.fromkeys(setup_ids))
+    if not setup_ids:
+        parser.error("no setup IDs given")
+
+    started = time.perf_counter()
+    counts = run_mirror(args.pack, setup_ids, max(1, args.workers), args.rate, args.compact)
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(counts))
+    if counts['failed']:
+        sys.exit(1)
+
+def catalogue_main(argv):
+    parser = argparse.ArgumentParser(prog="generate_cm_url.py catalogue",
+                                     description="Search a local copy of the setup catalogue, synced incrementally")
+    parser.add_argument("query", nargs="*",
+                        help='words to look for in car, track, author and tags, plus filters like track:spa '
+                             'author:"John Doe" car:ks_porsche_911_gt3_r tag:wet')
+    parser.add_argument("--db", default=DEFAULT_CATALOGUE_DB,
+                        help=f"catalogue database to search and sync (default: {DEFAULT_CATALOGUE_DB})")
+    parser.add_argument("--sync", action="store_true", help="fetch catalogue changes since the last sync first")
+    parser.add_argument("--url", default=CATALOGUE_URL, help="catalogue endpoint to sync from")
+    parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT,
+                        help=f"maximum number of results (default: {DEFAULT_SEARCH_LIMIT})")
+    parser.add_argument("--ids", action="store_true",
+                        help="only print setup IDs, e.g. to pipe into --batch or --install")
+    parser.add_argument("--json", action="store_true", help="print one JSON line per result")
+    args = parser.parse_args(argv)
+
+    catalogue = SetupCatalogue(args.db)
+    try:
+        if args.sync:
+            session = create_session(1)
+            try:
+                started = time.perf_counter()
+                updated, removed = catalogue.sync(session.get, args.url, timeout=REQUEST_TIMEOUT)
+                print(f"Synced catalogue: {updated} updated, {removed} removed, {catalogue.count()} setups "
+                      f"({time.perf_counter() - started:.2f}s)", file=sys.stderr)
+            except (CatalogueSyncFailed, requests.RequestException) as e:
+                print(f"Catalogue sync failed: {str(e)}", file=sys.stderr)
+                sys.exit(1)
+            finally:
+                session.close()
+            if not args.query:
+                return
+
+        started = time.perf_counter()
+        results = catalogue.search(" ".join(args.query), max(1, args.limit))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for entry in results:
+            if args.ids:
+                print(entry['setup_id'])
+            elif args.json:
+                print(json.dumps(entry))
+            else:
+                print(format_entry(entry))
+        print(f"{len(results)} setups ({elapsed_ms:.1f} ms)", file=sys.stderr)
+    finally:
+        catalogue.close()
+
+def main():
+    # "generate_cm_url.py mirror ..." syncs setups into a local pack
+    if len(sys.argv) > 1 and sys.argv[1] == "mirror":
+        mirror_main(sys.argv[2:])
+        return
+    
+    # "generate_cm_url.py catalogue ..." searches the local catalogue
+    if len(sys.argv) > 1 and sys.argv[1] == "catalogue":
+        catalogue_main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="Generate Content Manager URLs for Setup Market setups")
+    parser.add_argument("setup_ids", nargs="*", help="setup IDs to process")
+    parser.add_argument("--batch", action="store_true",
+                        help="never prompt, print one JSON line per setup to stdout")
+    parser.add_argument("--file", metavar="PATH",
+                        help="read setup IDs from a file, or from stdin with \"-\" (implies --batch)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of concurrent downloads in batch mode (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--legacy-payload", action="store_true",
+                        help="use the original double base64 ?id= payload instead of the compact ?z= one")
+    parser.add_argument("--install", action="store_true",
+                        help="write setups straight into the AC setups directory instead of generating URLs "
+                             "(implies --batch)")
+    parser.add_argument("--setups-dir", metavar="PATH",
+                        help="setups directory for --install (default: Documents/Assetto Corsa/setups)")
+    parser.add_argument("--name-template", default=DEFAULT_NAME_TEMPLATE,
+                        help=f"file name for installed setups, {{setup_id}}, {{car}} and {{track}} are replaced "
+                             f"(default: {DEFAULT_NAME_TEMPLATE})")
+    parser.add_argument("--launcher", choices=[LAUNCHER_AUTO, "shell", "xdg-open", "content_manager", "record"],
+                        help="how to open URLs in Content Manager; in batch mode, every generated URL is opened "
+                             "and its launch time reported (default: auto when asked in single mode)")
+    parser.add_argument("--cm-exe", metavar="PATH",
+                        help="Content Manager executable for --launcher content_manager")
+    args = parser.parse_args()
+    if args.setups_dir and not args.install:
+        parser.error("--setups-dir is only used with --install")
+    try:
+        check_name_template(args.name_template)
+    except ValueError as e:
+        parser.error(str(e))
+    install_dir = (args.setups_dir or get_default_setups_dir()) if args.install else None
+    compact = not args.legacy_payload
+    launcher = get_launcher(args.launcher, args.cm_exe) if args.launcher else None
+
+    batch = args.batch or args.file or args.install or len(args.setup_ids) > 1
+    if not batch:
+        if len(args.setup_ids) != 1:
+            print("Usage: python generate_cm_url.py <setup_id>")
+            print("       python generate_cm_url.py --batch [--file PATH|-] [--workers N] [setup_id ...]")
+            print("       python generate_cm_url.py mirror PACK [--range FIRST-LAST] [--rate N] [setup_id ...]")
+            print("       python generate_cm_url.py catalogue [--sync] [--ids] [words] [track:ID] [author:NAME] [car:ID] [tag:TAG]")
+            return
+        run_single(args.setup_ids[0], compact, launcher)
+        return
+
+    # With no IDs on the command line, batch mode reads them from stdin
+    file_path = args.file or (None if args.setup_ids else "-")
+    setup_ids = read_setup_ids(args.setup_ids, file_path)
+    failed = run_batch(setup_ids, max(1, args.workers), compact, install_dir, args.name_template, launcher=launcher)
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
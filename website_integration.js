@@ -3,6 +3,86 @@
  * This script helps create direct download links for Content Manager setups
  */
 
+// Local API of the addon (opt-in, [COMPANION] in its settings.ini), used instead of links when it's running
+const COMPANION_URL = 'http://127.0.0.1:47597';
+const COMPANION_TIMEOUT_MS = 500;
+
+// Setups per companion request and per bundle link, the addon skips the rest of a longer link
+const MAX_BUNDLE_SIZE = 50;
+
+// Set once the addon answered /ping, clicks then go to the API without the browser's protocol prompt
+let companionAvailable = false;
+let companionCheck = null;
+
+// Function to call the companion API, rejects if the addon isn't running or refuses
+function callCompanion(path, options) {
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), COMPANION_TIMEOUT_MS);
+    return fetch(COMPANION_URL + path, Object.assign({ signal: controller.signal, cache: 'no-store' }, options))
+        .then(function(response) {
+            if (!response.ok) throw new Error(`Companion API answered ${response.status}`);
+            return response.json();
+        })
+        .finally(() => clearTimeout(timer));
+}
+
+// Function to check once per page whether the addon's companion API is running
+function detectCompanion() {
+    if (!companionCheck) {
+        companionCheck = callCompanion('/ping', { method: 'GET' })
+            .then(function() { companionAvailable = true; return true; })
+            .catch(function() { return false; });
+    }
+    return companionCheck;
+}
+
+function postToCompanion(path, setupIds) {
+    return callCompanion(path, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ids: setupIds.map(String) })
+    });
+}
+
+// Function to split setup IDs into batches the companion API and bundle links accept
+function splitIntoBatches(setupIds) {
+    const batches = [];
+    for (let i = 0; i < setupIds.length; i += MAX_BUNDLE_SIZE) {
+        batches.push(setupIds.slice(i, i + MAX_BUNDLE_SIZE));
+    }
+    return batches;
+}
+
+// Function to open the protocol link of setups, a page can only follow one link
+function openInstallLink(setupIds) {
+    if (setupIds.length > MAX_BUNDLE_SIZE) {
+        console.warn(`A bundle link installs at most ${MAX_BUNDLE_SIZE} setups, the addon skips the other ${setupIds.length - MAX_BUNDLE_SIZE}`);
+    }
+    window.location.href = setupIds.length === 1 ? createDirectLink(setupIds[0]) : createBundleLink(setupIds);
+}
+
+// Function to install setups through the companion API, falling back to the protocol link
+function installSetups(setupIds) {
+    if (!companionAvailable) {
+        openInstallLink(setupIds);
+        return Promise.resolve(false);
+    }
+    // The API takes MAX_BUNDLE_SIZE setups per request, longer lists are sent in several
+    return Promise.all(splitIntoBatches(setupIds).map(batch => postToCompanion('/install', batch)))
+        .then(() => true)
+        .catch(function() {
+            openInstallLink(setupIds);
+            return false;
+        });
+}
+
+// Function to warm the addon's cache with setups the user is likely to install, does nothing without the API
+function prefetchSetups(setupIds) {
+    if (!companionAvailable || setupIds.length === 0) return Promise.resolve(false);
+    const batches = splitIntoBatches(setupIds).map(batch => postToCompanion('/prefetch', batch).catch(() => null));
+    return Promise.all(batches).then(() => true);
+}
+
 // Function to create a direct acmanager:// URL from a setup ID
 function createDirectLink(setupId) {
     // Since we can't process the setup file contents in JavaScript on the client-side
@@ -10,6 +90,16 @@ function createDirectLink(setupId) {
     return `setupmarket://setup/${setupId}`;
 }
 
+// Function to create a link installing several setups at once
+function createBundleLink(setupIds) {
+    return `setupmarket://bundle/${setupIds.join(',')}`;
+}
+
+// Function to create a link installing every setup published for a car
+function createCarLink(carId) {
+    return `setupmarket://car/${encodeURIComponent(carId)}`;
+}
+
 // Function to create a fallback link for users without the addon
 function createFallbackLink(setupId) {
     return `https://setupmarket.net/wp-content/uploads/setup-files/setup_${setupId}.ini`;
@@ -29,10 +119,20 @@ function createSetupButtons(setupId, containerSelector) {
         // Track that the user clicked the CM button
         if (typeof gtag !== 'undefined') {
             gtag('event', 'click_cm_button', {
-                'setup_id': setupId
+                'setup_id': setupId,
+                'companion': companionAvailable
             });
         }
+        
+        // With the addon's API running, install without the protocol prompt; otherwise the link does it
+        if (companionAvailable) {
+            e.preventDefault();
+            installSetups([setupId]);
+        }
     });
+    cmButton.addEventListener('mouseenter', function() {
+        prefetchSetups([setupId]);
+    }, { once: true });
     
     // Create the fallback button (direct download)
     const downloadButton = document.createElement('a');
@@ -54,10 +154,17 @@ document.addEventListener('DOMContentLoaded', function() {
     createSetupButtons('47596', '#setup-download-container');
     
     // For dynamic creation based on page content
+    const setupIds = [];
     document.querySelectorAll('[data-setup-id]').forEach(function(el) {
         const setupId = el.getAttribute('data-setup-id');
+        setupIds.push(setupId);
         createSetupButtons(setupId, `#setup-container-${setupId}`);
     });
+    
+    // If the addon's API is running, have it download the setups on this page before they're clicked
+    detectCompanion().then(function(available) {
+        if (available) prefetchSetups(setupIds);
+    });
 });
 
 /**
@@ -69,6 +176,10 @@ document.addEventListener('DOMContentLoaded', function() {
  * 
  * <div data-setup-id="47596" id="setup-container-47596"></div>
  * <div data-setup-id="12345" id="setup-container-12345"></div>
+ * 
+ * Installing several setups from your own button (companion API if running, bundle link otherwise):
+ * 
+ * installSetups(['47596', '12345']);
  */
 
 /**